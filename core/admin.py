@@ -1,5 +1,10 @@
 from django.contrib import admin
-from .models import Publication, Lesson
+from django.core.exceptions import ValidationError
+from django.forms import BaseModelFormSet
+from django.utils import timezone
+from .models import Publication, Lesson, LessonException, Task
+from .cache import bump_content_version
+from .schedule import SCHEDULE_FIELDS, IntervalIndex, recurrences_overlap, to_minutes
 
 # Register your models here.
 
@@ -18,16 +23,101 @@ class PublicationAdmin(admin.ModelAdmin):
         """
         Действие для публикации выбранных отзывов.
         """
-        queryset.update(is_published=True)
+        queryset.update(is_published=True, updated_at=timezone.now())
+        # update() не вызывает сигналы, поэтому сбрасываем кэш страниц вручную
+        bump_content_version()
+
+class LessonChangeListFormSet(BaseModelFormSet):
+    """
+    Формсет массового редактирования уроков с проверкой пересечений между изменяемыми уроками.
+    """
+
+    def changed_forms(self):
+        return [form for form in self.forms if form.instance.pk and form.has_changed()]
+
+    def full_clean(self):
+        if self.is_bound:
+            # старое время изменяемых уроков не должно давать ложных пересечений в Lesson.clean()
+            changed_pks = {form.instance.pk for form in self.changed_forms()}
+            for form in self.forms:
+                form.instance._schedule_exclude = changed_pks
+        super().full_clean()
+
+    def clean(self):
+        """
+        Проверяет, что измененные уроки не пересекаются между собой.
+        """
+        super().clean()
+        intervals = {}
+        for form in self.changed_forms():
+            if form.errors:
+                continue
+            lesson = form.instance
+            start = to_minutes(lesson.lesson_time)
+            item = {field: getattr(lesson, field) for field in SCHEDULE_FIELDS}
+            item['lesson'] = lesson
+            intervals.setdefault(lesson.weekday, []).append((start, start + lesson.lesson_duration, item))
+        for weekday_intervals in intervals.values():
+            index = IntervalIndex(weekday_intervals)
+            for start, end, item in weekday_intervals:
+                conflict = index.find_overlap(
+                    start, end, exclude={item['id']},
+                    accept=lambda other: recurrences_overlap(item, other),
+                )
+                if conflict is not None:
+                    raise ValidationError(
+                        f"Занятия {item['lesson'].students_name or 'без имени'} и "
+                        f"{conflict['lesson'].students_name or 'без имени'} пересекаются по времени"
+                    )
+
+
+class LessonExceptionInline(admin.TabularInline):
+    """
+    Отмены отдельных занятий на странице урока.
+    """
+    model = LessonException
+    extra = 0
+
 
 class LessonAdmin(admin.ModelAdmin):
     """
     Админка для модели урока.
     """
-    list_display = ('students_name', 'weekday', 'lesson_time', 'students_phone', 'lesson_duration')
+    list_display = (
+        'students_name', 'weekday', 'lesson_time', 'students_phone', 'lesson_duration',
+        'start_date', 'end_date', 'repeat_weeks',
+    )
+    inlines = [LessonExceptionInline]
+    list_editable = ('weekday', 'lesson_time', 'lesson_duration')
     search_fields = ('students_name', 'students_phone')
     list_filter = ('weekday',)
     ordering = ('weekday', 'lesson_time')
 
+    def get_changelist_formset(self, request, **kwargs):
+        """
+        Подключает формсет с проверкой пересечений для массового редактирования.
+        """
+        kwargs['formset'] = LessonChangeListFormSet
+        return super().get_changelist_formset(request, **kwargs)
+
+class TaskAdmin(admin.ModelAdmin):
+    """
+    Админка для очереди фоновых задач.
+    """
+    list_display = ('name', 'args', 'status', 'attempts', 'run_after', 'updated_at')
+    list_filter = ('status', 'name')
+    readonly_fields = ('locked_by', 'locked_at', 'last_error', 'created_at', 'updated_at')
+    ordering = ('-created_at',)
+    actions = ['retry']
+
+    @admin.action(description='Повторить')
+    def retry(self, request, queryset):
+        """
+        Действие для повторного запуска выбранных задач.
+        """
+        queryset.update(status=Task.STATUS_PENDING, attempts=0, run_after=timezone.now(),
+                        locked_by='', locked_at=None)
+
 admin.site.register(Publication, PublicationAdmin)
-admin.site.register(Lesson, LessonAdmin)
\ No newline at end of file
+admin.site.register(Lesson, LessonAdmin)
+admin.site.register(Task, TaskAdmin)
\ No newline at end of file
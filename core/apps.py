@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class CoreConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'core'
+
+    def ready(self):
+        # Подключаем обработчики сигналов моделей, настройку соединений с БД и учет метрик
+        from . import db, metrics, signals  # noqa: F401
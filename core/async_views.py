@@ -0,0 +1,169 @@
+"""
+Асинхронные варианты представлений для запуска под ASGI (krylovagn/asgi.py).
+
+Под ASGI синхронное представление выполняется в отдельном потоке, а длинная
+отдача файла занимает поток на все время скачивания. Здесь данные для страниц
+читаются через асинхронный ORM и асинхронный API кэша, а файлы отдаются
+асинхронным итератором, поэтому один процесс обслуживает много медленных
+скачиваний одновременно.
+
+Логика страниц не дублируется: асинхронное представление заранее получает
+пользователя, контент страницы и данные (контент страницы - в мемо запроса,
+см. core/cache.py), после чего синхронный get_context_data работает без
+обращений к БД. Шаблон Django рендерит в потоке после возврата ответа.
+Обработка POST (редактирование контента администратором) выполняется
+синхронным кодом в потоке.
+
+Маршруты переключаются на эти представления настройкой ASYNC_VIEWS
+(см. krylovagn/urls.py), asgi.py включает ее по умолчанию.
+"""
+from asgiref.sync import sync_to_async
+from django.http import Http404
+from django.shortcuts import aget_object_or_404
+
+from .cache import aget_page_content
+from .counters import ais_first_download, download_counter, get_visitor_id, set_visitor_cookie
+from .downloads import aresponse_size, aserve_file
+from .instrumentation import query_budget
+from .metrics import count_download
+from .models import Publication
+from .pagination import InvalidCursor, apaginate_by_cursor
+from .schedule import aget_month_schedule, aget_weekly_schedule
+from .views import (
+    ContactPageView,
+    LandingView,
+    LessonScheduleView,
+    PublicationFeedView,
+    PublicationListView,
+)
+
+
+async def prepare_request(request, template_name=None):
+    """
+    Заранее получает пользователя и контент страницы, чтобы контекст и шаблон
+    не обращались к БД из асинхронного кода.
+    """
+    request.user = await request.auser()
+    if template_name is not None:
+        await aget_page_content(template_name, request=request)
+
+
+class AsyncPageContentMixin:
+    """
+    Асинхронный GET для страниц с редактируемым контентом.
+    """
+
+    async def get(self, request, *args, **kwargs):
+        await prepare_request(request, self.template_name)
+        await self.prefetch()
+        context = self.get_context_data(**kwargs)
+        return self.render_to_response(context)
+
+    async def post(self, request, *args, **kwargs):
+        await prepare_request(request)
+        return await sync_to_async(super().post)(request, *args, **kwargs)
+
+    async def prefetch(self):
+        """
+        Получает данные страницы до построения контекста.
+        """
+
+
+class AsyncLandingView(AsyncPageContentMixin, LandingView):
+    """
+    Главная страница сайта (асинхронная).
+    """
+
+
+class AsyncContactPageView(AsyncPageContentMixin, ContactPageView):
+    """
+    Страница контактов (асинхронная).
+    """
+
+
+class AsyncLessonScheduleView(AsyncPageContentMixin, LessonScheduleView):
+    """
+    Расписание уроков (асинхронное).
+    """
+
+    async def prefetch(self):
+        month = self.get_month()
+        if month is None:
+            self.schedule = await aget_weekly_schedule()
+        else:
+            self.schedule = await aget_month_schedule(*month)
+
+
+class AsyncPublicationListView(PublicationListView):
+    """
+    Список публикаций (асинхронный).
+    """
+
+    def paginate_page_numbers(self, queryset, page_size):
+        """
+        Обычная постраничная разбивка (результаты поиска) с загрузкой записей страницы.
+        Выполняется в потоке.
+        """
+        paginator, page, object_list, is_paginated = super().paginate_queryset(queryset, page_size)
+        page.object_list = list(object_list)
+        return paginator, page, page.object_list, is_paginated
+
+    async def get(self, request, *args, **kwargs):
+        await prepare_request(request)
+        # поиск по полнотекстовому индексу выполняется сырым SQL, поэтому в потоке
+        self.object_list = await sync_to_async(self.get_queryset)()
+        page_size = self.get_paginate_by(self.object_list)
+        if self.is_cursor_mode():
+            try:
+                items, self.next_cursor = await apaginate_by_cursor(
+                    self.object_list, request.GET.get('cursor'), page_size
+                )
+            except InvalidCursor:
+                raise Http404('Неверный курсор страницы')
+            self.paginated = (None, None, items, self.next_cursor is not None)
+        else:
+            self.paginated = await sync_to_async(self.paginate_page_numbers)(self.object_list, page_size)
+        context = self.get_context_data()
+        return await self.render_async(context)
+
+    async def render_async(self, context):
+        """
+        Возвращает ответ; шаблон рендерится в потоке после возврата из представления.
+        """
+        return self.render_to_response(context)
+
+
+class AsyncPublicationFeedView(AsyncPublicationListView, PublicationFeedView):
+    """
+    Фрагмент ленты публикаций для подгрузки при прокрутке (асинхронный).
+    """
+
+    async def render_async(self, context):
+        # фрагмент рендерится сразу, а не после возврата ответа, поэтому в потоке
+        return await sync_to_async(self.render_to_response)(context)
+
+
+@query_budget(6)
+async def download_file(request, pk):
+    """
+    Отдает файл для скачивания асинхронным итератором и увеличивает счетчик загрузок,
+    предотвращая повторный подсчет для одного посетителя.
+    """
+    await prepare_request(request)
+    pub = await aget_object_or_404(Publication.objects.only('presentation_file'), pk=pk)
+    if not pub.presentation_file:
+        raise Http404('Файл не прикреплен')
+
+    response = await aserve_file(request, pub.presentation_file)
+    # Ответы 304/412/416 и запросы HEAD не передают файл и не считаются скачиванием
+    if request.method == 'HEAD' or response.status_code not in (200, 206):
+        return response
+    count_download(pub.pk, await aresponse_size(response, pub.presentation_file))
+
+    visitor_id, is_new_visitor = get_visitor_id(request)
+    if await ais_first_download(visitor_id, pub.pk):
+        # при накоплении пакета increment записывает счетчики в БД, поэтому в потоке
+        await sync_to_async(download_counter.increment)(pub.pk)
+    if is_new_visitor:
+        set_visitor_cookie(response, visitor_id)
+    return response
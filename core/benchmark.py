@@ -0,0 +1,357 @@
+"""
+Нагрузочное тестирование публичных страниц и скачивания файлов.
+
+Запросы выполняются в том же процессе через WSGI- или ASGI-приложение Django
+(без сети и HTTP-сервера) несколькими одновременными клиентами. Для каждого
+адреса измеряются задержка до получения всего тела ответа (p50/p95/p99),
+пропускная способность, количество запросов к БД на один HTTP-запрос и пиковая
+память процесса. Результаты можно сохранить как базовые и сравнивать с ними
+последующие запуски (команды seed_benchmark и benchmark).
+"""
+import asyncio
+import io
+import os
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.urls import reverse
+from django.utils.http import urlencode
+
+from .models import Publication
+
+try:
+    import resource
+except ImportError:  # модуль resource есть только в Unix
+    resource = None
+
+# Публичные адреса: имя -> (имя маршрута, параметры строки запроса)
+ENDPOINTS = {
+    'landing': ('landing', {}),
+    'publication_list': ('publication_list', {}),
+    'publication_list_category': ('publication_list', {'category': 3}),
+    'publication_search': ('publication_list', {'q': 'урок'}),
+    'publication_feed': ('publication_feed', {}),
+    'publication_content': ('publication_content', {}),
+    'publication_detail': ('publication_detail', {}),
+    'contacts': ('contacts', {}),
+    'schedule': ('lessons_schedule', {}),
+    'schedule_month': ('lessons_schedule_month', {}),
+    'schedule_feed_ics': ('schedule_feed_ics', {}),
+    'schedule_feed_json': ('schedule_feed_json', {}),
+    'download': ('download_file', {}),
+}
+
+# Показатели, по которым ищется ухудшение относительно базовых результатов
+LATENCY_METRICS = ('p50', 'p95', 'p99')
+# Изменения задержки меньше этого значения, мс, считаются шумом измерений
+LATENCY_NOISE_MS = 5
+
+
+def endpoint_path(name):
+    """
+    Возвращает путь и строку запроса для адреса из ENDPOINTS.
+    Для скачивания выбирается опубликованная публикация с файлом, созданным
+    seed_benchmark (или любая с файлом); без подходящих публикаций возвращается None.
+    """
+    url_name, params = ENDPOINTS[name]
+    kwargs = {}
+    if url_name == 'lessons_schedule_month':
+        today = date.today()
+        kwargs = {'year': today.year, 'month': today.month}
+    elif url_name in ('publication_content', 'publication_detail'):
+        pk = Publication.objects.filter(is_published=True).values_list('pk', flat=True).first()
+        if pk is None:
+            return None
+        kwargs = {'pk': pk}
+    elif url_name == 'download_file':
+        publications = (
+            Publication.objects.filter(is_published=True)
+            .exclude(presentation_file='').exclude(presentation_file__isnull=True)
+        )
+        pk = (
+            publications.filter(presentation_file__contains='benchmark').values_list('pk', flat=True).first()
+            or publications.values_list('pk', flat=True).first()
+        )
+        if pk is None:
+            return None
+        kwargs = {'pk': pk}
+    return reverse(url_name, kwargs=kwargs), urlencode(params)
+
+
+def get_host():
+    """
+    Возвращает значение заголовка Host, разрешенное ALLOWED_HOSTS.
+    """
+    for host in settings.ALLOWED_HOSTS:
+        if host != '*' and not host.startswith('.'):
+            return host
+    return 'localhost'
+
+
+class QueryCounter:
+    """
+    Считает запросы к БД во всех потоках, включая PRAGMA новых соединений.
+
+    Обертка выполнения запросов добавляется ко всем соединениям: уже открытым
+    в текущем потоке и создаваемым во время теста (сигнал connection_created).
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def __call__(self, execute, sql, params, many, context):
+        with self.lock:
+            self.count += 1
+        return execute(sql, params, many, context)
+
+    def install(self, connection):
+        if self not in connection.execute_wrappers:
+            connection.execute_wrappers.append(self)
+
+    def on_connection_created(self, sender, connection, **kwargs):
+        self.install(connection)
+
+    def __enter__(self):
+        for connection in connections.all(initialized_only=True):
+            self.install(connection)
+        connection_created.connect(self.on_connection_created, weak=False)
+        return self
+
+    def __exit__(self, *exc_info):
+        connection_created.disconnect(self.on_connection_created)
+        for connection in connections.all(initialized_only=True):
+            if self in connection.execute_wrappers:
+                connection.execute_wrappers.remove(self)
+
+    def reset(self):
+        with self.lock:
+            count, self.count = self.count, 0
+        return count
+
+
+def current_memory():
+    """
+    Возвращает память процесса в байтах: RSS без страниц отображенных в память файлов.
+    Файл SQLite отображается в память (PRAGMA mmap_size) отдельно каждым соединением,
+    и полный RSS учитывает одни и те же страницы файла по числу соединений.
+    Без /proc (не Linux) возвращает пиковый RSS из getrusage или None.
+    """
+    try:
+        with open('/proc/self/statm') as f:
+            resident, shared = f.read().split()[1:3]
+        return (int(resident) - int(shared)) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        pass
+    if resource is None:
+        return None
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # в macOS ru_maxrss в байтах, в Linux - в килобайтах
+    return maxrss if sys.platform == 'darwin' else maxrss * 1024
+
+
+class MemorySampler(threading.Thread):
+    """
+    Фоновый поток, запоминающий максимальную память процесса за время теста адреса.
+    """
+
+    def __init__(self, interval=0.01):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.peak = current_memory()
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            memory = current_memory()
+            if memory is not None and (self.peak is None or memory > self.peak):
+                self.peak = memory
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+        return self.peak
+
+
+def wsgi_environ(path, query, host):
+    return {
+        'REQUEST_METHOD': 'GET',
+        'PATH_INFO': path,
+        'QUERY_STRING': query,
+        'SCRIPT_NAME': '',
+        'SERVER_NAME': host,
+        'SERVER_PORT': '80',
+        'SERVER_PROTOCOL': 'HTTP/1.1',
+        'HTTP_HOST': host,
+        'REMOTE_ADDR': '127.0.0.1',
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': 'http',
+        'wsgi.input': io.BytesIO(),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False,
+    }
+
+
+def wsgi_request(application, path, query, host):
+    """
+    Выполняет запрос к WSGI-приложению и читает ответ целиком.
+    Возвращает (код ответа, размер тела, задержку в секундах).
+    """
+    status = []
+    start = time.perf_counter()
+    result = application(wsgi_environ(path, query, host), lambda s, headers, exc_info=None: status.append(s))
+    size = 0
+    try:
+        for chunk in result:
+            size += len(chunk)
+    finally:
+        if hasattr(result, 'close'):
+            result.close()
+    return int(status[0].split()[0]), size, time.perf_counter() - start
+
+
+async def asgi_request(application, path, query, host):
+    """
+    Выполняет запрос к ASGI-приложению и читает ответ целиком.
+    Возвращает (код ответа, размер тела, задержку в секундах).
+    """
+    scope = {
+        'type': 'http',
+        'asgi': {'version': '3.0'},
+        'http_version': '1.1',
+        'method': 'GET',
+        'scheme': 'http',
+        'path': path,
+        'raw_path': path.encode(),
+        'query_string': query.encode(),
+        'root_path': '',
+        'headers': [(b'host', host.encode())],
+        'client': ('127.0.0.1', 0),
+        'server': (host, 80),
+    }
+    request_sent = False
+
+    async def receive():
+        nonlocal request_sent
+        if not request_sent:
+            request_sent = True
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+        # клиент не отключается; Django отменяет ожидание после отправки ответа
+        await asyncio.Future()
+
+    response = {'status': 0, 'size': 0}
+
+    async def send(message):
+        if message['type'] == 'http.response.start':
+            response['status'] = message['status']
+        elif message['type'] == 'http.response.body':
+            response['size'] += len(message.get('body', b''))
+
+    start = time.perf_counter()
+    await application(scope, receive, send)
+    return response['status'], response['size'], time.perf_counter() - start
+
+
+def run_wsgi(application, path, query, host, requests, concurrency):
+    """
+    Выполняет запросы к WSGI-приложению из concurrency потоков.
+    """
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        return list(executor.map(lambda _: wsgi_request(application, path, query, host), range(requests)))
+
+
+def run_asgi(application, path, query, host, requests, concurrency):
+    """
+    Выполняет запросы к ASGI-приложению concurrency одновременными клиентами.
+    """
+    async def client(remaining, results):
+        while remaining:
+            remaining.pop()
+            results.append(await asgi_request(application, path, query, host))
+
+    async def main():
+        remaining = list(range(requests))
+        results = []
+        await asyncio.gather(*(client(remaining, results) for _ in range(concurrency)))
+        return results
+
+    return asyncio.run(main())
+
+
+def percentile(values, percent):
+    """
+    Перцентиль по методу ближайшего ранга.
+    """
+    ordered = sorted(values)
+    index = max(0, -(-len(ordered) * percent // 100) - 1)
+    return ordered[int(index)]
+
+
+def benchmark_endpoint(server, application, path, query, requests, concurrency, warmup, counter):
+    """
+    Нагружает один адрес и возвращает словарь с результатами.
+    Прогревочные запросы выполняются последовательно и в результаты не входят.
+    """
+    runner = run_wsgi if server == 'wsgi' else run_asgi
+    host = get_host()
+    if warmup:
+        runner(application, path, query, host, warmup, 1)
+
+    counter.reset()
+    sampler = MemorySampler()
+    sampler.start()
+    start = time.perf_counter()
+    results = runner(application, path, query, host, requests, concurrency)
+    elapsed = time.perf_counter() - start
+    peak_memory = sampler.stop()
+    queries = counter.reset()
+
+    latencies = [latency * 1000 for status, size, latency in results]
+    return {
+        'path': f'{path}?{query}' if query else path,
+        'requests': len(results),
+        'errors': sum(1 for status, size, latency in results if status >= 400),
+        'statuses': sorted({status for status, size, latency in results}),
+        'bytes': sum(size for status, size, latency in results),
+        'mean': statistics.fmean(latencies),
+        'p50': percentile(latencies, 50),
+        'p95': percentile(latencies, 95),
+        'p99': percentile(latencies, 99),
+        'rps': len(results) / elapsed,
+        'queries': queries / len(results),
+        'peak_memory_mb': peak_memory / 1024 / 1024 if peak_memory is not None else None,
+    }
+
+
+def find_regressions(results, baseline, threshold):
+    """
+    Сравнивает результаты с базовыми. Ухудшением считается рост задержки больше
+    чем на threshold процентов (и больше LATENCY_NOISE_MS) и любое увеличение
+    количества запросов к БД. Возвращает список строк с описанием ухудшений.
+    """
+    regressions = []
+    factor = 1 + threshold / 100
+    for name, current in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        for metric in LATENCY_METRICS:
+            if current[metric] > max(base[metric] * factor, base[metric] + LATENCY_NOISE_MS):
+                regressions.append(
+                    f'{name}: {metric} {current[metric]:.1f} мс, базовое {base[metric]:.1f} мс'
+                )
+        # количество запросов к БД не зависит от нагрузки, поэтому без допуска
+        if round(current['queries'], 1) > round(base['queries'], 1):
+            regressions.append(
+                f'{name}: {current["queries"]:.2f} запросов к БД, базовое {base["queries"]:.2f}'
+            )
+    return regressions
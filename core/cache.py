@@ -0,0 +1,208 @@
+"""
+Кэширование редко меняющихся данных сайта.
+
+Контент страниц (PageContent) хранится в двух уровнях: в памяти процесса
+с коротким временем жизни и в общем кэше Django (settings.CACHES), который
+сбрасывается сигналами при сохранении или удалении записи. Сигнал очищает
+память только своего процесса, поэтому локальная запись хранит версию
+контента сайта, с которой она получена, и при другой версии считается
+промахом: другие процессы не отдают устаревший контент после изменения.
+Внутри одного запроса результат и версия дополнительно запоминаются на
+объекте request, чтобы контекстный процессор, представление и кэш страниц
+не обращались к кэшу повторно.
+
+Версия контента используется в ключах кэша страниц для анонимных
+посетителей (см. core/middleware.py) и меняется при любом изменении данных.
+
+Отрендеренный текст публикации для ее страницы кэшируется по времени
+изменения публикации (updated_at), поэтому сброс при сохранении не нужен,
+а изменение одной публикации не сбрасывает кэш остальных.
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.template.loader import render_to_string
+
+from .metrics import count_cache
+
+PAGE_CONTENT_KEY = 'page_content:{}'
+
+# Маркер отсутствия записи в кэше: None означает "контента для страницы нет"
+_MISSING = object()
+
+# Локальный кэш процесса: page_for -> (момент устаревания, версия контента, PageContent или None)
+_local_page_content = {}
+
+
+def _page_content_key(page_for):
+    return PAGE_CONTENT_KEY.format(page_for)
+
+
+def _lookup_memo(page_for, request):
+    """
+    Ищет контент в памяти запроса. Возвращает _MISSING при промахе.
+    """
+    memo = getattr(request, '_page_content_memo', None) if request is not None else None
+    if memo is not None and page_for in memo:
+        return memo[page_for]
+    return _MISSING
+
+
+def _lookup_local(page_for, request, version):
+    """
+    Ищет контент версии version в памяти процесса. Возвращает _MISSING при промахе.
+    """
+    local = _local_page_content.get(page_for)
+    if local is not None and local[0] > time.monotonic() and local[1] == version:
+        return _remember(page_for, request, local[2])
+    return _MISSING
+
+
+def _remember(page_for, request, content, version=None):
+    """
+    Запоминает контент на объекте запроса, а если передана версия - и в памяти процесса.
+    """
+    if version is not None:
+        _local_page_content[page_for] = (
+            time.monotonic() + getattr(settings, 'PAGE_CONTENT_LOCAL_TTL', 5),
+            version,
+            content,
+        )
+    if request is not None:
+        if getattr(request, '_page_content_memo', None) is None:
+            request._page_content_memo = {}
+        request._page_content_memo[page_for] = content
+    return content
+
+
+def get_page_content(page_for, request=None):
+    """
+    Возвращает PageContent для шаблона page_for или None, если контента нет.
+    """
+    from .models import PageContent
+
+    content = _lookup_memo(page_for, request)
+    if content is not _MISSING:
+        return content
+    # версия читается до контента: если контент изменится после этого,
+    # локальная запись получит старую версию и не будет использована
+    version = get_content_version(request)
+    content = _lookup_local(page_for, request, version)
+    if content is not _MISSING:
+        return content
+    content = cache.get(_page_content_key(page_for), _MISSING)
+    count_cache('page_content', content is not _MISSING)
+    if content is _MISSING:
+        content = PageContent.objects.filter(page_for=page_for).first()
+        cache.set(_page_content_key(page_for), content, getattr(settings, 'PAGE_CONTENT_CACHE_TIMEOUT', None))
+    return _remember(page_for, request, content, version)
+
+
+async def aget_page_content(page_for, request=None):
+    """
+    Асинхронный вариант get_page_content для асинхронных представлений.
+    """
+    from .models import PageContent
+
+    content = _lookup_memo(page_for, request)
+    if content is not _MISSING:
+        return content
+    version = await aget_content_version(request)
+    content = _lookup_local(page_for, request, version)
+    if content is not _MISSING:
+        return content
+    content = await cache.aget(_page_content_key(page_for), _MISSING)
+    count_cache('page_content', content is not _MISSING)
+    if content is _MISSING:
+        content = await PageContent.objects.filter(page_for=page_for).afirst()
+        await cache.aset(_page_content_key(page_for), content, getattr(settings, 'PAGE_CONTENT_CACHE_TIMEOUT', None))
+    return _remember(page_for, request, content, version)
+
+
+def invalidate_page_content(page_for):
+    """
+    Сбрасывает закэшированный контент страницы в общем кэше и в памяти
+    текущего процесса. Записи других процессов перестают использоваться
+    после смены версии контента (см. update_content_version в core/signals.py).
+    """
+    _local_page_content.pop(page_for, None)
+    cache.delete(_page_content_key(page_for))
+
+
+# --- Версия контента сайта ---
+
+CONTENT_VERSION_KEY = 'content_version'
+
+
+def get_content_version(request=None):
+    """
+    Возвращает текущую версию контента сайта - время последнего изменения
+    публикаций, занятий или контента страниц в наносекундах.
+    Версия запоминается на объекте request и в пределах запроса не меняется.
+    """
+    version = getattr(request, '_content_version', None)
+    if version is not None:
+        return version
+    version = cache.get(CONTENT_VERSION_KEY)
+    if version is None:
+        # кэш был очищен: начинаем новую версию, старые ключи станут недействительны
+        version = time.time_ns()
+        if not cache.add(CONTENT_VERSION_KEY, version, None):
+            version = cache.get(CONTENT_VERSION_KEY, version)
+    if request is not None:
+        request._content_version = version
+    return version
+
+
+async def aget_content_version(request=None):
+    """
+    Асинхронный вариант get_content_version.
+    """
+    version = getattr(request, '_content_version', None)
+    if version is not None:
+        return version
+    version = await cache.aget(CONTENT_VERSION_KEY)
+    if version is None:
+        version = time.time_ns()
+        if not await cache.aadd(CONTENT_VERSION_KEY, version, None):
+            version = await cache.aget(CONTENT_VERSION_KEY, version)
+    if request is not None:
+        request._content_version = version
+    return version
+
+
+def bump_content_version():
+    """
+    Увеличивает версию контента, делая недействительными закэшированные страницы.
+    """
+    cache.set(CONTENT_VERSION_KEY, time.time_ns(), None)
+
+
+# --- Отрендеренные публикации ---
+
+PUBLICATION_HTML_KEY = 'publication_html:{}:{}'
+
+
+def get_publication_version(updated_at):
+    """
+    Возвращает версию публикации - время ее изменения в микросекундах.
+    """
+    return int(updated_at.timestamp() * 1_000_000)
+
+
+def get_publication_html(pk, version):
+    """
+    Возвращает HTML статьи публикации pk версии version. При промахе кэша
+    публикация загружается из БД целиком и рендерится шаблоном publication_article.html.
+    """
+    from .models import Publication
+
+    key = PUBLICATION_HTML_KEY.format(pk, version)
+    html = cache.get(key)
+    count_cache('publication', html is not None)
+    if html is None:
+        publication = Publication.objects.get(pk=pk)
+        html = render_to_string('publication_article.html', {'publication': publication})
+        cache.set(key, html, getattr(settings, 'PUBLICATION_CACHE_TIMEOUT', 60 * 60 * 24))
+    return html
@@ -1,4 +1,5 @@
-from .models import Publication, PageContent
+from .models import Publication
+from .cache import get_page_content
 
 def categories(request):
     """
@@ -8,12 +9,27 @@ def categories(request):
         'categories': Publication.category.field.choices
     }
 
+def get_page_for(request):
+    """
+    Возвращает имя шаблона, для которого хранится PageContent страницы: атрибут
+    page_for представления или имя маршрута с '.html'. None - страница без контента.
+    """
+    match = request.resolver_match
+    if match is None:
+        return None
+    view = getattr(match.func, 'view_class', match.func)
+    page_for = getattr(view, 'page_for', None)
+    if page_for:
+        return page_for
+    return match.url_name + '.html' if match.url_name else None
+
 def page_content(request):
     """
     Добавляет объект PageContent в контекст по имени шаблона.
+    Контент берется из кэша, см. core/cache.py.
     """
-    template_name = getattr(request.resolver_match, 'url_name', None)
-    if not template_name:
+    page_for = get_page_for(request)
+    if not page_for:
         return {}
-    content = PageContent.objects.filter(page_for=template_name + '.html').first()
+    content = get_page_content(page_for, request=request)
     return {'page_content': content}
\ No newline at end of file
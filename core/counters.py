@@ -0,0 +1,246 @@
+"""
+Отложенная запись счетчика скачиваний публикаций.
+
+Каждое скачивание увеличивает счетчик в памяти процесса, а в БД накопленные
+значения записываются одним UPDATE: по таймеру (DOWNLOAD_COUNTER_FLUSH_INTERVAL),
+при накоплении DOWNLOAD_COUNTER_FLUSH_SIZE скачиваний и при завершении процесса.
+Так всплеск скачиваний не создает по транзакции записи в SQLite на каждый запрос.
+
+Повторные скачивания одним посетителем не считаются. Посетитель определяется
+подписанной cookie (или id пользователя), а время скачивания хранится в таблице
+DownloadMark с уникальным индексом (публикация, посетитель), без записи в сессию.
+Повторное скачивание проверяется по буферу процесса и одним чтением по индексу.
+Отметки о первых скачиваниях тоже накапливаются в буфере и записываются в БД
+в той же транзакции, что и счетчики. Пока отметка не записана, другой процесс
+может еще раз учесть то же скачивание - не больше одного раза на процесс за
+интервал записи, что для счетчика скачиваний допустимо. Устаревшие отметки
+удаляет фоновая задача core.purge_download_marks.
+"""
+import atexit
+import logging
+import secrets
+import threading
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import DatabaseError, connection, transaction
+from django.db.models import Case, F, IntegerField, Value, When
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+
+class DownloadCounter:
+    """
+    Буфер приращений счетчика скачиваний и отметок о скачивании в памяти процесса.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # запись выполняется по одной, чтобы отметки в _flushing относились к текущей записи
+        self._flush_lock = threading.Lock()
+        self._pending = Counter()
+        # (pk публикации, посетитель) -> время скачивания
+        self._marks = {}
+        self._flushing = {}
+        self._timer = None
+
+    def _schedule(self):
+        """
+        Запускает таймер записи и возвращает True, если буфер пора записать сразу.
+        Вызывается под self._lock.
+        """
+        size = self._pending.total() + len(self._marks)
+        if size >= getattr(settings, 'DOWNLOAD_COUNTER_FLUSH_SIZE', 100):
+            return True
+        if self._timer is None:
+            self._timer = threading.Timer(
+                getattr(settings, 'DOWNLOAD_COUNTER_FLUSH_INTERVAL', 10),
+                self._flush_from_timer,
+            )
+            self._timer.daemon = True
+            self._timer.start()
+        return False
+
+    def increment(self, pk):
+        """
+        Учитывает одно скачивание публикации pk.
+        """
+        with self._lock:
+            self._pending[pk] += 1
+            flush_now = self._schedule()
+        if flush_now:
+            self.flush()
+
+    def pending(self, pk):
+        """
+        Возвращает количество скачиваний публикации, еще не записанных в БД.
+        """
+        with self._lock:
+            return self._pending.get(pk, 0)
+
+    def is_marked(self, pk, visitor_id):
+        """
+        Проверяет, есть ли в буфере отметка о скачивании публикации pk посетителем.
+        """
+        key = (pk, visitor_id)
+        with self._lock:
+            return key in self._marks or key in self._flushing
+
+    def mark(self, pk, visitor_id, downloaded_at):
+        """
+        Добавляет в буфер отметку о скачивании и возвращает True, если ее еще не было.
+        Сам буфер здесь не записывается: это делает следующий increment или таймер,
+        поэтому метод можно вызывать из асинхронного кода.
+        """
+        key = (pk, visitor_id)
+        with self._lock:
+            if key in self._marks or key in self._flushing:
+                return False
+            self._marks[key] = downloaded_at
+            self._schedule()
+        return True
+
+    def flush(self):
+        """
+        Записывает накопленные приращения и отметки в БД одной транзакцией.
+        Возвращает количество обновленных публикаций.
+        """
+        from .models import DownloadMark, Publication
+
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, Counter()
+                self._flushing, self._marks = self._marks, {}
+                marks = self._flushing
+                if self._timer is not None:
+                    self._timer.cancel()
+                    self._timer = None
+            if not pending and not marks:
+                return 0
+            try:
+                with transaction.atomic():
+                    updated = 0
+                    if pending:
+                        increment = Case(
+                            *[When(pk=pk, then=Value(count)) for pk, count in pending.items()],
+                            default=Value(0),
+                            output_field=IntegerField(),
+                        )
+                        updated = Publication.objects.filter(pk__in=pending.keys()).update(
+                            downloads_count=F('downloads_count') + increment
+                        )
+                    if marks:
+                        DownloadMark.objects.bulk_create(
+                            [
+                                DownloadMark(publication_id=pk, visitor_id=visitor_id, downloaded_at=downloaded_at)
+                                for (pk, visitor_id), downloaded_at in marks.items()
+                            ],
+                            update_conflicts=True,
+                            unique_fields=['publication_id', 'visitor_id'],
+                            update_fields=['downloaded_at'],
+                        )
+                    return updated
+            except DatabaseError:
+                # возвращаем приращения и отметки в буфер, чтобы записать их при следующей попытке
+                logger.exception('Не удалось записать счетчики скачиваний')
+                with self._lock:
+                    self._pending.update(pending)
+                    for key, downloaded_at in marks.items():
+                        self._marks.setdefault(key, downloaded_at)
+                return 0
+            finally:
+                with self._lock:
+                    self._flushing = {}
+
+    def _flush_from_timer(self):
+        with self._lock:
+            self._timer = None
+        try:
+            self.flush()
+        finally:
+            # таймер работает в отдельном потоке со своим соединением с БД
+            connection.close()
+
+
+download_counter = DownloadCounter()
+atexit.register(download_counter.flush)
+
+
+# --- Учет повторных скачиваний ---
+
+VISITOR_COOKIE_NAME = 'visitor_id'
+VISITOR_COOKIE_SALT = 'core.counters.visitor'
+
+
+def get_visitor_id(request):
+    """
+    Возвращает идентификатор посетителя и признак того, что его нужно сохранить в cookie.
+    Идентификатор не зависит от сессии и сохраняется при ее смене (например, при входе).
+    """
+    if request.user.is_authenticated:
+        return f'user:{request.user.pk}', False
+    visitor_id = request.get_signed_cookie(VISITOR_COOKIE_NAME, default=None, salt=VISITOR_COOKIE_SALT)
+    if visitor_id:
+        return visitor_id, False
+    return secrets.token_urlsafe(16), True
+
+
+def set_visitor_cookie(response, visitor_id):
+    """
+    Сохраняет идентификатор посетителя в подписанной cookie.
+    """
+    response.set_signed_cookie(
+        VISITOR_COOKIE_NAME,
+        visitor_id,
+        salt=VISITOR_COOKIE_SALT,
+        max_age=getattr(settings, 'DOWNLOAD_DEDUP_TTL', 60 * 60 * 24 * 14),
+        httponly=True,
+        samesite='Lax',
+    )
+
+
+def dedup_border():
+    """
+    Возвращает текущее время и момент, раньше которого скачивание считается новым.
+    """
+    now = timezone.now()
+    return now, now - timedelta(seconds=getattr(settings, 'DOWNLOAD_DEDUP_TTL', 60 * 60 * 24 * 14))
+
+
+def _last_download_query(visitor_id, pk):
+    """
+    Время последнего учтенного скачивания публикации pk посетителем.
+    """
+    from .models import DownloadMark
+
+    return DownloadMark.objects.filter(publication_id=pk, visitor_id=visitor_id).values_list('downloaded_at', flat=True)
+
+
+def is_first_download(visitor_id, pk):
+    """
+    Отмечает скачивание публикации pk посетителем и возвращает True,
+    если за время DOWNLOAD_DEDUP_TTL он скачивает ее впервые.
+    Отметка записывается в БД вместе со счетчиками (см. DownloadCounter.flush).
+    """
+    if download_counter.is_marked(pk, visitor_id):
+        return False
+    now, border = dedup_border()
+    last = _last_download_query(visitor_id, pk).first()
+    if last is not None and last >= border:
+        return False
+    return download_counter.mark(pk, visitor_id, now)
+
+
+async def ais_first_download(visitor_id, pk):
+    """
+    Асинхронный вариант is_first_download.
+    """
+    if download_counter.is_marked(pk, visitor_id):
+        return False
+    now, border = dedup_border()
+    last = await _last_download_query(visitor_id, pk).afirst()
+    if last is not None and last >= border:
+        return False
+    return download_counter.mark(pk, visitor_id, now)
@@ -0,0 +1,103 @@
+"""
+Настройка соединений с SQLite и разделение чтения и записи.
+
+При открытии каждого соединения выполняются PRAGMA из настройки SQLITE_PRAGMAS:
+журнал WAL (читатели не ждут писателя), synchronous=NORMAL, mmap_size, cache_size
+и temp_store. Ожидание блокировки вместо ошибки "database is locked" (busy_timeout)
+задается одной настройкой SQLITE_BUSY_TIMEOUT через параметр timeout драйвера.
+Соединение только для чтения (алиас DATABASE_READ_ALIAS) дополнительно открывается
+с query_only, чтобы запись через него была невозможна.
+
+ReadWriteRouter направляет чтение в отдельное соединение, а запись - в основное,
+поэтому чтение не стоит в очереди за транзакцией записи. Внутри транзакции
+основного соединения чтение идет через него же, чтобы видеть свои изменения.
+Если соединение только для чтения открыть нельзя (файла БД еще нет или нельзя
+создать файл -shm журнала WAL), чтение тоже идет через основное соединение.
+"""
+import logging
+import time
+
+from django.conf import settings
+from django.db import DatabaseError, connections
+from django.db.backends.signals import connection_created
+from django.db.utils import DEFAULT_DB_ALIAS
+from django.dispatch import receiver
+
+from .instrumentation import untracked
+
+logger = logging.getLogger(__name__)
+
+DATABASE_READ_ALIAS = 'read'
+
+# Параметры, которые нельзя менять через соединение только для чтения
+WRITE_ONLY_PRAGMAS = frozenset({'journal_mode'})
+
+
+@receiver(connection_created)
+def configure_sqlite_connection(sender, connection, **kwargs):
+    """
+    Применяет PRAGMA из SQLITE_PRAGMAS к новому соединению с SQLite.
+    """
+    if connection.vendor != 'sqlite':
+        return
+    read_only = connection.alias == DATABASE_READ_ALIAS
+    # настройка соединения не учитывается в бюджете запросов представления
+    with untracked(), connection.cursor() as cursor:
+        for name, value in getattr(settings, 'SQLITE_PRAGMAS', {}).items():
+            if read_only and name in WRITE_ONLY_PRAGMAS:
+                continue
+            cursor.execute(f'PRAGMA {name} = {value}')
+        if read_only:
+            cursor.execute('PRAGMA query_only = ON')
+            # чтение схемы открывает журнал WAL: ошибка доступа проявится здесь, а не в запросе представления
+            cursor.execute('SELECT count(*) FROM sqlite_master')
+
+
+# Время (time.monotonic), до которого соединение только для чтения не используется
+_read_unavailable_until = 0.0
+
+
+def read_connection_available():
+    """
+    Проверяет, что соединение только для чтения открыто или его можно открыть.
+    После ошибки открытия повторная попытка - через DATABASE_READ_RETRY_INTERVAL секунд.
+    """
+    global _read_unavailable_until
+
+    connection = connections[DATABASE_READ_ALIAS]
+    if connection.connection is not None:
+        return True
+    if _read_unavailable_until > time.monotonic():
+        return False
+    try:
+        connection.ensure_connection()
+    except DatabaseError:
+        logger.warning('Соединение только для чтения недоступно, чтение идет через основное', exc_info=True)
+        connection.close()
+        _read_unavailable_until = time.monotonic() + getattr(settings, 'DATABASE_READ_RETRY_INTERVAL', 60)
+        return False
+    return True
+
+
+class ReadWriteRouter:
+    """
+    Роутер БД: чтение через соединение DATABASE_READ_ALIAS, запись через основное.
+    """
+
+    def db_for_read(self, model, **hints):
+        if DATABASE_READ_ALIAS not in settings.DATABASES:
+            return None
+        # в транзакции читаем через основное соединение, иначе не увидим свои изменения
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block or not read_connection_available():
+            return DEFAULT_DB_ALIAS
+        return DATABASE_READ_ALIAS
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # оба соединения работают с одной базой
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
@@ -0,0 +1,267 @@
+"""
+Отдача файлов публикаций для скачивания.
+
+Поддерживаются:
+    - условные запросы (ETag / If-None-Match, Last-Modified / If-Modified-Since),
+      ETag строится из размера и времени изменения файла;
+    - запросы диапазонов байт (Range, If-Range): один диапазон отдается
+      ответом 206, несколько - ответом 206 multipart/byteranges;
+    - потоковая отдача синхронным или асинхронным итератором (для ASGI);
+    - передача отдачи файла веб-серверу через X-Accel-Redirect (nginx)
+      или X-Sendfile (Apache, lighttpd), в этом режиме Django только
+      проверяет доступ и считает скачивания, а байты отдает веб-сервер.
+"""
+import asyncio
+import mimetypes
+import os
+import re
+import secrets
+from urllib.parse import quote
+
+from django.conf import settings
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import content_disposition_header, http_date, parse_etags, parse_http_date_safe, quote_etag
+
+CHUNK_SIZE = 64 * 1024
+
+_RANGE_RE = re.compile(r'^\s*(\d*)\s*-\s*(\d*)\s*$')
+
+
+def parse_range_header(header, size):
+    """
+    Разбирает заголовок Range и возвращает список диапазонов (start, end) включительно.
+    Возвращает None, если заголовок некорректен и его нужно игнорировать,
+    и пустой список, если ни один диапазон не попадает в файл.
+    """
+    units, _, ranges_spec = header.partition('=')
+    if units.strip().lower() != 'bytes' or not ranges_spec:
+        return None
+    ranges = []
+    for spec in ranges_spec.split(','):
+        match = _RANGE_RE.match(spec)
+        if not match:
+            return None
+        first, last = match.groups()
+        if not first:
+            # суффиксный диапазон: последние N байт файла
+            if not last:
+                return None
+            length = int(last)
+            if length == 0:
+                continue
+            ranges.append((max(size - length, 0), size - 1))
+            continue
+        start = int(first)
+        if last and int(last) < start:
+            return None
+        if start >= size:
+            continue
+        end = min(int(last), size - 1) if last else size - 1
+        ranges.append((start, end))
+    if len(ranges) > getattr(settings, 'DOWNLOAD_MAX_RANGES', 16):
+        return None
+    return ranges
+
+
+def _if_range_matches(request, etag, last_modified):
+    """
+    Проверяет условие If-Range: диапазон отдается, только если файл не изменился.
+    """
+    if_range = request.headers.get('If-Range')
+    if not if_range:
+        return True
+    if if_range.strip().startswith(('"', 'W/')):
+        return etag in parse_etags(if_range)
+    if_range_date = parse_http_date_safe(if_range)
+    return if_range_date is not None and if_range_date >= last_modified
+
+
+def _read_range(file, start, end):
+    """
+    Читает из файла байты с start по end включительно блоками по CHUNK_SIZE.
+    """
+    file.seek(start)
+    remaining = end - start + 1
+    while remaining > 0:
+        chunk = file.read(min(CHUNK_SIZE, remaining))
+        if not chunk:
+            break
+        remaining -= len(chunk)
+        yield chunk
+
+
+async def _aread_range(file, start, end):
+    """
+    Асинхронный вариант _read_range: чтение блока выполняется в пуле потоков,
+    поэтому между блоками медленная отдача не занимает поток.
+    """
+    await asyncio.to_thread(file.seek, start)
+    remaining = end - start + 1
+    while remaining > 0:
+        chunk = await asyncio.to_thread(file.read, min(CHUNK_SIZE, remaining))
+        if not chunk:
+            break
+        remaining -= len(chunk)
+        yield chunk
+
+
+def _multipart_parts(ranges, size, content_type, boundary):
+    """
+    Возвращает части тела ответа multipart/byteranges: заголовки частей (bytes)
+    и диапазоны файла (start, end).
+    """
+    parts = []
+    for start, end in ranges:
+        parts.append((
+            f'\r\n--{boundary}\r\n'
+            f'Content-Type: {content_type}\r\n'
+            f'Content-Range: bytes {start}-{end}/{size}\r\n\r\n'
+        ).encode())
+        parts.append((start, end))
+    parts.append(f'\r\n--{boundary}--\r\n'.encode())
+    return parts
+
+
+def _parts_length(parts):
+    return sum(len(part) if isinstance(part, bytes) else part[1] - part[0] + 1 for part in parts)
+
+
+def _stream_parts(field_file, parts):
+    """
+    Отдает части тела ответа. Файл открывается при чтении первого блока, поэтому
+    ответ, тело которого не читалось (HEAD, разрыв соединения), файл не открывает,
+    а закрытие ответа закрывает и файл.
+    """
+    with field_file.storage.open(field_file.name, 'rb') as file:
+        for part in parts:
+            if isinstance(part, bytes):
+                yield part
+            else:
+                yield from _read_range(file, *part)
+
+
+async def _astream_parts(field_file, parts):
+    """
+    Асинхронный вариант _stream_parts: открытие, чтение и закрытие файла
+    выполняются в пуле потоков.
+    """
+    file = await asyncio.to_thread(field_file.storage.open, field_file.name, 'rb')
+    try:
+        for part in parts:
+            if isinstance(part, bytes):
+                yield part
+            else:
+                async for chunk in _aread_range(file, *part):
+                    yield chunk
+    finally:
+        await asyncio.to_thread(file.close)
+
+
+def _sendfile_response(field_file, content_type):
+    """
+    Возвращает пустой ответ с заголовком, по которому файл отдаст веб-сервер.
+    """
+    response = HttpResponse(content_type=content_type)
+    backend = settings.DOWNLOAD_SENDFILE_BACKEND
+    if backend == 'nginx':
+        prefix = getattr(settings, 'DOWNLOAD_ACCEL_REDIRECT_PREFIX', '/protected-media/')
+        response.headers['X-Accel-Redirect'] = quote(prefix + field_file.name)
+    elif backend == 'sendfile':
+        response.headers['X-Sendfile'] = field_file.path
+    else:
+        raise ValueError(f'Неизвестный DOWNLOAD_SENDFILE_BACKEND: {backend}')
+    return response
+
+
+def _python_response(request, field_file, size, content_type, etag, last_modified, asynchronous=False):
+    """
+    Отдает файл потоком из Python с поддержкой заголовка Range.
+    При asynchronous=True тело ответа - асинхронный итератор (для ASGI).
+    """
+    ranges = None
+    range_header = request.headers.get('Range')
+    if range_header and request.method == 'GET' and _if_range_matches(request, etag, last_modified):
+        ranges = parse_range_header(range_header, size)
+
+    if ranges is not None and not ranges:
+        response = HttpResponse(status=416)
+        response.headers['Content-Range'] = f'bytes */{size}'
+        return response
+
+    status = 206
+    if not ranges:
+        status, parts = 200, [(0, size - 1)] if size else []
+    elif len(ranges) == 1:
+        parts = ranges
+    else:
+        boundary = secrets.token_hex(16)
+        parts = _multipart_parts(ranges, size, content_type, boundary)
+        content_type = f'multipart/byteranges; boundary={boundary}'
+
+    stream = _astream_parts(field_file, parts) if asynchronous else _stream_parts(field_file, parts)
+    response = StreamingHttpResponse(stream, status=status, content_type=content_type)
+    response.headers['Content-Length'] = _parts_length(parts)
+    if status == 206 and len(ranges) == 1:
+        start, end = ranges[0]
+        response.headers['Content-Range'] = f'bytes {start}-{end}/{size}'
+    return response
+
+
+def response_size(response, field_file):
+    """
+    Возвращает количество байт, отдаваемых ответом. При отдаче веб-сервером
+    (X-Accel-Redirect) диапазоны неизвестны, учитывается размер файла.
+    """
+    if response.has_header('Content-Length'):
+        return int(response['Content-Length'])
+    return field_file.size
+
+
+async def aresponse_size(response, field_file):
+    """
+    Асинхронный вариант response_size: размер файла запрашивается в пуле потоков.
+    """
+    if response.has_header('Content-Length'):
+        return int(response['Content-Length'])
+    return await asyncio.to_thread(field_file.storage.size, field_file.name)
+
+
+def serve_file(request, field_file, filename=None, as_attachment=True, asynchronous=False):
+    """
+    Формирует ответ для скачивания файла из FileField с учетом условных
+    запросов и диапазонов байт. При asynchronous=True файл читается
+    асинхронным итератором, что нужно асинхронным представлениям под ASGI.
+    """
+    storage = field_file.storage
+    filename = os.path.basename(filename or field_file.name)
+    size = field_file.size
+    last_modified = int(storage.get_modified_time(field_file.name).timestamp())
+    etag = quote_etag(f'{size:x}-{last_modified:x}')
+    content_type = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        if getattr(settings, 'DOWNLOAD_SENDFILE_BACKEND', None):
+            # диапазоны байт обрабатывает веб-сервер
+            response = _sendfile_response(field_file, content_type)
+        else:
+            response = _python_response(
+                request, field_file, size, content_type, etag, last_modified, asynchronous=asynchronous,
+            )
+
+    response.headers['ETag'] = etag
+    response.headers['Last-Modified'] = http_date(last_modified)
+    response.headers['Accept-Ranges'] = 'bytes'
+    if response.status_code in (200, 206):
+        response.headers['Content-Disposition'] = content_disposition_header(as_attachment, filename)
+    return response
+
+
+async def aserve_file(request, field_file, filename=None, as_attachment=True):
+    """
+    Асинхронный вариант serve_file для асинхронных представлений: размер и время
+    изменения файла запрашиваются в пуле потоков, чтобы не блокировать цикл событий,
+    тело ответа - асинхронный итератор.
+    """
+    return await asyncio.to_thread(serve_file, request, field_file, filename, as_attachment, asynchronous=True)
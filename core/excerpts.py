@@ -0,0 +1,28 @@
+"""
+Краткое содержание публикаций для ленты блога.
+
+Лента показывает не полный HTML публикации, а текстовый отрывок из первых
+EXCERPT_WORDS слов и время чтения. Отрывок и количество слов вычисляются
+при сохранении публикации (см. core/signals.py) и хранятся в модели, поэтому
+лента не загружает из БД колонку content. Полный текст отдается по запросу
+(см. представление publication_content).
+"""
+import re
+
+from django.conf import settings
+from django.utils.text import Truncator
+
+from .search import to_plain_text
+
+_WORD_RE = re.compile(r'\w+', re.UNICODE)
+_SPACE_RE = re.compile(r'\s+')
+
+
+def build_excerpt(content):
+    """
+    Возвращает (отрывок, количество слов) для HTML публикации.
+    Отрывок - обычный текст без разметки, поэтому выводится с экранированием.
+    """
+    text = _SPACE_RE.sub(' ', to_plain_text(content)).strip()
+    excerpt = Truncator(text).words(getattr(settings, 'EXCERPT_WORDS', 50), truncate='…')
+    return excerpt, len(_WORD_RE.findall(text))
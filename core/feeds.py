@@ -0,0 +1,167 @@
+"""
+Выгрузка расписания занятий в форматах iCalendar и JSON.
+
+Выгрузка строится из правил повторения занятий (в iCalendar - RRULE и EXDATE
+для отмененных дат), поэтому ее размер не зависит от периода. Полная выгрузка
+кэшируется по времени последнего изменения расписания и отдается с ETag
+и Last-Modified: клиент, который опрашивает ее каждые несколько минут,
+обычно получает 304 без построения ответа.
+
+В JSON параметр since (дата и время в ISO 8601) включает инкрементальный режим:
+в ответе только занятия, измененные после since, и id удаленных занятий.
+"""
+import json
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+
+from .metrics import count_cache
+from .schedule import SCHEDULE_FIELDS, first_occurrence
+
+FEED_CACHE_KEY = 'schedule:feed:{}:{}'
+ICAL_DAYS = ('MO', 'TU', 'WE', 'TH', 'FR', 'SA', 'SU')
+ICAL_UID_DOMAIN = 'krylovagn'
+
+
+def get_lessons(since=None):
+    """
+    Возвращает занятия (словари полей SCHEDULE_FIELDS) с датами отмен в cancelled_dates.
+    При заданном since - только занятия, измененные после этого момента.
+    """
+    from .models import Lesson, LessonException
+
+    lessons = Lesson.objects.order_by('weekday', 'lesson_time')
+    if since is not None:
+        lessons = lessons.filter(updated_at__gt=since)
+    lessons = list(lessons.values(*SCHEDULE_FIELDS, 'updated_at'))
+
+    cancelled = {}
+    exceptions = LessonException.objects.order_by('date')
+    if since is not None:
+        exceptions = exceptions.filter(lesson_id__in=[lesson['id'] for lesson in lessons])
+    for lesson_id, cancelled_date in exceptions.values_list('lesson_id', 'date'):
+        cancelled.setdefault(lesson_id, []).append(cancelled_date)
+    for lesson in lessons:
+        lesson['cancelled_dates'] = cancelled.get(lesson['id'], [])
+    return lessons
+
+
+def build_json(last_modified, since=None):
+    """
+    Строит выгрузку расписания в JSON. При заданном since - только изменения после since.
+    """
+    from .models import DeletedLesson
+
+    deleted = []
+    if since is not None:
+        deleted = list(
+            DeletedLesson.objects.filter(deleted_at__gt=since)
+            .order_by('deleted_at')
+            .values_list('lesson_id', flat=True)
+        )
+    data = {
+        'last_modified': last_modified,
+        'full': since is None,
+        'lessons': get_lessons(since),
+        'deleted': deleted,
+    }
+    return json.dumps(data, cls=DjangoJSONEncoder, ensure_ascii=False)
+
+
+def _escape(text):
+    """
+    Экранирует текстовое значение свойства iCalendar.
+    """
+    return (
+        text.replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,')
+        .replace('\r\n', '\\n').replace('\n', '\\n')
+    )
+
+
+def _fold(line):
+    """
+    Переносит строку iCalendar длиннее 75 октетов (RFC 5545, раздел 3.1).
+    """
+    parts = []
+    current = ''
+    for char in line:
+        if len((current + char).encode()) > (75 if not parts else 74):
+            parts.append(current)
+            current = ''
+        current += char
+    parts.append(current)
+    return '\r\n '.join(parts)
+
+
+def _utc(value):
+    """
+    Форматирует дату и время в UTC для iCalendar.
+    """
+    return value.astimezone(dt_timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+
+
+def _local(day, lesson_time):
+    """
+    Форматирует местные дату и время для свойств с TZID.
+    """
+    return datetime.combine(day, lesson_time).strftime('%Y%m%dT%H%M%S')
+
+
+def build_ical(last_modified):
+    """
+    Строит выгрузку расписания в формате iCalendar: одно повторяющееся событие на занятие.
+    """
+    tz_name = settings.TIME_ZONE
+    tz = timezone.get_default_timezone()
+    dtstamp = _utc(last_modified or timezone.now())
+    lines = [
+        'BEGIN:VCALENDAR',
+        'VERSION:2.0',
+        f'PRODID:-//{ICAL_UID_DOMAIN}//Расписание занятий//RU',
+        'CALSCALE:GREGORIAN',
+        'METHOD:PUBLISH',
+        'X-WR-CALNAME:Расписание занятий',
+        f'X-WR-TIMEZONE:{tz_name}',
+    ]
+    for lesson in get_lessons():
+        rrule = f"FREQ=WEEKLY;INTERVAL={max(lesson['repeat_weeks'] or 1, 1)};BYDAY={ICAL_DAYS[lesson['weekday']]}"
+        if lesson['end_date']:
+            # UNTIL при DTSTART с часовым поясом указывается в UTC
+            until = datetime.combine(lesson['end_date'], lesson['lesson_time'], tzinfo=tz)
+            rrule += f';UNTIL={_utc(until)}'
+        lines += [
+            'BEGIN:VEVENT',
+            f"UID:lesson-{lesson['id']}@{ICAL_UID_DOMAIN}",
+            f'DTSTAMP:{dtstamp}',
+            f"LAST-MODIFIED:{_utc(lesson['updated_at'])}",
+            f"DTSTART;TZID={tz_name}:{_local(first_occurrence(lesson), lesson['lesson_time'])}",
+            f"DURATION:PT{lesson['lesson_duration']}M",
+            f'RRULE:{rrule}',
+        ]
+        if lesson['cancelled_dates']:
+            exdates = ','.join(_local(day, lesson['lesson_time']) for day in lesson['cancelled_dates'])
+            lines.append(f'EXDATE;TZID={tz_name}:{exdates}')
+        lines += [
+            f"SUMMARY:{_escape('Занятие: ' + (lesson['students_name'] or 'без имени'))}",
+            'END:VEVENT',
+        ]
+    lines.append('END:VCALENDAR')
+    return '\r\n'.join(_fold(line) for line in lines) + '\r\n'
+
+
+def get_feed(fmt, last_modified):
+    """
+    Возвращает полную выгрузку расписания в формате fmt ('ics' или 'json') из кэша.
+    Ключ кэша содержит время последнего изменения, поэтому сброс не нужен.
+    """
+    version = int(last_modified.timestamp() * 1_000_000) if last_modified else 0
+    key = FEED_CACHE_KEY.format(fmt, version)
+    content = cache.get(key)
+    count_cache('schedule_feed', content is not None)
+    if content is None:
+        content = build_ical(last_modified) if fmt == 'ics' else build_json(last_modified)
+        cache.set(key, content, getattr(settings, 'SCHEDULE_FEED_CACHE_TIMEOUT', 60 * 60 * 24))
+    return content
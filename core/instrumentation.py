@@ -0,0 +1,186 @@
+"""
+Учет SQL-запросов и времени обработки каждого HTTP-запроса.
+
+Ко всем соединениям с БД добавляется обертка выполнения запросов, которая
+записывает запросы в статистику текущего HTTP-запроса (ContextVar, поэтому
+учитываются и запросы асинхронных представлений из потоков sync_to_async).
+RequestInstrumentationMiddleware (core/middleware.py) собирает количество
+и время запросов, повторяющиеся запросы и время рендеринга шаблона, добавляет
+их в заголовок Server-Timing и в журнал core.instrumentation.
+
+Представление может объявить бюджет запросов к БД: атрибутом класса
+query_budget или декоратором @query_budget(n) для функции. Превышение бюджета
+записывается в журнал, а при QUERY_BUDGET_RAISE=True вызывает исключение
+QueryBudgetExceeded (так бюджет проверяется в тестах, см. core/testing.py).
+"""
+import json
+import logging
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+logger = logging.getLogger(__name__)
+
+# Статистика обрабатываемого HTTP-запроса или None вне запроса
+current_stats = ContextVar('request_stats', default=None)
+
+
+class QueryBudgetExceeded(Exception):
+    """
+    Представление выполнило больше запросов к БД, чем объявлено в его бюджете.
+    """
+
+
+def query_budget(budget):
+    """
+    Декоратор функции-представления: объявляет допустимое количество запросов к БД.
+    """
+    def decorator(view):
+        view.query_budget = budget
+        return view
+    return decorator
+
+
+def get_query_budget(view_func):
+    """
+    Возвращает бюджет запросов представления или None, если он не объявлен.
+    """
+    view_class = getattr(view_func, 'view_class', None)
+    if view_class is not None:
+        return getattr(view_class, 'query_budget', None)
+    return getattr(view_func, 'query_budget', None)
+
+
+class RequestStats:
+    """
+    Статистика одного HTTP-запроса.
+    """
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.query_count = 0
+        self.query_time = 0.0
+        self.statements = Counter()
+        self.render_start = None
+        self.render_time = None
+        self.view_name = None
+        self.budget = None
+
+    def add_query(self, sql, params, duration):
+        self.query_count += 1
+        self.query_time += duration
+        self.statements[(sql, repr(params))] += 1
+
+    def duplicates(self):
+        """
+        Повторно выполненные запросы с одинаковыми параметрами: список (sql, количество).
+        """
+        return [(sql, count) for (sql, params), count in self.statements.most_common() if count > 1]
+
+    @property
+    def duplicate_count(self):
+        return sum(count - 1 for count in self.statements.values() if count > 1)
+
+    @property
+    def over_budget(self):
+        return self.budget is not None and self.query_count > self.budget
+
+    def server_timing(self, total):
+        """
+        Значение заголовка Server-Timing (длительности в миллисекундах).
+        """
+        metrics = [
+            f'db;dur={self.query_time * 1000:.1f};desc="{self.query_count} queries, '
+            f'{self.duplicate_count} duplicate"',
+        ]
+        if self.render_time is not None:
+            metrics.append(f'render;dur={self.render_time * 1000:.1f}')
+        metrics.append(f'total;dur={total * 1000:.1f}')
+        return ', '.join(metrics)
+
+    def as_dict(self, request, response, total):
+        return {
+            'method': request.method,
+            'path': request.path,
+            'view': self.view_name,
+            'status': response.status_code,
+            'total_ms': round(total * 1000, 1),
+            'queries': self.query_count,
+            'query_ms': round(self.query_time * 1000, 1),
+            'duplicates': self.duplicate_count,
+            'render_ms': round(self.render_time * 1000, 1) if self.render_time is not None else None,
+            'budget': self.budget,
+        }
+
+
+def record_query(execute, sql, params, many, context):
+    """
+    Обертка выполнения запросов: записывает запрос в статистику текущего HTTP-запроса.
+    """
+    stats = current_stats.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.add_query(sql, params, time.perf_counter() - start)
+
+
+@contextmanager
+def untracked():
+    """
+    Контекст, запросы внутри которого не учитываются в статистике HTTP-запроса:
+    служебные запросы настройки нового соединения (PRAGMA, см. core/db.py)
+    не относятся к представлению и не должны расходовать его бюджет.
+    """
+    token = current_stats.set(None)
+    try:
+        yield
+    finally:
+        current_stats.reset(token)
+
+
+def install(connection):
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+@receiver(connection_created)
+def install_query_recorder(sender, connection, **kwargs):
+    install(connection)
+
+
+def install_all():
+    """
+    Добавляет обертку к уже открытым соединениям текущего потока.
+    """
+    for connection in connections.all(initialized_only=True):
+        install(connection)
+
+
+def log_request(request, response, stats, total):
+    """
+    Записывает статистику запроса в журнал одной строкой JSON. Превышение бюджета
+    записывается с уровнем WARNING вместе с повторяющимися запросами.
+    """
+    record = stats.as_dict(request, response, total)
+    if stats.over_budget:
+        record['duplicate_sql'] = [sql for sql, count in stats.duplicates()[:5]]
+        logger.warning(json.dumps(record, ensure_ascii=False))
+    elif logger.isEnabledFor(logging.INFO):
+        logger.info(json.dumps(record, ensure_ascii=False))
+
+
+def budget_error(stats):
+    """
+    Описание превышения бюджета для исключения QueryBudgetExceeded.
+    """
+    lines = [f'{stats.view_name}: {stats.query_count} запросов к БД при бюджете {stats.budget}']
+    lines += [f'  {count} x {sql}' for sql, count in stats.duplicates()]
+    return '\n'.join(lines)
@@ -0,0 +1,146 @@
+import json
+import platform
+from contextlib import nullcontext
+
+from django.conf import settings
+from django.core.asgi import get_asgi_application
+from django.core.management.base import BaseCommand, CommandError
+from django.core.wsgi import get_wsgi_application
+from django.test.utils import override_settings
+from django.utils import timezone
+
+from core.benchmark import ENDPOINTS, QueryCounter, benchmark_endpoint, endpoint_path, find_regressions
+from core.models import Lesson, Publication
+
+
+class Command(BaseCommand):
+    """
+    Нагрузочное тестирование публичных страниц и скачивания файлов в том же процессе
+    (см. core/benchmark.py). Данные для теста создает команда seed_benchmark.
+    """
+    help = 'Измеряет задержки, пропускную способность, запросы к БД и память публичных адресов'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--server',
+            choices=('wsgi', 'asgi'),
+            default='wsgi',
+            help='Интерфейс приложения. Асинхронные представления под ASGI включаются '
+                 'переменной окружения ASYNC_VIEWS=True',
+        )
+        parser.add_argument(
+            '--endpoints',
+            default=','.join(ENDPOINTS),
+            help=f'Адреса через запятую (по умолчанию все: {", ".join(ENDPOINTS)})',
+        )
+        parser.add_argument(
+            '--requests',
+            type=int,
+            default=200,
+            help='Количество запросов к каждому адресу',
+        )
+        parser.add_argument(
+            '--concurrency',
+            type=int,
+            default=10,
+            help='Количество одновременных клиентов',
+        )
+        parser.add_argument(
+            '--warmup',
+            type=int,
+            default=5,
+            help='Количество прогревочных запросов, не входящих в результаты',
+        )
+        parser.add_argument(
+            '--no-page-cache',
+            action='store_true',
+            help='Отключить кэш страниц для анонимных посетителей, чтобы измерять сами представления',
+        )
+        parser.add_argument(
+            '--save-baseline',
+            metavar='PATH',
+            help='Сохранить результаты в JSON-файл как базовые',
+        )
+        parser.add_argument(
+            '--baseline',
+            metavar='PATH',
+            help='Сравнить результаты с базовыми и завершиться с ошибкой при ухудшении',
+        )
+        parser.add_argument(
+            '--threshold',
+            type=float,
+            default=20,
+            help='Допустимое увеличение задержки, процентов',
+        )
+
+    def handle(self, *args, **options):
+        names = [name.strip() for name in options['endpoints'].split(',') if name.strip()]
+        unknown = set(names) - set(ENDPOINTS)
+        if unknown:
+            raise CommandError(f'Неизвестные адреса: {", ".join(sorted(unknown))}')
+        if settings.DEBUG:
+            self.stderr.write(self.style.WARNING(
+                'DEBUG=True: Django сохраняет все запросы к БД, результаты будут хуже, чем в продакшене'
+            ))
+
+        baseline = None
+        if options['baseline']:
+            with open(options['baseline'], encoding='utf-8') as f:
+                baseline = json.load(f)
+            if baseline['meta']['server'] != options['server']:
+                raise CommandError(f'Базовые результаты получены для {baseline["meta"]["server"]}')
+
+        server = options['server']
+        application = get_wsgi_application() if server == 'wsgi' else get_asgi_application()
+        page_cache = override_settings(ANONYMOUS_CACHE_URL_NAMES=[]) if options['no_page_cache'] else nullcontext()
+
+        results = {}
+        with page_cache, QueryCounter() as counter:
+            for name in names:
+                target = endpoint_path(name)
+                if target is None:
+                    self.stderr.write(self.style.WARNING(f'{name}: нет подходящей публикации, пропущено'))
+                    continue
+                path, query = target
+                results[name] = benchmark_endpoint(
+                    server, application, path, query,
+                    options['requests'], options['concurrency'], options['warmup'], counter,
+                )
+                self.write_result(name, results[name])
+
+        meta = {
+            'server': server,
+            'async_views': settings.ASYNC_VIEWS,
+            'requests': options['requests'],
+            'concurrency': options['concurrency'],
+            'page_cache': not options['no_page_cache'],
+            'publications': Publication.objects.count(),
+            'lessons': Lesson.objects.count(),
+            'python': platform.python_version(),
+            'date': timezone.now().isoformat(),
+        }
+        if options['save_baseline']:
+            with open(options['save_baseline'], 'w', encoding='utf-8') as f:
+                json.dump({'meta': meta, 'endpoints': results}, f, ensure_ascii=False, indent=2)
+            self.stdout.write(f'Базовые результаты сохранены в {options["save_baseline"]}')
+
+        if baseline is not None:
+            regressions = find_regressions(results, baseline['endpoints'], options['threshold'])
+            if regressions:
+                for line in regressions:
+                    self.stderr.write(self.style.ERROR(line))
+                raise CommandError(f'Ухудшение относительно базовых результатов: {len(regressions)}')
+            self.stdout.write(self.style.SUCCESS('Ухудшений относительно базовых результатов нет'))
+
+    def write_result(self, name, result):
+        memory = f'{result["peak_memory_mb"]:.0f} МБ' if result['peak_memory_mb'] is not None else '-'
+        line = (
+            f'{name:<26} {result["requests"]:>5} запр  '
+            f'p50 {result["p50"]:8.1f}  p95 {result["p95"]:8.1f}  p99 {result["p99"]:8.1f} мс  '
+            f'{result["rps"]:8.1f} запр/с  БД {result["queries"]:5.1f}  память {memory}'
+        )
+        if result['errors']:
+            statuses = ', '.join(map(str, result['statuses']))
+            self.stdout.write(self.style.ERROR(f'{line}  ошибок {result["errors"]} ({statuses})'))
+        else:
+            self.stdout.write(line)
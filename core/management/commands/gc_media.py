@@ -0,0 +1,82 @@
+import os
+import time
+
+from django.apps import apps
+from django.core.management.base import BaseCommand
+from django.db import models
+
+from core.models import PageContent, Publication
+from krylovagn.storage import ContentAddressedStorage
+
+
+class Command(BaseCommand):
+    """
+    Удаляет файлы хранилища с адресацией по содержимому, на которые больше нет ссылок.
+    """
+    help = 'Удаляет неиспользуемые файлы из хранилища загрузок CKEditor'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--min-age',
+            type=float,
+            default=24,
+            help='Не удалять файлы моложе указанного количества часов '
+                 '(файл загружен в редакторе, но публикация еще не сохранена)',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Только показать файлы, которые будут удалены',
+        )
+
+    def referenced_names(self, storage):
+        """
+        Собирает имена файлов, на которые ссылаются HTML публикаций и страниц
+        и файловые поля моделей, использующие хранилище.
+        """
+        names = set()
+        for model in (Publication, PageContent):
+            for html in model.objects.values_list('content', flat=True).iterator():
+                names |= storage.names_in_html(html)
+        for model in apps.get_models():
+            for field in model._meta.get_fields():
+                if isinstance(field, models.FileField) and isinstance(field.storage, ContentAddressedStorage):
+                    names.update(
+                        model._default_manager.exclude(**{field.name: ''})
+                        .exclude(**{f'{field.name}__isnull': True})
+                        .values_list(field.name, flat=True)
+                    )
+        return names
+
+    def handle(self, *args, **options):
+        storage = ContentAddressedStorage()
+        referenced = self.referenced_names(storage)
+        threshold = time.time() - options['min_age'] * 3600
+
+        removed = freed = 0
+        for name in storage.iter_names():
+            if name in referenced:
+                continue
+            path = storage.path(name)
+            stat = os.stat(path)
+            if stat.st_mtime > threshold:
+                continue
+            if options['dry_run']:
+                self.stdout.write(name)
+            else:
+                storage.delete(name)
+            removed += 1
+            freed += stat.st_size
+
+        # временные файлы прерванных загрузок
+        tmp_dir = storage.path('tmp')
+        if os.path.isdir(tmp_dir) and not options['dry_run']:
+            for filename in os.listdir(tmp_dir):
+                path = os.path.join(tmp_dir, filename)
+                if os.path.getmtime(path) < threshold:
+                    os.unlink(path)
+
+        action = 'Будет удалено' if options['dry_run'] else 'Удалено'
+        self.stdout.write(self.style.SUCCESS(
+            f'{action} файлов: {removed}, освобождено {freed / 1024 / 1024:.1f} МБ'
+        ))
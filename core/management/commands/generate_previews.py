@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from core.models import Publication
+from core.previews import generate_preview
+
+
+class Command(BaseCommand):
+    """
+    Создает миниатюры превью для уже загруженных публикаций.
+    """
+    help = 'Создает миниатюры файлов превью публикаций'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--missing',
+            action='store_true',
+            help='Обрабатывать только публикации без миниатюры',
+        )
+
+    def handle(self, *args, **options):
+        queryset = Publication.objects.exclude(preview_file='').exclude(preview_file__isnull=True)
+        if options['missing']:
+            queryset = queryset.filter(Q(preview_thumbnail__isnull=True) | Q(preview_thumbnail=''))
+        total = 0
+        for publication in queryset.iterator():
+            generate_preview(publication)
+            total += 1
+        self.stdout.write(self.style.SUCCESS(f'Обработано публикаций: {total}'))
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from core.search import rebuild_index
+
+
+class Command(BaseCommand):
+    """
+    Полностью перестраивает поисковый индекс публикаций.
+    """
+    help = 'Перестраивает полнотекстовый поисковый индекс публикаций'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Количество публикаций, индексируемых за один запрос',
+        )
+
+    def handle(self, *args, **options):
+        total = rebuild_index(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Проиндексировано публикаций: {total}'))
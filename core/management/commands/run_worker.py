@@ -0,0 +1,68 @@
+import multiprocessing
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core.tasks import claim_tasks, init_worker_process, requeue_stale, run_task, schedule_periodic, worker_id
+
+
+class Command(BaseCommand):
+    """
+    Воркер очереди фоновых задач.
+    """
+    help = 'Выполняет фоновые задачи из очереди в пуле процессов'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--concurrency',
+            type=int,
+            default=getattr(settings, 'TASK_WORKER_CONCURRENCY', 2),
+            help='Количество одновременно выполняемых задач',
+        )
+        parser.add_argument(
+            '--poll-interval',
+            type=float,
+            default=getattr(settings, 'TASK_POLL_INTERVAL', 2),
+            help='Пауза между проверками очереди, секунд',
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Выполнить доступные задачи и завершиться',
+        )
+
+    def handle(self, *args, **options):
+        concurrency = max(options['concurrency'], 1)
+        owner = worker_id()
+        running = set()
+        self.stdout.write(f'Воркер {owner} запущен, одновременно задач: {concurrency}')
+        schedule_periodic()
+        # зависшие задачи проверяются реже, чем очередь
+        requeue_interval = getattr(settings, 'TASK_REQUEUE_INTERVAL', 60)
+        next_requeue = 0
+        # spawn: процессы пула не наследуют соединения с БД родительского процесса
+        with ProcessPoolExecutor(
+            max_workers=concurrency,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=init_worker_process,
+        ) as pool:
+            try:
+                while True:
+                    if time.monotonic() >= next_requeue:
+                        requeue_stale()
+                        next_requeue = time.monotonic() + requeue_interval
+                    for task_id in claim_tasks(concurrency - len(running), owner):
+                        running.add(pool.submit(run_task, task_id))
+                    if not running:
+                        if options['once']:
+                            break
+                        time.sleep(options['poll_interval'])
+                        continue
+                    done, running = wait(running, timeout=options['poll_interval'], return_when=FIRST_COMPLETED)
+                    for future in done:
+                        if future.exception() is not None:
+                            self.stderr.write(f'Ошибка выполнения задачи: {future.exception()}')
+            except KeyboardInterrupt:
+                self.stdout.write('Остановка воркера...')
@@ -0,0 +1,226 @@
+import os
+import random
+import tempfile
+from datetime import date, time, timedelta
+
+from django.core.files import File
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.utils import timezone
+
+from core.cache import bump_content_version
+from core.excerpts import build_excerpt
+from core.models import Lesson, Publication
+from core.schedule import invalidate_month_schedules, invalidate_schedule
+from core.search import rebuild_index
+
+# Метки синтетических записей, по которым их удаляет --clear
+TITLE_PREFIX = '[benchmark] '
+STUDENT_PREFIX = 'benchmark '
+
+WORDS = (
+    'урок', 'уроки', 'математика', 'задача', 'задачи', 'решение', 'уравнение', 'функция',
+    'график', 'геометрия', 'треугольник', 'окружность', 'площадь', 'объем', 'вектор',
+    'производная', 'интеграл', 'экзамен', 'подготовка', 'контрольная', 'работа', 'класс',
+    'ученики', 'теорема', 'доказательство', 'пример', 'упражнение', 'вероятность',
+    'статистика', 'дроби', 'проценты', 'неравенство', 'система', 'презентация', 'олимпиада',
+)
+
+# Сетка занятий: 7 дней по 28 получасовых слотов с 08:00
+SLOTS_PER_DAY = 28
+SLOT_MINUTES = 30
+
+
+def sentence(rng):
+    """
+    Случайное предложение из слов WORDS.
+    """
+    words = rng.choices(WORDS, k=rng.randint(6, 16))
+    return ' '.join(words).capitalize() + '.'
+
+
+def html_content(rng):
+    """
+    Случайный HTML публикации из нескольких абзацев.
+    """
+    paragraphs = (
+        '<p>' + ' '.join(sentence(rng) for _ in range(rng.randint(2, 6))) + '</p>'
+        for _ in range(rng.randint(2, 8))
+    )
+    return ''.join(paragraphs)
+
+
+class Command(BaseCommand):
+    """
+    Заполняет базу синтетическими публикациями, занятиями и большим файлом
+    для нагрузочного тестирования (см. команду benchmark).
+    """
+    help = 'Создает синтетические данные для нагрузочного тестирования'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--publications',
+            type=int,
+            default=10_000,
+            help='Количество публикаций',
+        )
+        parser.add_argument(
+            '--lessons',
+            type=int,
+            default=500,
+            help='Количество занятий (196 действующих, остальные - завершившиеся в прошлом)',
+        )
+        parser.add_argument(
+            '--file-size',
+            type=int,
+            default=20,
+            help='Размер файла публикаций, МБ (0 - без файла)',
+        )
+        parser.add_argument(
+            '--file-every',
+            type=int,
+            default=10,
+            help='Файл прикрепляется к каждой N-й публикации',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Количество записей, создаваемых за один запрос',
+        )
+        parser.add_argument(
+            '--seed',
+            type=int,
+            default=0,
+            help='Начальное значение генератора случайных чисел (для воспроизводимости)',
+        )
+        parser.add_argument(
+            '--clear',
+            action='store_true',
+            help='Удалить ранее созданные синтетические данные и ничего не создавать',
+        )
+        parser.add_argument(
+            '--noinput', '--no-input',
+            action='store_false',
+            dest='interactive',
+            help='Не запрашивать подтверждение',
+        )
+
+    def confirm(self, message):
+        answer = input(f'{message} в базе {connections[DEFAULT_DB_ALIAS].settings_dict["NAME"]}. '
+                       f'Введите "yes" для продолжения: ')
+        if answer != 'yes':
+            raise CommandError('Отменено')
+
+    def handle(self, *args, **options):
+        if options['interactive']:
+            action = 'Синтетические данные будут удалены' if options['clear'] else 'Будут созданы синтетические данные'
+            self.confirm(action)
+
+        if options['clear']:
+            self.clear()
+        else:
+            rng = random.Random(options['seed'])
+            file_name = self.create_file(options['file_size']) if options['file_size'] else None
+            self.create_publications(rng, options['publications'], file_name, options['file_every'],
+                                     options['batch_size'])
+            self.create_lessons(options['lessons'], options['batch_size'])
+
+        # bulk_create и удаление без сигналов не обновляют индекс и кэш (отрывки вычисляются при создании)
+        self.stdout.write('Перестройка поискового индекса...')
+        rebuild_index()
+        bump_content_version()
+        invalidate_schedule()
+        invalidate_month_schedules()
+        self.stdout.write(self.style.SUCCESS('Готово'))
+
+    def create_file(self, size_mb):
+        """
+        Создает файл публикаций заданного размера (один на все публикации) и возвращает его имя.
+        """
+        storage = Publication._meta.get_field('presentation_file').storage
+        name = f'publications/presentations/benchmark-{size_mb}mb.pdf'
+        if storage.exists(name):
+            return name
+        with tempfile.TemporaryFile() as f:
+            f.write(b'%PDF-1.4\n')
+            for _ in range(size_mb):
+                f.write(os.urandom(1024 * 1024))
+            f.seek(0)
+            name = storage.save(name, File(f, name=os.path.basename(name)))
+        self.stdout.write(f'Создан файл {name} ({size_mb} МБ)')
+        return name
+
+    def create_publications(self, rng, count, file_name, file_every, batch_size):
+        # даты публикаций распределены по последним годам: created_at заполняется
+        # автоматически (auto_now_add), поэтому на время создания автозаполнение отключается
+        created_at = Publication._meta.get_field('created_at')
+        now = timezone.now()
+        created = 0
+        created_at.auto_now_add = False
+        try:
+            while created < count:
+                batch = []
+                for i in range(created, min(created + batch_size, count)):
+                    content = html_content(rng)
+                    excerpt, word_count = build_excerpt(content)
+                    batch.append(Publication(
+                        title=TITLE_PREFIX + sentence(rng)[:150],
+                        content=content,
+                        excerpt=excerpt,
+                        word_count=word_count,
+                        category=rng.randrange(7),
+                        created_at=now - timedelta(minutes=rng.randrange(60 * 24 * 365 * 5)),
+                        presentation_file=file_name if file_name and i % file_every == 0 else '',
+                        is_published=rng.random() < 0.95,
+                        downloads_count=rng.randrange(1000),
+                    ))
+                with transaction.atomic():
+                    Publication.objects.bulk_create(batch)
+                created += len(batch)
+                self.stdout.write(f'Публикаций создано: {created}/{count}')
+        finally:
+            created_at.auto_now_add = True
+
+    def create_lessons(self, count, batch_size):
+        # первые 7 * SLOTS_PER_DAY занятий действуют без ограничения дат и занимают
+        # всю недельную сетку, остальные - такая же сетка в прошлых 12-недельных периодах
+        grid = 7 * SLOTS_PER_DAY
+        today = date.today()
+        lessons = []
+        for i in range(count):
+            block, position = divmod(i, grid)
+            weekday, slot = divmod(position, SLOTS_PER_DAY)
+            minutes = 8 * 60 + slot * SLOT_MINUTES
+            start_date = end_date = None
+            if block:
+                end_date = today - timedelta(weeks=12 * (block - 1) + 1)
+                start_date = end_date - timedelta(weeks=12) + timedelta(days=1)
+            lessons.append(Lesson(
+                students_name=f'{STUDENT_PREFIX}{i}',
+                weekday=weekday,
+                lesson_time=time(minutes // 60, minutes % 60),
+                lesson_duration=SLOT_MINUTES,
+                start_date=start_date,
+                end_date=end_date,
+            ))
+        Lesson.objects.bulk_create(lessons, batch_size=batch_size)
+        self.stdout.write(f'Занятий создано: {count}')
+
+    def clear(self):
+        publications = Publication.objects.filter(title__startswith=TITLE_PREFIX)
+        count = publications.count()
+        # удаление одним запросом без сигналов: индекс перестраивается целиком после удаления
+        with connections[DEFAULT_DB_ALIAS].cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {Publication._meta.db_table} WHERE title LIKE %s',
+                [TITLE_PREFIX + '%'],
+            )
+        self.stdout.write(f'Публикаций удалено: {count}')
+
+        lessons = Lesson.objects.filter(students_name__startswith=STUDENT_PREFIX)
+        pks = list(lessons.values_list('pk', flat=True))
+        # отметки об удалении остаются: по ним клиенты выгрузки узнают об удалении,
+        # а время удаления меняет версию расписания в ключах кэша месяцев
+        lessons.delete()
+        self.stdout.write(f'Занятий удалено: {len(pks)}')
@@ -0,0 +1,293 @@
+"""
+Метрики работы сайта в текстовом формате Prometheus.
+
+Счетчики и гистограммы накапливаются в памяти процесса без блокировок: каждый
+поток пишет только в свой словарь (shard), а при чтении словари всех потоков
+суммируются. Словари завершившихся потоков при чтении переносятся в общий
+итог процесса, чтобы список словарей не рос с каждым новым потоком. Каждый процесс (воркер gunicorn) раз в METRICS_FLUSH_INTERVAL
+секунд записывает снимок своих метрик в отдельный файл каталога METRICS_DIR
+(атомарно, через временный файл и os.replace). Представление метрик суммирует
+файлы всех процессов, поэтому сетевой сервис для агрегации не нужен. Файлы
+завершившихся процессов тоже учитываются, чтобы счетчики не уменьшались;
+каталог очищается при перезапуске сервиса.
+
+Собираются:
+- количество и длительность HTTP-запросов по имени маршрута (core/middleware.py);
+- количество скачиваний и отданные байты по публикациям;
+- попадания и промахи кэшей страниц, контента страниц, расписания и выгрузки;
+- ожидание блокировки записи SQLite (время BEGIN IMMEDIATE) и ошибки "database is locked";
+- записи сессий в БД.
+"""
+import atexit
+import glob
+import json
+import os
+import tempfile
+import threading
+import time
+from bisect import bisect_left
+
+from django.conf import settings
+from django.db import OperationalError
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+# Границы корзин гистограмм, секунд
+REQUEST_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+LOCK_WAIT_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 2.5, 5, 10)
+
+# Описание метрик: имя -> (тип, описание, границы корзин для гистограмм)
+METRICS = {
+    'http_requests_total': ('counter', 'Количество HTTP-запросов по маршруту и коду ответа', None),
+    'http_request_duration_seconds': ('histogram', 'Время обработки HTTP-запроса по маршруту', REQUEST_BUCKETS),
+    'downloads_total': ('counter', 'Количество отданных файлов публикаций', None),
+    'download_bytes_total': ('counter', 'Размер отданных файлов публикаций, байт', None),
+    'cache_hits_total': ('counter', 'Попадания в кэш', None),
+    'cache_misses_total': ('counter', 'Промахи кэша', None),
+    'sqlite_lock_wait_seconds': ('histogram', 'Ожидание блокировки записи SQLite (BEGIN IMMEDIATE)',
+                                 LOCK_WAIT_BUCKETS),
+    'sqlite_lock_errors_total': ('counter', 'Запросы, завершившиеся ошибкой "database is locked"', None),
+    'session_writes_total': ('counter', 'Записи сессий в БД', None),
+}
+
+
+class ProcessMetrics:
+    """
+    Метрики текущего процесса.
+    """
+
+    def __init__(self):
+        self._reset()
+        # после fork (gunicorn --preload) дочерний процесс начинает с пустых метрик
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self):
+        self._local = threading.local()
+        # пары (поток, словарь потока)
+        self._shards = []
+        # итог завершившихся потоков, меняется только под _snapshot_lock
+        self._base = {}
+        self._snapshot_lock = threading.Lock()
+        self._writer = None
+        self._writer_lock = threading.Lock()
+        self._path = None
+
+    def _shard(self):
+        shard = getattr(self._local, 'shard', None)
+        if shard is None:
+            shard = self._local.shard = {}
+            # list.append атомарен, словарь потока дальше меняет только сам поток
+            self._shards.append((threading.current_thread(), shard))
+            self._start_writer()
+        return shard
+
+    def inc(self, name, labels=(), value=1):
+        """
+        Увеличивает счетчик name с метками labels (кортеж пар (имя, значение)).
+        """
+        shard = self._shard()
+        key = (name, labels)
+        shard[key] = shard.get(key, 0) + value
+
+    def observe(self, name, labels, value):
+        """
+        Добавляет значение в гистограмму name. Хранятся количества по корзинам
+        (последняя - +Inf) и сумма значений.
+        """
+        buckets = METRICS[name][2]
+        shard = self._shard()
+        key = (name, labels)
+        data = shard.get(key)
+        if data is None:
+            data = shard[key] = [0] * (len(buckets) + 1) + [0.0]
+        data[bisect_left(buckets, value)] += 1
+        data[-1] += value
+
+    def snapshot(self):
+        """
+        Суммирует метрики всех потоков процесса: список [имя, метки, значение].
+        Словари завершившихся потоков переносятся в итог процесса и удаляются из списка.
+        """
+        with self._snapshot_lock:
+            for entry in list(self._shards):
+                thread, shard = entry
+                if not thread.is_alive():
+                    # завершившийся поток словарь больше не меняет
+                    for key, value in shard.items():
+                        merge_value(self._base, key, value)
+                    self._shards.remove(entry)
+            merged = {}
+            for key, value in self._base.items():
+                merge_value(merged, key, value)
+            for _, shard in list(self._shards):
+                for key, value in list(shard.items()):
+                    merge_value(merged, key, value)
+        return [[name, list(labels), value] for (name, labels), value in merged.items()]
+
+    # --- Запись снимка в файл процесса ---
+
+    def _start_writer(self):
+        if self._writer is not None or not getattr(settings, 'METRICS_DIR', None):
+            return
+        with self._writer_lock:
+            if self._writer is None:
+                self._writer = threading.Thread(target=self._write_periodically, daemon=True)
+                self._writer.start()
+
+    def _write_periodically(self):
+        interval = getattr(settings, 'METRICS_FLUSH_INTERVAL', 10)
+        while True:
+            time.sleep(interval)
+            self.flush()
+
+    def flush(self):
+        """
+        Записывает снимок метрик процесса в его файл в METRICS_DIR.
+        """
+        directory = getattr(settings, 'METRICS_DIR', None)
+        if not directory or not (self._shards or self._base):
+            return
+        if self._path is None:
+            os.makedirs(directory, exist_ok=True)
+            # время запуска в имени: pid может достаться новому процессу
+            self._path = os.path.join(directory, f'{os.getpid()}-{time.time_ns()}.json')
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(self.snapshot(), f)
+            os.replace(tmp_path, self._path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+
+
+def merge_value(merged, key, value):
+    current = merged.get(key)
+    if current is None:
+        merged[key] = list(value) if isinstance(value, list) else value
+    elif isinstance(value, list):
+        merged[key] = [a + b for a, b in zip(current, value)]
+    else:
+        merged[key] = current + value
+
+
+process_metrics = ProcessMetrics()
+atexit.register(process_metrics.flush)
+
+
+def collect():
+    """
+    Суммирует метрики всех процессов из файлов METRICS_DIR. Без METRICS_DIR
+    возвращает метрики текущего процесса.
+    """
+    directory = getattr(settings, 'METRICS_DIR', None)
+    if not directory:
+        series = process_metrics.snapshot()
+    else:
+        process_metrics.flush()
+        series = []
+        for path in glob.glob(os.path.join(directory, '*.json')):
+            try:
+                with open(path) as f:
+                    series.extend(json.load(f))
+            except (OSError, ValueError):
+                # файл удален или поврежден - пропускаем
+                continue
+    merged = {}
+    for name, labels, value in series:
+        merge_value(merged, (name, tuple(tuple(label) for label in labels)), value)
+    return merged
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels) + '}'
+
+
+def _format_value(value):
+    return str(value) if isinstance(value, int) else repr(float(value))
+
+
+def render(merged):
+    """
+    Формирует текст метрик в формате Prometheus.
+    """
+    lines = []
+    for name, (kind, description, buckets) in METRICS.items():
+        series = sorted((labels, value) for (metric, labels), value in merged.items() if metric == name)
+        lines.append(f'# HELP {name} {description}')
+        lines.append(f'# TYPE {name} {kind}')
+        for labels, value in series:
+            if kind == 'histogram':
+                cumulative = 0
+                for bound, count in zip(buckets + ('+Inf',), value[:-1]):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{_format_labels(labels + (("le", bound),))} {cumulative}')
+                lines.append(f'{name}_sum{_format_labels(labels)} {_format_value(value[-1])}')
+                lines.append(f'{name}_count{_format_labels(labels)} {cumulative}')
+            else:
+                lines.append(f'{name}{_format_labels(labels)} {_format_value(value)}')
+
+    # доля попаданий вычисляется из счетчиков для удобства просмотра без PromQL
+    lines.append('# HELP cache_hit_ratio Доля попаданий в кэш')
+    lines.append('# TYPE cache_hit_ratio gauge')
+    caches = sorted({labels for (metric, labels) in merged if metric in ('cache_hits_total', 'cache_misses_total')})
+    for labels in caches:
+        hits = merged.get(('cache_hits_total', labels), 0)
+        misses = merged.get(('cache_misses_total', labels), 0)
+        lines.append(f'cache_hit_ratio{_format_labels(labels)} {_format_value(hits / (hits + misses))}')
+    return '\n'.join(lines) + '\n'
+
+
+# --- Точки учета ---
+
+def observe_request(view_name, status, duration):
+    view = (('view', view_name or 'unmatched'),)
+    process_metrics.inc('http_requests_total', view + (('status', str(status)),))
+    process_metrics.observe('http_request_duration_seconds', view, duration)
+
+
+def count_download(pk, size):
+    labels = (('publication', str(pk)),)
+    process_metrics.inc('downloads_total', labels)
+    process_metrics.inc('download_bytes_total', labels, size)
+
+
+def count_cache(name, hit):
+    process_metrics.inc('cache_hits_total' if hit else 'cache_misses_total', (('cache', name),))
+
+
+def count_session_write():
+    process_metrics.inc('session_writes_total')
+
+
+def record_sqlite_lock(execute, sql, params, many, context):
+    """
+    Обертка выполнения запросов SQLite: измеряет ожидание блокировки записи
+    при начале транзакции (BEGIN IMMEDIATE ждет до busy_timeout) и считает
+    ошибки блокировки. Ожидание одиночных записей вне транзакции
+    входит во время самого запроса и отдельно не измеряется.
+    """
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    except OperationalError as e:
+        if 'locked' in str(e):
+            process_metrics.inc('sqlite_lock_errors_total')
+        raise
+    finally:
+        if sql.startswith('BEGIN'):
+            process_metrics.observe('sqlite_lock_wait_seconds', (), time.perf_counter() - start)
+
+
+@receiver(connection_created)
+def install_sqlite_lock_recorder(sender, connection, **kwargs):
+    if connection.vendor == 'sqlite' and record_sqlite_lock not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_sqlite_lock)
@@ -0,0 +1,249 @@
+import hashlib
+import mimetypes
+import os
+import time
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.cache import cache
+from django.core.exceptions import MiddlewareNotUsed
+from django.http import FileResponse
+from django.utils.deprecation import MiddlewareMixin
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+
+from .cache import get_content_version
+from .metrics import count_cache, observe_request
+from .instrumentation import (
+    QueryBudgetExceeded,
+    RequestStats,
+    budget_error,
+    current_stats,
+    get_query_budget,
+    install_all,
+    log_request,
+)
+
+
+class AnonymousPageCacheMiddleware(MiddlewareMixin):
+    """
+    Кэширует страницы для анонимных посетителей.
+
+    Ключ кэша и ETag включают версию контента сайта, которая меняется при любом
+    изменении публикаций, занятий или контента страниц, поэтому устаревшие
+    страницы не отдаются. Условные GET-запросы (If-None-Match, If-Modified-Since)
+    получают ответ 304 без рендеринга шаблона. Авторизованные пользователи
+    (администратор видит формы редактирования) кэш не используют.
+    """
+
+    def is_cacheable(self, request, view_name):
+        """
+        Проверяет, можно ли отдать запрос из кэша.
+        """
+        if request.method not in ('GET', 'HEAD'):
+            return False
+        if view_name not in getattr(settings, 'ANONYMOUS_CACHE_URL_NAMES', ()):
+            return False
+        # сообщения django.contrib.messages показываются один раз, такие страницы не кэшируем
+        if getattr(settings, 'MESSAGE_COOKIE_NAME', 'messages') in request.COOKIES:
+            return False
+        return not request.user.is_authenticated
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        view_name = getattr(request.resolver_match, 'url_name', None)
+        if not self.is_cacheable(request, view_name):
+            return None
+
+        version = get_content_version(request)
+        path_hash = hashlib.md5(request.get_full_path().encode()).hexdigest()
+        etag = quote_etag(f'{version:x}-{path_hash[:16]}')
+        last_modified = version // 1_000_000_000
+
+        # условный GET: если у клиента актуальная версия, отвечаем 304 без рендеринга
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = cache.get(f'anonymous_page:{version}:{path_hash}')
+        count_cache('anonymous_page', response is not None)
+        if response is not None:
+            self.set_cache_headers(response, etag, last_modified)
+            return response
+
+        if request.method == 'GET':
+            request._anonymous_page_cache = (f'anonymous_page:{version}:{path_hash}', etag, last_modified)
+        return None
+
+    def process_response(self, request, response):
+        params = getattr(request, '_anonymous_page_cache', None)
+        if params is None:
+            return response
+        key, etag, last_modified = params
+        if response.status_code != 200 or response.streaming or response.cookies:
+            return response
+        if hasattr(response, 'render') and callable(response.render):
+            response.add_post_render_callback(
+                lambda r: self.store_response(r, key, etag, last_modified)
+            )
+        else:
+            self.store_response(response, key, etag, last_modified)
+        return response
+
+    def store_response(self, response, key, etag, last_modified):
+        """
+        Сохраняет отрендеренный ответ в кэш.
+        """
+        self.set_cache_headers(response, etag, last_modified)
+        cache.set(key, response, getattr(settings, 'ANONYMOUS_CACHE_TIMEOUT', 600))
+
+    @staticmethod
+    def set_cache_headers(response, etag, last_modified):
+        response.headers['ETag'] = etag
+        response.headers['Last-Modified'] = http_date(last_modified)
+        # браузер хранит страницу, но перепроверяет ее условным запросом
+        patch_cache_control(response, no_cache=True)
+        patch_vary_headers(response, ('Cookie',))
+
+
+class StaticFilesMiddleware(MiddlewareMixin):
+    """
+    Отдает собранную статику (STATIC_ROOT) без обращения к URL-маршрутам и представлениям.
+
+    Список файлов строится один раз при запуске процесса. Файлы с хэшем в имени
+    (из манифеста ManifestStaticFilesStorage) отдаются с Cache-Control immutable
+    на год, остальные - с проверкой актуальности. Если клиент поддерживает сжатие,
+    отдается заранее сжатый вариант .br или .gz, созданный при collectstatic.
+    В режиме DEBUG статику отдает runserver, и middleware отключается.
+    """
+    encodings = (('br', '.br'), ('gzip', '.gz'))
+
+    def __init__(self, get_response):
+        super().__init__(get_response)
+        if settings.DEBUG or not settings.STATIC_ROOT or not settings.STATIC_URL.startswith('/'):
+            raise MiddlewareNotUsed
+        self.prefix = settings.STATIC_URL
+        self.files = self.scan(str(settings.STATIC_ROOT))
+
+    def scan(self, root):
+        """
+        Строит словарь URL -> сведения о файле для всех файлов STATIC_ROOT.
+        """
+        hashed = set(getattr(staticfiles_storage, 'hashed_files', {}).values())
+        files = {}
+        for directory, _, filenames in os.walk(root):
+            for filename in filenames:
+                if filename.endswith(('.br', '.gz')):
+                    continue
+                path = os.path.join(directory, filename)
+                name = os.path.relpath(path, root).replace(os.sep, '/')
+                stat = os.stat(path)
+                variants = {}
+                for encoding, suffix in self.encodings:
+                    if os.path.exists(path + suffix):
+                        variants[encoding] = path + suffix
+                files[self.prefix + name] = {
+                    'path': path,
+                    'content_type': mimetypes.guess_type(filename)[0] or 'application/octet-stream',
+                    'etag': f'{stat.st_size:x}-{int(stat.st_mtime):x}',
+                    'last_modified': int(stat.st_mtime),
+                    'immutable': name in hashed,
+                    'variants': variants,
+                }
+        return files
+
+    @staticmethod
+    def accepted_encodings(request):
+        """
+        Возвращает множество кодировок из Accept-Encoding, кроме явно запрещенных (q=0).
+        """
+        accepted = set()
+        for item in request.headers.get('Accept-Encoding', '').split(','):
+            encoding, _, params = item.strip().partition(';')
+            if params.replace(' ', '') in ('q=0', 'q=0.0', 'q=0.00', 'q=0.000'):
+                continue
+            accepted.add(encoding.strip().lower())
+        return accepted
+
+    def process_request(self, request):
+        if request.method not in ('GET', 'HEAD') or not request.path_info.startswith(self.prefix):
+            return None
+        entry = self.files.get(request.path_info)
+        if entry is None:
+            return None
+
+        path, encoding = entry['path'], None
+        accepted = self.accepted_encodings(request)
+        for name, _ in self.encodings:
+            if name in entry['variants'] and name in accepted:
+                path, encoding = entry['variants'][name], name
+                break
+        # у сжатого варианта свой ETag: это другое представление файла
+        etag = quote_etag(f"{entry['etag']}-{encoding}" if encoding else entry['etag'])
+
+        response = get_conditional_response(request, etag=etag, last_modified=entry['last_modified'])
+        if response is None:
+            response = FileResponse(
+                open(path, 'rb'), content_type=entry['content_type'],
+                filename=os.path.basename(entry['path']),
+            )
+            if encoding:
+                response.headers['Content-Encoding'] = encoding
+        response.headers['ETag'] = etag
+        response.headers['Last-Modified'] = http_date(entry['last_modified'])
+        if entry['variants']:
+            patch_vary_headers(response, ('Accept-Encoding',))
+        if entry['immutable']:
+            patch_cache_control(response, public=True, max_age=60 * 60 * 24 * 365, immutable=True)
+        else:
+            patch_cache_control(response, public=True, max_age=getattr(settings, 'STATIC_MAX_AGE', 60 * 60))
+        return response
+
+
+class RequestInstrumentationMiddleware(MiddlewareMixin):
+    """
+    Собирает статистику каждого запроса: количество, время и повторы SQL-запросов,
+    время рендеринга шаблона и общее время обработки (см. core/instrumentation.py).
+
+    Статистика записывается в журнал core.instrumentation, добавляется в заголовок
+    Server-Timing (настройка SERVER_TIMING_HEADER) и в атрибут request_stats ответа
+    для тестов. Если представление выполнило больше запросов, чем объявлено в его
+    query_budget, при QUERY_BUDGET_RAISE=True вызывается QueryBudgetExceeded.
+    """
+
+    def __init__(self, get_response):
+        super().__init__(get_response)
+        install_all()
+
+    def process_request(self, request):
+        request._request_stats = RequestStats()
+        current_stats.set(request._request_stats)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        stats = request._request_stats
+        stats.view_name = request.resolver_match.view_name
+        stats.budget = get_query_budget(view_func)
+
+    def process_template_response(self, request, response):
+        stats = getattr(request, '_request_stats', None)
+        if stats is not None:
+            # шаблон рендерится сразу после обработчиков process_template_response
+            stats.render_start = time.perf_counter()
+            response.add_post_render_callback(lambda r: self.finish_render(stats))
+        return response
+
+    @staticmethod
+    def finish_render(stats):
+        stats.render_time = time.perf_counter() - stats.render_start
+
+    def process_response(self, request, response):
+        stats = getattr(request, '_request_stats', None)
+        if stats is None:
+            return response
+        current_stats.set(None)
+        total = time.perf_counter() - stats.start
+        if getattr(settings, 'SERVER_TIMING_HEADER', False):
+            response.headers['Server-Timing'] = stats.server_timing(total)
+        response.request_stats = stats
+        observe_request(stats.view_name, response.status_code, total)
+        log_request(request, response, stats, total)
+        if stats.over_budget and getattr(settings, 'QUERY_BUDGET_RAISE', False):
+            raise QueryBudgetExceeded(budget_error(stats))
+        return response
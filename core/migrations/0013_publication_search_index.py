@@ -0,0 +1,53 @@
+"""
+Полнотекстовый индекс публикаций.
+
+Миграция только создает таблицу индекса. Уже существующие публикации
+индексируются после применения миграции обработчиком post_migrate
+(fill_search_index_after_migrate в core/signals.py) текущим кодом core/search.py -
+тем же стеммингом, которым выполняется поиск, поэтому копия кода индексации
+в миграции не нужна.
+"""
+from django.db import migrations
+
+FTS_TABLE = 'core_publication_fts'
+PG_TABLE = 'core_publication_search'
+
+
+def create_search_index(apps, schema_editor):
+    """
+    Создает таблицу полнотекстового индекса в зависимости от СУБД.
+    """
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        schema_editor.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} "
+            f"USING fts5(title, content, tokenize = 'unicode61 remove_diacritics 2')"
+        )
+    elif vendor == 'postgresql':
+        schema_editor.execute(
+            f"CREATE TABLE IF NOT EXISTS {PG_TABLE} ("
+            f"publication_id bigint PRIMARY KEY REFERENCES core_publication (id) ON DELETE CASCADE, "
+            f"document tsvector NOT NULL)"
+        )
+        schema_editor.execute(
+            f"CREATE INDEX IF NOT EXISTS {PG_TABLE}_document_gin ON {PG_TABLE} USING GIN (document)"
+        )
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        schema_editor.execute(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+    elif vendor == 'postgresql':
+        schema_editor.execute(f"DROP TABLE IF EXISTS {PG_TABLE}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_alter_lesson_students_name_and_more'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_publication_search_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='publication',
+            index=models.Index(fields=['is_published', '-created_at'], name='pub_published_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='publication',
+            index=models.Index(fields=['is_published', 'category', '-created_at'], name='pub_published_cat_created_idx'),
+        ),
+    ]
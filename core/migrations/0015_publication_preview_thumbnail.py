@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0014_publication_listing_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='publication',
+            name='preview_page_count',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True, verbose_name='Количество страниц превью'),
+        ),
+        migrations.AddField(
+            model_name='publication',
+            name='preview_thumbnail',
+            field=models.ImageField(blank=True, editable=False, null=True, upload_to='publications/previews/thumbnails/', verbose_name='Миниатюра превью'),
+        ),
+    ]
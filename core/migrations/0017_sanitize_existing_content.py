@@ -0,0 +1,39 @@
+import bleach
+from bleach.css_sanitizer import CSSSanitizer
+from django.conf import settings
+from django.db import migrations
+
+
+def sanitize_existing_content(apps, schema_editor):
+    """
+    Очищает HTML уже сохраненных публикаций и контента страниц:
+    новые записи очищаются при сохранении (см. core/signals.py).
+    Настройки очистителя скопированы из core.sanitizer на момент создания миграции.
+    """
+    cleaner = bleach.Cleaner(
+        tags=settings.ALLOWED_TAGS,
+        attributes=settings.ALLOWED_ATTRIBUTES,
+        strip=True,
+        css_sanitizer=CSSSanitizer(),
+    )
+
+    def sanitize_html(value):
+        return cleaner.clean(value) if value else value or ''
+
+    for model_name in ('Publication', 'PageContent'):
+        model = apps.get_model('core', model_name)
+        for pk, content in model.objects.values_list('pk', 'content').iterator():
+            cleaned = sanitize_html(content)
+            if cleaned != content:
+                model.objects.filter(pk=pk).update(content=cleaned)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0016_task'),
+    ]
+
+    operations = [
+        migrations.RunPython(sanitize_existing_content, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:45
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0017_sanitize_existing_content'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='lesson',
+            name='end_date',
+            field=models.DateField(blank=True, null=True, verbose_name='Дата окончания'),
+        ),
+        migrations.AddField(
+            model_name='lesson',
+            name='repeat_weeks',
+            field=models.PositiveSmallIntegerField(default=1, verbose_name='Повторять каждые N недель'),
+        ),
+        migrations.AddField(
+            model_name='lesson',
+            name='start_date',
+            field=models.DateField(blank=True, null=True, verbose_name='Дата начала'),
+        ),
+        migrations.CreateModel(
+            name='LessonException',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(verbose_name='Дата')),
+                ('comment', models.CharField(blank=True, max_length=200, verbose_name='Комментарий')),
+                ('lesson', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='exceptions', to='core.lesson', verbose_name='Занятие')),
+            ],
+            options={
+                'verbose_name': 'Отмена занятия',
+                'verbose_name_plural': 'Отмены занятий',
+                'ordering': ['date'],
+                'constraints': [models.UniqueConstraint(fields=('lesson', 'date'), name='unique_lesson_exception_date')],
+            },
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0018_lesson_recurrence'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DeletedLesson',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('lesson_id', models.PositiveIntegerField(verbose_name='ID занятия')),
+                ('deleted_at', models.DateTimeField(auto_now_add=True, db_index=True, verbose_name='Дата удаления')),
+            ],
+            options={
+                'verbose_name': 'Удаленное занятие',
+                'verbose_name_plural': 'Удаленные занятия',
+                'ordering': ['-deleted_at'],
+            },
+        ),
+        migrations.AddField(
+            model_name='lesson',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True, verbose_name='Дата изменения'),
+        ),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:11
+
+import html
+import re
+
+from django.conf import settings
+from django.db import migrations, models
+from django.utils.html import strip_tags
+from django.utils.text import Truncator
+
+_WORD_RE = re.compile(r'\w+', re.UNICODE)
+_SPACE_RE = re.compile(r'\s+')
+
+
+def build_excerpt(content):
+    """
+    Копия core.excerpts.build_excerpt на момент создания миграции: результат
+    миграции не должен зависеть от последующих изменений модуля.
+    """
+    text = _SPACE_RE.sub(' ', html.unescape(strip_tags(content or ''))).strip()
+    excerpt = Truncator(text).words(getattr(settings, 'EXCERPT_WORDS', 50), truncate='…')
+    return excerpt, len(_WORD_RE.findall(text))
+
+
+def fill_excerpts(apps, schema_editor):
+    """
+    Вычисляет отрывок и количество слов уже сохраненных публикаций:
+    новые публикации получают их при сохранении (см. core/signals.py).
+    """
+    Publication = apps.get_model('core', 'Publication')
+    for pk, content in Publication.objects.values_list('pk', 'content').iterator():
+        excerpt, word_count = build_excerpt(content)
+        Publication.objects.filter(pk=pk).update(excerpt=excerpt, word_count=word_count)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0019_lesson_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='publication',
+            name='excerpt',
+            field=models.TextField(blank=True, editable=False, verbose_name='Отрывок'),
+        ),
+        migrations.AddField(
+            model_name='publication',
+            name='word_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Количество слов'),
+        ),
+        migrations.RunPython(fill_excerpts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:02
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0020_publication_excerpt'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='publication',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now, verbose_name='Дата изменения'),
+            preserve_default=False,
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0021_publication_updated_at'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='deletedlesson',
+            name='lesson_id',
+            field=models.PositiveBigIntegerField(verbose_name='ID занятия'),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0022_alter_deletedlesson_lesson_id'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DownloadMark',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('publication_id', models.PositiveBigIntegerField(verbose_name='ID публикации')),
+                ('visitor_id', models.CharField(max_length=64, verbose_name='Посетитель')),
+                ('downloaded_at', models.DateTimeField(db_index=True, verbose_name='Дата скачивания')),
+            ],
+            options={
+                'verbose_name': 'Отметка о скачивании',
+                'verbose_name_plural': 'Отметки о скачивании',
+                'constraints': [models.UniqueConstraint(fields=('publication_id', 'visitor_id'), name='download_mark_unique')],
+            },
+        ),
+    ]
@@ -1,3 +1,4 @@
+from django.core.exceptions import ValidationError
 from django.db import models
 from django_ckeditor_5.fields import CKEditor5Field
 
@@ -20,19 +21,51 @@ class Publication(models.Model):
         verbose_name='Категория'
         )
     created_at = models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')
+    # время последнего изменения, входит в ключ кэша страницы публикации (см. core/cache.py)
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='Дата изменения')
     presentation_file = models.FileField(upload_to='publications/presentations/', blank=True, null=True, verbose_name='Файл')
     preview_file = models.FileField(upload_to='publications/previews/', blank=True, null=True, verbose_name='Превью файл')
+    # миниатюра первой страницы превью, создается автоматически (см. core/previews.py)
+    preview_thumbnail = models.ImageField(upload_to='publications/previews/thumbnails/', blank=True, null=True,
+        editable=False, verbose_name='Миниатюра превью')
+    preview_page_count = models.PositiveIntegerField(blank=True, null=True, editable=False,
+        verbose_name='Количество страниц превью')
     is_published = models.BooleanField(default=False, verbose_name='Опубликовано')
     downloads_count = models.PositiveIntegerField(default=0,
         verbose_name='Количество скачиваний')
+    # текстовый отрывок и количество слов для ленты, вычисляются при сохранении (см. core/excerpts.py)
+    excerpt = models.TextField(blank=True, editable=False, verbose_name='Отрывок')
+    word_count = models.PositiveIntegerField(default=0, editable=False, verbose_name='Количество слов')
 
     class Meta:
         verbose_name = 'Публикация'
         verbose_name_plural = 'Публикации'
         ordering = ['-created_at']
+        indexes = [
+            # индексы для публичной ленты блога: фильтр по публикации и категории + сортировка по дате
+            models.Index(fields=['is_published', '-created_at'], name='pub_published_created_idx'),
+            models.Index(fields=['is_published', 'category', '-created_at'], name='pub_published_cat_created_idx'),
+        ]
 
     def __str__(self):
         return self.title
+
+    def save(self, *args, **kwargs):
+        """
+        Сохраняет публикацию. Если в update_fields есть content, к ним добавляются
+        excerpt и word_count, которые пересчитывает сигнал update_excerpt.
+        """
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'content' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'excerpt', 'word_count'}
+        super().save(*args, **kwargs)
+
+    @property
+    def reading_minutes(self):
+        """
+        Примерное время чтения в минутах.
+        """
+        return max(1, round(self.word_count / 180))
     
 
 class Lesson(models.Model):
@@ -52,12 +85,101 @@ class Lesson(models.Model):
     lesson_time = models.TimeField(verbose_name='Время занятия')
     students_phone = models.CharField(max_length=15, blank=True, verbose_name='Телефон ученика')
     lesson_duration = models.PositiveIntegerField(verbose_name='Продолжительность занятия (минуты)', default=60)
+    # правило повторения: занятие проходит в день недели weekday каждые repeat_weeks недель
+    # с start_date по end_date (пустые даты - без ограничения)
+    start_date = models.DateField(blank=True, null=True, verbose_name='Дата начала')
+    end_date = models.DateField(blank=True, null=True, verbose_name='Дата окончания')
+    repeat_weeks = models.PositiveSmallIntegerField(default=1, verbose_name='Повторять каждые N недель')
+    # время последнего изменения для инкрементальной выгрузки расписания (?since=)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True, verbose_name='Дата изменения')
 
     class Meta:
         verbose_name = 'Занятие'
         verbose_name_plural = 'Занятия'
         ordering = ['weekday', 'lesson_time']
 
+    def __str__(self):
+        return f'{self.students_name or "Без имени"} ({self.get_weekday_display()}, {self.lesson_time:%H:%M})'
+
+    def clean(self):
+        """
+        Проверяет, что занятие не пересекается по времени с уже существующими.
+        """
+        from .schedule import find_conflict
+
+        super().clean()
+        if self.start_date and self.end_date and self.end_date < self.start_date:
+            raise ValidationError({'end_date': 'Дата окончания раньше даты начала'})
+        if self.weekday is None or self.lesson_time is None or not self.lesson_duration:
+            return
+        # при массовом редактировании в админке старое время остальных изменяемых
+        # занятий не учитывается, их пересечения между собой проверяет формсет
+        exclude = {self.pk} | getattr(self, '_schedule_exclude', set())
+        conflict = find_conflict(
+            self.weekday, self.lesson_time, self.lesson_duration,
+            exclude=exclude, start_date=self.start_date, end_date=self.end_date,
+            repeat_weeks=self.repeat_weeks,
+        )
+        if conflict is not None:
+            raise ValidationError({
+                'lesson_time': f"Время пересекается с занятием {conflict['students_name'] or 'без имени'} "
+                               f"({conflict['lesson_time']:%H:%M}, {conflict['lesson_duration']} мин)",
+            })
+
+class LessonException(models.Model):
+    """
+    Отмена одного занятия из повторяющегося расписания.
+    """
+    lesson = models.ForeignKey(Lesson, on_delete=models.CASCADE, related_name='exceptions', verbose_name='Занятие')
+    date = models.DateField(verbose_name='Дата')
+    comment = models.CharField(max_length=200, blank=True, verbose_name='Комментарий')
+
+    class Meta:
+        verbose_name = 'Отмена занятия'
+        verbose_name_plural = 'Отмены занятий'
+        ordering = ['date']
+        constraints = [
+            models.UniqueConstraint(fields=['lesson', 'date'], name='unique_lesson_exception_date'),
+        ]
+
+    def __str__(self):
+        return f'{self.lesson} - {self.date:%d.%m.%Y}'
+
+class DeletedLesson(models.Model):
+    """
+    Отметка об удалении занятия, чтобы клиенты выгрузки расписания
+    при инкрементальной синхронизации узнали об удалении.
+    """
+    lesson_id = models.PositiveBigIntegerField(verbose_name='ID занятия')
+    deleted_at = models.DateTimeField(auto_now_add=True, db_index=True, verbose_name='Дата удаления')
+
+    class Meta:
+        verbose_name = 'Удаленное занятие'
+        verbose_name_plural = 'Удаленные занятия'
+        ordering = ['-deleted_at']
+
+    def __str__(self):
+        return f'Занятие {self.lesson_id} - {self.deleted_at:%d.%m.%Y %H:%M}'
+
+class DownloadMark(models.Model):
+    """
+    Отметка о скачивании файла публикации посетителем, чтобы повторные
+    скачивания не увеличивали счетчик (см. core/counters.py).
+    """
+    publication_id = models.PositiveBigIntegerField(verbose_name='ID публикации')
+    visitor_id = models.CharField(max_length=64, verbose_name='Посетитель')
+    downloaded_at = models.DateTimeField(db_index=True, verbose_name='Дата скачивания')
+
+    class Meta:
+        verbose_name = 'Отметка о скачивании'
+        verbose_name_plural = 'Отметки о скачивании'
+        constraints = [
+            models.UniqueConstraint(fields=['publication_id', 'visitor_id'], name='download_mark_unique'),
+        ]
+
+    def __str__(self):
+        return f'{self.visitor_id} - {self.publication_id}'
+
 class PageContent(models.Model):
     """
     Модель для хранения контента страниц.
@@ -71,4 +193,42 @@ class PageContent(models.Model):
         verbose_name_plural = 'Контент страниц'
 
     def __str__(self):
-        return self.page_name
\ No newline at end of file
+        return self.page_name
+
+class Task(models.Model):
+    """
+    Фоновая задача, выполняемая воркером (см. core/tasks.py).
+    """
+    STATUS_PENDING = 'pending'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+
+    name = models.CharField(max_length=100, verbose_name='Задача')
+    args = models.JSONField(default=list, blank=True, verbose_name='Аргументы')
+    status = models.CharField(max_length=10, choices=[
+        (STATUS_PENDING, 'В очереди'),
+        (STATUS_RUNNING, 'Выполняется'),
+        (STATUS_DONE, 'Выполнена'),
+        (STATUS_FAILED, 'Ошибка'),
+    ], default=STATUS_PENDING, verbose_name='Статус')
+    attempts = models.PositiveIntegerField(default=0, verbose_name='Попыток')
+    max_attempts = models.PositiveIntegerField(default=3, verbose_name='Максимум попыток')
+    run_after = models.DateTimeField(verbose_name='Выполнить после')
+    locked_by = models.CharField(max_length=100, blank=True, verbose_name='Воркер')
+    locked_at = models.DateTimeField(blank=True, null=True, verbose_name='Взята в работу')
+    last_error = models.TextField(blank=True, verbose_name='Последняя ошибка')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='Дата изменения')
+
+    class Meta:
+        verbose_name = 'Фоновая задача'
+        verbose_name_plural = 'Фоновые задачи'
+        ordering = ['-created_at']
+        indexes = [
+            # выборка задач воркером: очередь по статусу и времени запуска
+            models.Index(fields=['status', 'run_after'], name='task_status_run_after_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.name}{tuple(self.args)}'
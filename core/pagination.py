@@ -0,0 +1,73 @@
+"""
+Курсорная (keyset) пагинация для ленты публикаций.
+
+Вместо OFFSET и подсчета COUNT(*) следующая страница выбирается условием
+по паре (created_at, pk) последней показанной записи, что позволяет
+использовать индекс (is_published, -created_at) на любой глубине ленты.
+"""
+import base64
+import binascii
+from datetime import datetime
+
+from django.db.models import Q
+
+
+class InvalidCursor(ValueError):
+    """
+    Курсор не удалось разобрать.
+    """
+
+
+def encode_cursor(obj):
+    """
+    Кодирует позицию записи в строку курсора.
+    """
+    raw = f'{obj.created_at.isoformat()}|{obj.pk}'
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """
+    Разбирает строку курсора в пару (created_at, pk).
+    """
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        created_at, pk = base64.urlsafe_b64decode(padded.encode()).decode().split('|')
+        return datetime.fromisoformat(created_at), int(pk)
+    except (binascii.Error, UnicodeDecodeError, ValueError) as e:
+        raise InvalidCursor(cursor) from e
+
+
+def paginate_by_cursor(queryset, cursor, per_page):
+    """
+    Возвращает записи страницы, следующей за курсором, и курсор следующей страницы
+    (None, если записей больше нет). COUNT(*) не выполняется: запрашивается
+    на одну запись больше, чтобы узнать, есть ли продолжение.
+    """
+    items = list(_cursor_queryset(queryset, cursor)[:per_page + 1])
+    return _split_page(items, per_page)
+
+
+async def apaginate_by_cursor(queryset, cursor, per_page):
+    """
+    Асинхронный вариант paginate_by_cursor.
+    """
+    items = [item async for item in _cursor_queryset(queryset, cursor)[:per_page + 1]]
+    return _split_page(items, per_page)
+
+
+def _cursor_queryset(queryset, cursor):
+    queryset = queryset.order_by('-created_at', '-pk')
+    if cursor:
+        created_at, pk = decode_cursor(cursor)
+        queryset = queryset.filter(
+            Q(created_at__lt=created_at) | Q(created_at=created_at, pk__lt=pk)
+        )
+    return queryset
+
+
+def _split_page(items, per_page):
+    if len(items) > per_page:
+        items = items[:per_page]
+        return items, encode_cursor(items[-1])
+    return items, None
@@ -0,0 +1,111 @@
+"""
+Миниатюры файлов превью публикаций.
+
+Вместо встраивания полного документа в ленту блога показывается растровая
+миниатюра первой страницы, а сам документ загружается по клику.
+Изображения обрабатываются через Pillow, PDF - через PyMuPDF (пакет pymupdf),
+если он установлен. Для остальных форматов миниатюра не создается.
+"""
+import io
+import logging
+import os
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.utils import timezone
+
+try:
+    import pymupdf
+except ImportError:  # PyMuPDF не установлен - миниатюры PDF не создаются
+    pymupdf = None
+
+from PIL import Image, UnidentifiedImageError
+
+from .cache import bump_content_version
+
+logger = logging.getLogger(__name__)
+
+PDF_EXTENSIONS = {'.pdf'}
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.gif', '.webp', '.bmp', '.tif', '.tiff'}
+
+
+def _render_pdf(data):
+    """
+    Возвращает изображение первой страницы PDF и количество страниц.
+    """
+    if pymupdf is None:
+        return None, None
+    with pymupdf.open(stream=data, filetype='pdf') as document:
+        if not document.page_count:
+            return None, 0
+        page = document[0]
+        zoom = getattr(settings, 'PREVIEW_THUMBNAIL_WIDTH', 800) / page.rect.width
+        pixmap = page.get_pixmap(matrix=pymupdf.Matrix(zoom, zoom), alpha=False)
+        image = Image.open(io.BytesIO(pixmap.tobytes('png')))
+        return image, document.page_count
+
+
+def _render_image(data):
+    """
+    Возвращает изображение и количество кадров (страниц) в нем.
+    """
+    image = Image.open(io.BytesIO(data))
+    page_count = getattr(image, 'n_frames', 1)
+    image.seek(0)
+    return image, page_count
+
+
+def render_thumbnail(name, data):
+    """
+    Создает миниатюру первой страницы файла.
+    Возвращает пару (байты WebP или None, количество страниц или None).
+    """
+    extension = os.path.splitext(name)[1].lower()
+    if extension in PDF_EXTENSIONS:
+        image, page_count = _render_pdf(data)
+    elif extension in IMAGE_EXTENSIONS:
+        image, page_count = _render_image(data)
+    else:
+        return None, None
+    if image is None:
+        return None, page_count
+
+    width = getattr(settings, 'PREVIEW_THUMBNAIL_WIDTH', 800)
+    image = image.convert('RGB')
+    image.thumbnail((width, width * 4))
+    output = io.BytesIO()
+    image.save(output, format='WEBP', quality=getattr(settings, 'PREVIEW_THUMBNAIL_QUALITY', 80))
+    return output.getvalue(), page_count
+
+
+def generate_preview(publication):
+    """
+    Создает миниатюру и считает страницы превью-файла публикации.
+    Поля обновляются через update(), чтобы не вызывать сигналы сохранения повторно.
+    Выполняется в фоновой задаче core.generate_preview (см. core/tasks.py).
+    """
+    from .models import Publication
+
+    thumbnail = publication.preview_thumbnail
+    if thumbnail:
+        thumbnail.delete(save=False)
+
+    page_count = None
+    if publication.preview_file:
+        try:
+            with publication.preview_file.open('rb') as preview:
+                data = preview.read()
+            content, page_count = render_thumbnail(publication.preview_file.name, data)
+        except (OSError, RuntimeError, ValueError, UnidentifiedImageError):
+            logger.exception('Не удалось создать миниатюру для публикации %s', publication.pk)
+            content = None
+        if content is not None:
+            thumbnail.save(f'{publication.pk}.webp', ContentFile(content), save=False)
+
+    Publication.objects.filter(pk=publication.pk).update(
+        preview_thumbnail=thumbnail.name or None,
+        preview_page_count=page_count,
+        updated_at=timezone.now(),
+    )
+    # update() не вызывает сигналы, поэтому сбрасываем кэш страниц вручную
+    bump_content_version()
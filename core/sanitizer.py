@@ -0,0 +1,84 @@
+"""
+Очистка HTML от нежелательной разметки.
+
+Используется один настроенный bleach.Cleaner на поток (Cleaner не потокобезопасен)
+вместо создания очистителя при каждом сохранении. Результаты очистки
+запоминаются в LRU-кэше по SHA-256 исходного HTML, поэтому повторная очистка
+того же содержимого (например, в представлении и в сигнале pre_save) бесплатна.
+
+Теги label и input разрешены для списка задач CKEditor (кнопка todoList):
+он выводит флажки <input type="checkbox" disabled>. Остальные поля ввода
+удаляет фильтр TodoCheckboxFilter, а флажки всегда отключены.
+
+Контент очищается при записи (см. core/signals.py), в БД хранится уже
+очищенный HTML, и при выводе через |safe повторная очистка не нужна.
+"""
+import hashlib
+import threading
+from collections import OrderedDict
+
+import bleach
+from bleach.css_sanitizer import CSSSanitizer
+from bleach.html5lib_shim import Filter
+from django.conf import settings
+
+_local = threading.local()
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+class TodoCheckboxFilter(Filter):
+    """
+    Оставляет из полей ввода только отключенные флажки списка задач CKEditor.
+    """
+
+    def __iter__(self):
+        for token in super().__iter__():
+            if token['type'] in ('StartTag', 'EmptyTag') and token['name'] == 'input':
+                if token['data'].get((None, 'type')) != 'checkbox':
+                    continue
+                token['data'][(None, 'disabled')] = 'disabled'
+            yield token
+
+
+def get_cleaner():
+    """
+    Возвращает настроенный очиститель HTML для текущего потока.
+    """
+    cleaner = getattr(_local, 'cleaner', None)
+    if cleaner is None:
+        cleaner = _local.cleaner = bleach.Cleaner(
+            tags=settings.ALLOWED_TAGS,
+            attributes=settings.ALLOWED_ATTRIBUTES,
+            strip=True,
+            css_sanitizer=CSSSanitizer(),
+            filters=[TodoCheckboxFilter],
+        )
+    return cleaner
+
+
+def sanitize_html(value):
+    """
+    Возвращает очищенный HTML. Результат берется из LRU-кэша, если такое содержимое уже очищалось.
+    """
+    if not value:
+        return value or ''
+    key = hashlib.sha256(value.encode()).digest()
+    with _cache_lock:
+        cleaned = _cache.get(key)
+        if cleaned is not None:
+            _cache.move_to_end(key)
+            return cleaned
+
+    cleaned = get_cleaner().clean(value)
+
+    with _cache_lock:
+        _cache[key] = cleaned
+        _cache.move_to_end(key)
+        # очистка идемпотентна: запоминаем и результат, чтобы повторная очистка
+        # уже очищенного HTML (например, в pre_save после представления) тоже попадала в кэш
+        _cache[hashlib.sha256(cleaned.encode()).digest()] = cleaned
+        # вытесняем давно не использованные записи
+        while len(_cache) > getattr(settings, 'SANITIZER_CACHE_SIZE', 256):
+            _cache.popitem(last=False)
+    return cleaned
@@ -0,0 +1,498 @@
+"""
+Расписание занятий.
+
+Недельная сетка занятий строится один раз из нужных для отображения полей,
+хранится в кэше и сбрасывается сигналами при изменении занятий (см. core/signals.py),
+поэтому страница расписания обходится одним чтением из кэша.
+
+Для проверки пересечений занятий по каждому дню недели строится индекс
+интервалов (начало и конец в минутах от полуночи), отсортированный по началу,
+с префиксным максимумом концов: поиск пересечения выполняется бинарным поиском.
+
+Расписание по месяцам строится из правил повторения занятий (день недели,
+каждые repeat_weeks недель с start_date по end_date, кроме отмененных дат):
+генератор разворачивает занятия только в видимом окне месяца. Развернутые
+месяцы кэшируются с двумя версиями в ключе: общим поколением расписания и
+версией месяца. Изменение, ограниченное датами (отмена занятия, занятие с датами
+начала и окончания), меняет версии только затронутых месяцев, а изменение
+занятия без даты начала или окончания затрагивает все месяцы и меняет поколение.
+Версии меняются после фиксации транзакции, а при построении месяца читаются
+до чтения занятий, поэтому месяц, построенный по старым данным, не попадает
+в кэш под новой версией. Старые записи не удаляются, а перестают читаться.
+"""
+import calendar
+from bisect import bisect_left
+from datetime import date, datetime, time, timedelta
+from math import gcd
+from time import time_ns
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Max
+from django.utils import timezone
+
+from .metrics import count_cache
+
+WEEKLY_SCHEDULE_KEY = 'schedule:weekly'
+LAST_MODIFIED_KEY = 'schedule:last_modified'
+INTERVAL_INDEX_KEY = 'schedule:intervals'
+SCHEDULE_GENERATION_KEY = 'schedule:generation'
+MONTH_VERSION_KEY = 'schedule:month_version:{:04d}-{:02d}'
+MONTH_SCHEDULE_KEY = 'schedule:month:{:x}:{:x}:{:04d}-{:02d}'
+# Изменение, затрагивающее больше месяцев, меняет поколение расписания
+MAX_INVALIDATED_MONTHS = 24
+
+# Поля занятия, которые нужны для вывода и разворачивания расписания
+SCHEDULE_FIELDS = (
+    'id', 'weekday', 'students_name', 'lesson_time', 'lesson_duration',
+    'start_date', 'end_date', 'repeat_weeks',
+)
+
+
+def _seconds_until_midnight():
+    """
+    Возвращает количество секунд до ближайшей полуночи по местному времени.
+    """
+    now = timezone.localtime()
+    midnight = datetime.combine(now.date() + timedelta(days=1), time.min, tzinfo=now.tzinfo)
+    return max(int((midnight - now).total_seconds()), 1)
+
+
+def _group_by_weekday(queryset):
+    """
+    Группирует занятия по дням недели: список (номер дня, название дня, список занятий).
+    """
+    from .models import Lesson
+
+    lessons_by_weekday = {weekday_num: [] for weekday_num, _ in Lesson.weekday.field.choices}
+    for lesson in queryset.order_by('weekday', 'lesson_time').values(*SCHEDULE_FIELDS):
+        lessons_by_weekday[lesson['weekday']].append(lesson)
+    return [
+        (weekday_num, weekday_name, lessons_by_weekday[weekday_num])
+        for weekday_num, weekday_name in Lesson.weekday.field.choices
+    ]
+
+
+def build_weekly_schedule():
+    """
+    Строит недельную сетку: список (номер дня, название дня, список занятий).
+    """
+    from .models import Lesson
+
+    # закончившиеся занятия в недельной сетке не показываем
+    return _group_by_weekday(Lesson.objects.exclude(end_date__lt=timezone.localdate()))
+
+
+def get_weekly_schedule():
+    """
+    Возвращает недельную сетку занятий из кэша, при необходимости строя ее заново.
+    """
+    schedule = cache.get(WEEKLY_SCHEDULE_KEY)
+    count_cache('schedule', schedule is not None)
+    if schedule is None:
+        schedule = build_weekly_schedule()
+        # сетка зависит от текущей даты (закончившиеся занятия), поэтому живет до полуночи
+        cache.set(WEEKLY_SCHEDULE_KEY, schedule, _seconds_until_midnight())
+    return schedule
+
+
+async def aget_weekly_schedule():
+    """
+    Асинхронный вариант get_weekly_schedule: сетка читается из кэша без потока,
+    построение при промахе кэша выполняется в потоке.
+    """
+    schedule = await cache.aget(WEEKLY_SCHEDULE_KEY)
+    if schedule is None:
+        # промах кэша учитывает get_weekly_schedule
+        schedule = await sync_to_async(get_weekly_schedule)()
+    else:
+        count_cache('schedule', True)
+    return schedule
+
+
+def invalidate_schedule():
+    """
+    Сбрасывает закэшированное расписание, индексы интервалов и время последнего изменения.
+    """
+    cache.delete_many([WEEKLY_SCHEDULE_KEY, INTERVAL_INDEX_KEY, LAST_MODIFIED_KEY])
+
+
+def get_last_modified():
+    """
+    Возвращает время последнего изменения расписания (изменение или удаление занятия)
+    или None, если занятий еще не было.
+    """
+    from .models import DeletedLesson, Lesson
+
+    last_modified = cache.get(LAST_MODIFIED_KEY)
+    if last_modified is None:
+        changed = [
+            Lesson.objects.aggregate(value=Max('updated_at'))['value'],
+            DeletedLesson.objects.aggregate(value=Max('deleted_at'))['value'],
+        ]
+        last_modified = max((value for value in changed if value is not None), default=False)
+        # False вместо None, чтобы закэшировать и пустое расписание
+        cache.set(LAST_MODIFIED_KEY, last_modified, None)
+    return last_modified or None
+
+
+def get_version(last_modified):
+    """
+    Возвращает версию расписания для ключей кэша - время последнего изменения в микросекундах.
+    """
+    return int(last_modified.timestamp() * 1_000_000) if last_modified else 0
+
+
+# --- Индекс интервалов занятий ---
+
+def to_minutes(value):
+    """
+    Переводит время суток в минуты от полуночи.
+    """
+    return value.hour * 60 + value.minute
+
+
+def from_minutes(minutes):
+    """
+    Переводит минуты от полуночи во время суток.
+    """
+    minutes = min(minutes, 24 * 60 - 1)
+    return time(minutes // 60, minutes % 60)
+
+
+class IntervalIndex:
+    """
+    Индекс интервалов одного дня недели.
+
+    Интервалы (start, end, item) отсортированы по началу; для каждой позиции хранится
+    максимальный конец среди интервалов до нее включительно. Интервал [start, end)
+    пересекается с сохраненными, только если среди интервалов, начавшихся раньше end,
+    максимальный конец больше start. Последний интервал, начавшийся раньше end, находится
+    бинарным поиском за O(log n), после чего find_overlap идет от него назад, поэтому поиск
+    занимает O(log n + k), где k - количество просмотренных интервалов. Без исключений
+    и при непересекающихся интервалах k не больше 1. Когда интервалы, пересекающиеся
+    с [start, end), отбрасываются через exclude или accept (например, занятия других
+    недель или периодов), либо их накрывает длинный интервал, в худшем случае
+    просматриваются все n.
+    """
+
+    def __init__(self, intervals=()):
+        self.intervals = sorted(intervals, key=lambda interval: (interval[0], interval[1]))
+        self.starts = [start for start, _, _ in self.intervals]
+        self.max_ends = []
+        max_end = None
+        for _, end, _ in self.intervals:
+            max_end = end if max_end is None else max(max_end, end)
+            self.max_ends.append(max_end)
+
+    def __len__(self):
+        return len(self.intervals)
+
+    def find_overlap(self, start, end, exclude=(), accept=None):
+        """
+        Возвращает item первого найденного интервала, пересекающегося с [start, end),
+        или None. Интервалы, чей item["id"] входит в exclude или для которых
+        accept(item) ложно, не учитываются. Соседние интервалы (конец одного
+        равен началу другого) не пересекаются.
+
+        Граница O(log n) здесь не достигается: exclude и accept - произвольные
+        условия, которые нельзя учесть в индексе, а find_conflict и проверка
+        в админке передают accept всегда. Поэтому после бинарного поиска интервалы
+        просматриваются назад, и поиск занимает O(log n + k) (см. описание класса).
+        """
+        position = bisect_left(self.starts, end) - 1
+        # идем назад, пока среди оставшихся интервалов есть заканчивающиеся после start;
+        # отброшенные через exclude и accept интервалы просматриваются по одному
+        while position >= 0 and self.max_ends[position] > start:
+            interval_start, interval_end, item = self.intervals[position]
+            if (interval_end > start and item.get('id') not in exclude
+                    and (accept is None or accept(item))):
+                return item
+            position -= 1
+        return None
+
+    def free_windows(self, day_start, day_end, duration):
+        """
+        Возвращает свободные промежутки (start, end) в пределах [day_start, day_end)
+        длиной не менее duration минут.
+        """
+        windows = []
+        cursor = day_start
+        for interval_start, interval_end, _ in self.intervals:
+            if interval_start >= day_end:
+                break
+            if interval_start - cursor >= duration:
+                windows.append((cursor, interval_start))
+            cursor = max(cursor, interval_end)
+        if day_end - cursor >= duration:
+            windows.append((cursor, day_end))
+        return windows
+
+
+def build_interval_indexes():
+    """
+    Строит индексы интервалов по всем дням недели из недельной сетки.
+    """
+    indexes = {}
+    for weekday_num, _, lessons in get_weekly_schedule():
+        indexes[weekday_num] = IntervalIndex(
+            (to_minutes(lesson['lesson_time']),
+             to_minutes(lesson['lesson_time']) + lesson['lesson_duration'],
+             lesson)
+            for lesson in lessons
+        )
+    return indexes
+
+
+def get_interval_index(weekday):
+    """
+    Возвращает индекс интервалов занятий для дня недели.
+    """
+    indexes = cache.get(INTERVAL_INDEX_KEY)
+    if indexes is None:
+        indexes = build_interval_indexes()
+        cache.set(INTERVAL_INDEX_KEY, indexes, _seconds_until_midnight())
+    return indexes.get(weekday) or IntervalIndex()
+
+
+def periods_overlap(start_a, end_a, start_b, end_b):
+    """
+    Проверяет пересечение периодов дат, пустая граница означает отсутствие ограничения.
+    """
+    return (end_b is None or start_a is None or start_a <= end_b) and \
+        (end_a is None or start_b is None or start_b <= end_a)
+
+
+def recurrences_overlap(a, b):
+    """
+    Проверяет, что у двух занятий одного дня недели (словари с start_date, end_date,
+    repeat_weeks, weekday) есть общая дата. Занятия с шагом повторения p и q недель
+    встречаются, только если их недели, отсчитанные от RECURRENCE_EPOCH, равны
+    по модулю НОД(p, q); тогда первая общая неделя ищется не более чем за q / НОД(p, q)
+    шагов и должна попасть в периоды действия обоих занятий.
+    """
+    if not periods_overlap(a['start_date'], a['end_date'], b['start_date'], b['end_date']):
+        return False
+    step_a, step_b = repeat_step(a), repeat_step(b)
+    first_a = first_occurrence(a)
+    week_a, week_b = epoch_week(first_a), epoch_week(first_occurrence(b))
+    if (week_a - week_b) % gcd(step_a, step_b):
+        return False
+    starts = [epoch_week(first_occurrence(lesson)) for lesson in (a, b) if lesson['start_date']]
+    if not starts:
+        # без дат начала общие недели повторяются сколь угодно давно
+        return True
+    # первая неделя занятия a не раньше начала обоих занятий, затем до совпадения с b
+    week = max(starts) + (week_a - max(starts)) % step_a
+    while (week - week_b) % step_b:
+        week += step_a
+    day = first_a + timedelta(weeks=week - week_a)
+    return all(lesson['end_date'] is None or day <= lesson['end_date'] for lesson in (a, b))
+
+
+def find_conflict(weekday, lesson_time, duration, exclude=(), start_date=None, end_date=None, repeat_weeks=1):
+    """
+    Возвращает занятие (словарь полей SCHEDULE_FIELDS), пересекающееся по времени
+    с новым занятием, или None, если время свободно. Занятия, у которых нет общих
+    дат (периоды действия не пересекаются или они проходят в разные недели
+    повторения), не мешают друг другу.
+    """
+    lesson = {'weekday': weekday, 'start_date': start_date, 'end_date': end_date, 'repeat_weeks': repeat_weeks}
+    start = to_minutes(lesson_time)
+    return get_interval_index(weekday).find_overlap(
+        start, start + duration, exclude=exclude,
+        accept=lambda item: recurrences_overlap(lesson, item),
+    )
+
+
+def find_free_slots(weekday, duration):
+    """
+    Возвращает свободные промежутки дня недели длиной не менее duration минут
+    в пределах рабочего дня SCHEDULE_DAY_START - SCHEDULE_DAY_END.
+    """
+    day_start = to_minutes(time.fromisoformat(getattr(settings, 'SCHEDULE_DAY_START', '08:00')))
+    day_end = to_minutes(time.fromisoformat(getattr(settings, 'SCHEDULE_DAY_END', '21:00')))
+    return [
+        (from_minutes(start), from_minutes(end))
+        for start, end in get_interval_index(weekday).free_windows(day_start, day_end, duration)
+    ]
+
+
+# --- Расписание по месяцам ---
+
+# Точка отсчета недель повторения для занятий без даты начала (понедельник)
+RECURRENCE_EPOCH = date(2024, 1, 1)
+
+
+def first_occurrence(lesson):
+    """
+    Возвращает дату первого занятия: ближайший день недели weekday, начиная с start_date.
+    """
+    start = lesson['start_date'] or RECURRENCE_EPOCH
+    return start + timedelta(days=(lesson['weekday'] - start.weekday()) % 7)
+
+
+def epoch_week(day):
+    """
+    Возвращает номер недели даты, отсчитанный от RECURRENCE_EPOCH.
+    """
+    return (day - RECURRENCE_EPOCH).days // 7
+
+
+def repeat_step(lesson):
+    """
+    Возвращает шаг повторения занятия в неделях (не меньше 1).
+    """
+    return max(lesson['repeat_weeks'] or 1, 1)
+
+
+def iter_occurrences(lesson, start, end, cancelled=()):
+    """
+    Генератор дат занятия в периоде [start, end] по его правилу повторения,
+    кроме дат из cancelled.
+    """
+    first = max(start, lesson['start_date'] or start)
+    last = min(end, lesson['end_date'] or end)
+    if first > last:
+        return
+    day = first + timedelta(days=(lesson['weekday'] - first.weekday()) % 7)
+    step = repeat_step(lesson)
+    if step > 1:
+        # выравниваем по неделям повторения, отсчитанным от первого занятия
+        day += timedelta(weeks=-((day - first_occurrence(lesson)).days // 7) % step)
+    while day <= last:
+        if day not in cancelled:
+            yield day
+        day += timedelta(weeks=step)
+
+
+def build_month_schedule(year, month):
+    """
+    Строит календарь месяца: список недель, каждая неделя - список из 7 дней
+    вида {'date', 'in_month', 'lessons'}. Занятия разворачиваются только для дат,
+    видимых в календаре месяца.
+    """
+    from .models import Lesson, LessonException
+
+    weeks = calendar.Calendar(firstweekday=0).monthdatescalendar(year, month)
+    window_start, window_end = weeks[0][0], weeks[-1][-1]
+
+    cancelled = {}
+    exceptions = LessonException.objects.filter(date__range=(window_start, window_end))
+    for lesson_id, cancelled_date in exceptions.values_list('lesson_id', 'date'):
+        cancelled.setdefault(lesson_id, set()).add(cancelled_date)
+
+    lessons_by_date = {}
+    # занятия, действующие в окне календаря (включая уже закончившиеся)
+    lessons = Lesson.objects.exclude(end_date__lt=window_start).exclude(start_date__gt=window_end)
+    for _, _, weekday_lessons in _group_by_weekday(lessons):
+        for lesson in weekday_lessons:
+            for day in iter_occurrences(lesson, window_start, window_end, cancelled.get(lesson['id'], ())):
+                lessons_by_date.setdefault(day, []).append(lesson)
+
+    return [
+        [
+            {'date': day, 'in_month': day.month == month, 'lessons': lessons_by_date.get(day, [])}
+            for day in week
+        ]
+        for week in weeks
+    ]
+
+
+def _month_version_keys(year, month):
+    return [SCHEDULE_GENERATION_KEY, MONTH_VERSION_KEY.format(year, month)]
+
+
+def _new_version():
+    return time_ns()
+
+
+def month_schedule_key(year, month):
+    """
+    Возвращает ключ кэша календаря месяца с текущими версиями расписания и месяца.
+    Потерянная версия (очистка или вытеснение записей кэша) заменяется новой,
+    а не нулем, чтобы не прочитать запись, сохраненную до изменения.
+    """
+    keys = _month_version_keys(year, month)
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            version = _new_version()
+            versions[key] = version if cache.add(key, version, None) else cache.get(key, version)
+    return MONTH_SCHEDULE_KEY.format(*(versions[key] for key in keys), year, month)
+
+
+async def amonth_schedule_key(year, month):
+    """
+    Асинхронный вариант month_schedule_key.
+    """
+    keys = _month_version_keys(year, month)
+    versions = await cache.aget_many(keys)
+    for key in keys:
+        if key not in versions:
+            version = _new_version()
+            versions[key] = version if await cache.aadd(key, version, None) else await cache.aget(key, version)
+    return MONTH_SCHEDULE_KEY.format(*(versions[key] for key in keys), year, month)
+
+
+def touched_months(periods):
+    """
+    Возвращает множество месяцев (год, месяц), календари которых показывают даты
+    из периодов (start, end), или None, если период не ограничен датами или
+    месяцев больше MAX_INVALIDATED_MONTHS. Календарь месяца показывает и до шести
+    дней соседних месяцев, поэтому период расширяется на неделю в обе стороны.
+    """
+    months = set()
+    for start, end in periods:
+        if start is None or end is None:
+            return None
+        first, last = start - timedelta(days=6), end + timedelta(days=6)
+        year, month = first.year, first.month
+        while (year, month) <= (last.year, last.month):
+            months.add((year, month))
+            if len(months) > MAX_INVALIDATED_MONTHS:
+                return None
+            year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return months
+
+
+def invalidate_month_schedules(periods=None):
+    """
+    Делает недействительными календари месяцев, затронутых периодами (start, end).
+    Без периодов или при неограниченном периоде сбрасываются все месяцы.
+    Вызывается после фиксации транзакции (см. core/signals.py).
+    """
+    months = touched_months(periods) if periods is not None else None
+    version = _new_version()
+    if months is None:
+        cache.set(SCHEDULE_GENERATION_KEY, version, None)
+    else:
+        cache.set_many({MONTH_VERSION_KEY.format(year, month): version for year, month in months}, None)
+
+
+def get_month_schedule(year, month):
+    """
+    Возвращает календарь месяца из кэша, при необходимости строя его заново.
+    Ключ содержит версии расписания и месяца, поэтому сбрасывать записи не нужно.
+    """
+    key = month_schedule_key(year, month)
+    weeks = cache.get(key)
+    count_cache('schedule_month', weeks is not None)
+    if weeks is None:
+        weeks = build_month_schedule(year, month)
+        cache.set(key, weeks, getattr(settings, 'SCHEDULE_MONTH_CACHE_TIMEOUT', 60 * 60 * 24))
+    return weeks
+
+
+async def aget_month_schedule(year, month):
+    """
+    Асинхронный вариант get_month_schedule.
+    """
+    key = await amonth_schedule_key(year, month)
+    weeks = await cache.aget(key)
+    count_cache('schedule_month', weeks is not None)
+    if weeks is None:
+        weeks = await sync_to_async(build_month_schedule)(year, month)
+        await cache.aset(key, weeks, getattr(settings, 'SCHEDULE_MONTH_CACHE_TIMEOUT', 60 * 60 * 24))
+    return weeks
@@ -0,0 +1,303 @@
+"""
+Полнотекстовый поиск по публикациям.
+
+На SQLite индекс хранится в виртуальной таблице FTS5, на PostgreSQL -
+в таблице с колонкой tsvector и GIN-индексом. Индекс содержит заголовок
+и текст публикации без HTML-разметки и обновляется сигналами модели
+Publication (см. core/signals.py).
+"""
+import html
+import logging
+import re
+
+from django.conf import settings
+from django.db import DatabaseError, connection, transaction
+from django.utils.html import strip_tags
+
+logger = logging.getLogger(__name__)
+
+FTS_TABLE = 'core_publication_fts'
+PG_TABLE = 'core_publication_search'
+
+_WORD_RE = re.compile(r'\w+', re.UNICODE)
+
+
+# --- Стемминг для русского языка (упрощенный алгоритм Snowball) ---
+
+_VOWELS = 'аеиоуыэюя'
+
+_PERFECTIVE_GERUND = (
+    [('вшись', True), ('вши', True), ('в', True)]
+    + [(e, False) for e in ('ившись', 'ывшись', 'ивши', 'ывши', 'ив', 'ыв')]
+)
+_ADJECTIVE = [(e, False) for e in (
+    'ими', 'ыми', 'его', 'ого', 'ему', 'ому', 'ее', 'ие', 'ые', 'ое', 'ей', 'ий',
+    'ый', 'ой', 'ем', 'им', 'ым', 'ом', 'их', 'ых', 'ую', 'юю', 'ая', 'яя', 'ою', 'ею',
+)]
+_PARTICIPLE = (
+    [(e, True) for e in ('ем', 'нн', 'вш', 'ющ', 'щ')]
+    + [(e, False) for e in ('ивш', 'ывш', 'ующ')]
+)
+_REFLEXIVE = [('ся', False), ('сь', False)]
+_VERB = (
+    [(e, True) for e in (
+        'ла', 'на', 'ете', 'йте', 'ли', 'й', 'л', 'ем', 'н', 'ло', 'но', 'ет', 'ют',
+        'ны', 'ть', 'ешь', 'нно',
+    )]
+    + [(e, False) for e in (
+        'ила', 'ыла', 'ена', 'ейте', 'уйте', 'ите', 'или', 'ыли', 'ей', 'уй', 'ил',
+        'ыл', 'им', 'ым', 'ен', 'ило', 'ыло', 'ено', 'ят', 'ует', 'уют', 'ит', 'ыт',
+        'ены', 'ить', 'ыть', 'ишь', 'ую', 'ю',
+    )]
+)
+_NOUN = [(e, False) for e in (
+    'иями', 'ями', 'ами', 'ией', 'иям', 'ием', 'иях', 'ев', 'ов', 'ие', 'ье', 'еи',
+    'ии', 'ей', 'ой', 'ий', 'ям', 'ем', 'ам', 'ом', 'ах', 'ях', 'ию', 'ью', 'ия',
+    'ья', 'а', 'е', 'и', 'й', 'о', 'у', 'ы', 'ь', 'ю', 'я',
+)]
+_SUPERLATIVE = [('ейше', False), ('ейш', False)]
+_DERIVATIONAL = [('ость', False), ('ост', False)]
+
+
+def _sorted(endings):
+    return sorted(endings, key=lambda item: len(item[0]), reverse=True)
+
+
+_PERFECTIVE_GERUND = _sorted(_PERFECTIVE_GERUND)
+_ADJECTIVE = _sorted(_ADJECTIVE)
+_PARTICIPLE = _sorted(_PARTICIPLE)
+_VERB = _sorted(_VERB)
+_NOUN = _sorted(_NOUN)
+
+
+def _region(word, start):
+    """
+    Возвращает позицию после первой согласной, следующей за гласной, начиная с start.
+    """
+    for i in range(start + 1, len(word)):
+        if word[i] not in _VOWELS and word[i - 1] in _VOWELS:
+            return i + 1
+    return len(word)
+
+
+def _remove_ending(word, start, endings):
+    """
+    Удаляет самое длинное окончание из endings, целиком лежащее в области start.
+    Окончания с флагом True должны предваряться буквой "а" или "я".
+    """
+    for ending, after_a in endings:
+        cut = len(word) - len(ending)
+        if cut < start or not word.endswith(ending):
+            continue
+        if after_a and (cut - 1 < start or word[cut - 1] not in 'ая'):
+            continue
+        return word[:cut]
+    return None
+
+
+def stem(word):
+    """
+    Приводит русское слово к основе. Слова на других языках возвращаются без изменений.
+    """
+    word = word.lower().replace('ё', 'е')
+    rv = next((i + 1 for i, ch in enumerate(word) if ch in _VOWELS), len(word))
+    if rv >= len(word):
+        return word
+    r2 = _region(word, _region(word, 0))
+
+    # Шаг 1: деепричастия, либо возвратные + прилагательные/глаголы/существительные
+    result = _remove_ending(word, rv, _PERFECTIVE_GERUND)
+    if result is None:
+        word = _remove_ending(word, rv, _REFLEXIVE) or word
+        result = _remove_ending(word, rv, _ADJECTIVE)
+        if result is not None:
+            result = _remove_ending(result, rv, _PARTICIPLE) or result
+        else:
+            result = _remove_ending(word, rv, _VERB)
+            if result is None:
+                result = _remove_ending(word, rv, _NOUN)
+    word = word if result is None else result
+
+    # Шаг 2: окончание "и"
+    if word.endswith('и') and len(word) - 1 >= rv:
+        word = word[:-1]
+
+    # Шаг 3: словообразовательные суффиксы в R2
+    word = _remove_ending(word, r2, _DERIVATIONAL) or word
+
+    # Шаг 4: превосходная степень, двойное "н", мягкий знак
+    if word.endswith('нн') and len(word) - 2 >= rv:
+        return word[:-1]
+    superlative = _remove_ending(word, rv, _SUPERLATIVE)
+    if superlative is not None:
+        word = superlative
+        if word.endswith('нн') and len(word) - 2 >= rv:
+            word = word[:-1]
+        return word
+    if word.endswith('ь') and len(word) - 1 >= rv:
+        word = word[:-1]
+    return word
+
+
+def to_plain_text(value):
+    """
+    Очищает HTML от тегов и сущностей для индексации.
+    """
+    return html.unescape(strip_tags(value or ''))
+
+
+def tokenize(text):
+    """
+    Разбивает текст на слова и приводит их к основам.
+    """
+    return [stem(word) for word in _WORD_RE.findall(text.lower())]
+
+
+def _stemmed(text):
+    return ' '.join(tokenize(text))
+
+
+# --- Работа с индексом ---
+
+def _backend():
+    """
+    Возвращает используемый механизм поиска в зависимости от СУБД.
+    """
+    return {'sqlite': 'fts5', 'postgresql': 'postgres'}.get(connection.vendor)
+
+
+def _index_rows(cursor, rows):
+    """
+    Записывает в индекс строки (pk, title, content).
+    """
+    backend = _backend()
+    if backend == 'fts5':
+        cursor.executemany(
+            f'INSERT INTO {FTS_TABLE} (rowid, title, content) VALUES (%s, %s, %s)',
+            [(pk, _stemmed(to_plain_text(title)), _stemmed(to_plain_text(content)))
+             for pk, title, content in rows],
+        )
+    elif backend == 'postgres':
+        cursor.executemany(
+            f"INSERT INTO {PG_TABLE} (publication_id, document) VALUES (%s, "
+            f"setweight(to_tsvector('russian', %s), 'A') || "
+            f"setweight(to_tsvector('russian', %s), 'B')) "
+            f"ON CONFLICT (publication_id) DO UPDATE SET document = EXCLUDED.document",
+            [(pk, to_plain_text(title), to_plain_text(content)) for pk, title, content in rows],
+        )
+
+
+def _delete_rows(cursor, pks):
+    backend = _backend()
+    if backend == 'fts5':
+        cursor.executemany(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [(pk,) for pk in pks])
+    elif backend == 'postgres':
+        cursor.executemany(f'DELETE FROM {PG_TABLE} WHERE publication_id = %s', [(pk,) for pk in pks])
+
+
+def index_publication(publication):
+    """
+    Добавляет или обновляет публикацию в поисковом индексе.
+    """
+    if _backend() is None:
+        return
+    try:
+        # точка сохранения: ошибка индекса не должна прерывать внешнюю транзакцию
+        with transaction.atomic(), connection.cursor() as cursor:
+            _delete_rows(cursor, [publication.pk])
+            _index_rows(cursor, [(publication.pk, publication.title, publication.content)])
+    except DatabaseError:
+        logger.exception('Не удалось обновить поисковый индекс для публикации %s', publication.pk)
+
+
+def remove_publication(pk):
+    """
+    Удаляет публикацию из поискового индекса.
+    """
+    if _backend() is None:
+        return
+    try:
+        with transaction.atomic(), connection.cursor() as cursor:
+            _delete_rows(cursor, [pk])
+    except DatabaseError:
+        logger.exception('Не удалось удалить публикацию %s из поискового индекса', pk)
+
+
+def rebuild_index(batch_size=500, model=None):
+    """
+    Полностью перестраивает поисковый индекс пакетами по batch_size записей.
+    Возвращает количество проиндексированных публикаций.
+    """
+    if model is None:
+        from .models import Publication as model
+
+    backend = _backend()
+    if backend is None:
+        return 0
+    table = FTS_TABLE if backend == 'fts5' else PG_TABLE
+    total = 0
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {table}')
+        batch = []
+        rows = model.objects.values_list('pk', 'title', 'content').iterator(chunk_size=batch_size)
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= batch_size:
+                _index_rows(cursor, batch)
+                total += len(batch)
+                batch = []
+        if batch:
+            _index_rows(cursor, batch)
+            total += len(batch)
+    return total
+
+
+def search(query, limit=None, category=None, published_only=True):
+    """
+    Выполняет поиск и возвращает список pk публикаций, отсортированный по релевантности.
+    category - номер категории (int) или None.
+    Фильтры по категории и публикации применяются в том же запросе до LIMIT,
+    чтобы ограничение не отсекало подходящие записи.
+    Возвращает None, если полнотекстовый поиск недоступен и нужен запасной вариант.
+    """
+    from .models import Publication
+
+    limit = limit or getattr(settings, 'SEARCH_RESULTS_LIMIT', 200)
+    backend = _backend()
+    filters, params = [], []
+    if published_only:
+        filters.append('p.is_published')
+    if category is not None:
+        filters.append('p.category = %s')
+        params.append(category)
+    where = ''.join(f' AND {condition}' for condition in filters)
+    try:
+        with connection.cursor() as cursor:
+            if backend == 'fts5':
+                terms = tokenize(query)
+                if not terms:
+                    return []
+                # каждое слово ищем по префиксу основы, слова объединяются через AND
+                match = ' '.join('"%s"*' % term.replace('"', '') for term in terms)
+                cursor.execute(
+                    f'SELECT {FTS_TABLE}.rowid FROM {FTS_TABLE} '
+                    f'JOIN {Publication._meta.db_table} p ON p.id = {FTS_TABLE}.rowid '
+                    f'WHERE {FTS_TABLE} MATCH %s{where} '
+                    f'ORDER BY bm25({FTS_TABLE}, 10.0, 1.0) LIMIT %s',
+                    [match, *params, limit],
+                )
+            elif backend == 'postgres':
+                cursor.execute(
+                    f"SELECT s.publication_id FROM {PG_TABLE} s "
+                    f"JOIN {Publication._meta.db_table} p ON p.id = s.publication_id, "
+                    f"websearch_to_tsquery('russian', %s) AS query "
+                    f"WHERE s.document @@ query{where} "
+                    f"ORDER BY ts_rank_cd(s.document, query) DESC LIMIT %s",
+                    [query, *params, limit],
+                )
+            else:
+                return None
+            return [row[0] for row in cursor.fetchall()]
+    except DatabaseError:
+        logger.exception('Ошибка полнотекстового поиска, используется поиск по вхождению')
+        return None
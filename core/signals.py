@@ -0,0 +1,219 @@
+from django.contrib.sessions.models import Session
+from django.db import transaction
+from django.db.models.signals import post_delete, post_migrate, post_save, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from . import metrics, search, tasks
+from .cache import bump_content_version, invalidate_page_content
+from .excerpts import build_excerpt
+from .models import DeletedLesson, Lesson, LessonException, PageContent, Publication
+from .sanitizer import sanitize_html
+from .schedule import invalidate_month_schedules, invalidate_schedule
+
+# Миграция, создающая таблицу поискового индекса
+SEARCH_INDEX_MIGRATION = ('core', '0013_publication_search_index')
+
+# Поля публикации, изменение которых не влияет на поисковый индекс и контент страниц
+SERVICE_FIELDS = frozenset({'downloads_count'})
+
+
+def is_service_update(update_fields):
+    """
+    Проверяет, что сохранение затронуло только служебные поля (например, счетчик скачиваний).
+    """
+    return bool(update_fields) and SERVICE_FIELDS.issuperset(update_fields)
+
+
+@receiver(post_save, sender=Publication)
+def update_publication_search_index(sender, instance, raw=False, update_fields=None, **kwargs):
+    """
+    Обновляет поисковый индекс после сохранения публикации.
+    """
+    # при загрузке фикстур (loaddata) индекс перестраивается командой rebuild_search_index
+    if raw or is_service_update(update_fields):
+        return
+    search.index_publication(instance)
+
+
+@receiver(post_delete, sender=Publication)
+def remove_publication_from_search_index(sender, instance, **kwargs):
+    """
+    Удаляет публикацию из поискового индекса после ее удаления.
+    """
+    search.remove_publication(instance.pk)
+
+
+@receiver(post_migrate)
+def fill_search_index_after_migrate(sender, plan=None, **kwargs):
+    """
+    Индексирует существующие публикации, если только что применена миграция,
+    создающая поисковый индекс: сама миграция индексацию не выполняет.
+    """
+    if sender.name != 'core' or not plan:
+        return
+    if any((migration.app_label, migration.name) == SEARCH_INDEX_MIGRATION and not backwards
+           for migration, backwards in plan):
+        search.rebuild_index()
+
+
+@receiver(post_save, sender=PageContent)
+@receiver(post_delete, sender=PageContent)
+def invalidate_page_content_cache(sender, instance, **kwargs):
+    """
+    Сбрасывает кэш контента страницы после его изменения или удаления.
+    """
+    invalidate_page_content(instance.page_for)
+
+
+@receiver(post_save, sender=Publication)
+@receiver(post_save, sender=Lesson)
+@receiver(post_save, sender=LessonException)
+@receiver(post_save, sender=PageContent)
+@receiver(post_delete, sender=Publication)
+@receiver(post_delete, sender=Lesson)
+@receiver(post_delete, sender=LessonException)
+@receiver(post_delete, sender=PageContent)
+def update_content_version(sender, update_fields=None, **kwargs):
+    """
+    Меняет версию контента сайта, чтобы сбросить кэш страниц для анонимных посетителей.
+    """
+    if sender is Publication and is_service_update(update_fields):
+        return
+    bump_content_version()
+
+
+@receiver(pre_save, sender=Publication)
+def detect_preview_change(sender, instance, raw=False, update_fields=None, **kwargs):
+    """
+    Запоминает, изменился ли файл превью, чтобы пересоздать миниатюру после сохранения.
+    """
+    if raw or is_service_update(update_fields):
+        instance._preview_changed = False
+        return
+    old_name = (
+        Publication.objects.filter(pk=instance.pk).values_list('preview_file', flat=True).first()
+        if instance.pk else None
+    )
+    instance._preview_changed = (old_name or '') != (instance.preview_file.name or '')
+
+
+@receiver(post_save, sender=Publication)
+def update_preview_thumbnail(sender, instance, **kwargs):
+    """
+    Ставит в очередь создание миниатюры превью, если файл превью был загружен или заменен.
+    """
+    if getattr(instance, '_preview_changed', False):
+        # рендеринг документа выполняется воркером, чтобы не задерживать сохранение в админке
+        transaction.on_commit(lambda: tasks.enqueue('core.generate_preview', instance.pk))
+
+
+@receiver(post_delete, sender=Publication)
+def delete_preview_thumbnail(sender, instance, **kwargs):
+    """
+    Удаляет файл миниатюры вместе с публикацией.
+    """
+    if instance.preview_thumbnail:
+        instance.preview_thumbnail.delete(save=False)
+
+
+@receiver(pre_save, sender=Publication)
+@receiver(pre_save, sender=PageContent)
+def sanitize_content(sender, instance, raw=False, update_fields=None, **kwargs):
+    """
+    Очищает HTML-содержимое перед записью в БД, чтобы при выводе через |safe
+    не требовалась повторная очистка.
+    """
+    if raw or (update_fields and 'content' not in update_fields):
+        return
+    instance.content = sanitize_html(instance.content)
+
+
+@receiver(pre_save, sender=Publication)
+def update_excerpt(sender, instance, raw=False, update_fields=None, **kwargs):
+    """
+    Вычисляет отрывок и количество слов публикации для ленты.
+    При сохранении с update_fields, включающим content, Publication.save сам добавляет
+    к ним excerpt и word_count.
+    """
+    if raw or (update_fields and 'content' not in update_fields):
+        return
+    instance.excerpt, instance.word_count = build_excerpt(instance.content)
+
+
+@receiver(post_delete, sender=Lesson)
+def record_lesson_deletion(sender, instance, **kwargs):
+    """
+    Сохраняет отметку об удалении занятия для инкрементальной выгрузки расписания.
+    """
+    DeletedLesson.objects.create(lesson_id=instance.pk)
+
+
+def schedule_period(instance):
+    """
+    Период дат (start, end), на который влияет занятие или отмена занятия.
+    """
+    if isinstance(instance, LessonException):
+        return instance.date, instance.date
+    return instance.start_date, instance.end_date
+
+
+@receiver(pre_save, sender=Lesson)
+@receiver(pre_save, sender=LessonException)
+def remember_schedule_period(sender, instance, raw=False, **kwargs):
+    """
+    Запоминает период занятия до изменения: календари месяцев, где оно было,
+    тоже нужно сбросить.
+    """
+    instance._previous_schedule_period = None
+    if raw or instance.pk is None:
+        return
+    previous = sender.objects.filter(pk=instance.pk).first()
+    if previous is not None:
+        instance._previous_schedule_period = schedule_period(previous)
+
+
+@receiver(post_save, sender=Lesson)
+@receiver(post_save, sender=LessonException)
+@receiver(post_delete, sender=Lesson)
+@receiver(post_delete, sender=LessonException)
+def invalidate_month_schedule_cache(sender, instance, **kwargs):
+    """
+    Сбрасывает календари месяцев, затронутых занятием до и после изменения.
+    Версии меняются после фиксации транзакции, чтобы месяц, построенный
+    до нее, не сохранился в кэше под новой версией.
+    """
+    periods = [schedule_period(instance)]
+    previous = getattr(instance, '_previous_schedule_period', None)
+    if previous is not None:
+        periods.append(previous)
+    transaction.on_commit(lambda: invalidate_month_schedules(periods))
+
+
+@receiver(post_save, sender=Lesson)
+@receiver(post_delete, sender=Lesson)
+def invalidate_schedule_cache(sender, instance, **kwargs):
+    """
+    Сбрасывает кэш недельного расписания после изменения или удаления занятия.
+    """
+    invalidate_schedule()
+
+
+@receiver(post_save, sender=LessonException)
+@receiver(post_delete, sender=LessonException)
+def touch_lesson_on_exception_change(sender, instance, **kwargs):
+    """
+    Отмечает занятие измененным после изменения его отмен, чтобы оно попало
+    в инкрементальную выгрузку расписания.
+    """
+    # update() не вызывает сигналы занятия, поэтому кэш расписания сбрасываем сами
+    Lesson.objects.filter(pk=instance.lesson_id).update(updated_at=timezone.now())
+    invalidate_schedule()
+
+
+@receiver(post_save, sender=Session)
+def count_session_write(sender, **kwargs):
+    """
+    Учитывает запись сессии в БД в метриках (core/metrics.py).
+    """
+    metrics.count_session_write()
@@ -0,0 +1,234 @@
+"""
+Простая очередь фоновых задач на основе базы данных.
+
+Задачи хранятся в модели Task и выполняются командой run_worker в пуле
+процессов с ограничением одновременно выполняемых задач. Упавшая задача
+повторяется с экспоненциальной задержкой до max_attempts раз.
+
+Функция-задача регистрируется декоратором @task и ставится в очередь
+вызовом enqueue('имя', *args). Аргументы должны сериализоваться в JSON.
+Периодическая задача (@task('имя', every=секунды)) ставится в очередь при запуске
+воркера и после каждого выполнения снова ставится в очередь через every секунд.
+"""
+import logging
+import os
+import socket
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+_registry = {}
+_periodic = {}
+
+
+def task(name, every=None):
+    """
+    Регистрирует функцию как фоновую задачу с именем name.
+    При заданном every задача периодическая и повторяется каждые every секунд.
+    """
+    def decorator(func):
+        _registry[name] = func
+        if every is not None:
+            _periodic[name] = every
+        return func
+    return decorator
+
+
+def enqueue(name, *args, delay=0, max_attempts=None, unique=True):
+    """
+    Ставит задачу в очередь. При unique=True задача не дублируется,
+    если такая же задача с теми же аргументами уже ожидает выполнения.
+    """
+    from .models import Task
+
+    if name not in _registry:
+        raise KeyError(f'Неизвестная фоновая задача: {name}')
+    if getattr(settings, 'TASK_QUEUE_EAGER', False):
+        # режим разработки: выполняем задачу сразу, без воркера
+        _registry[name](*args)
+        return None
+    args = list(args)
+    if unique and Task.objects.filter(name=name, args=args, status=Task.STATUS_PENDING).exists():
+        return None
+    return Task.objects.create(
+        name=name,
+        args=args,
+        run_after=timezone.now() + timedelta(seconds=delay),
+        max_attempts=max_attempts or getattr(settings, 'TASK_MAX_ATTEMPTS', 3),
+    )
+
+
+def schedule_periodic():
+    """
+    Ставит в очередь периодические задачи, если они еще не ожидают выполнения.
+    """
+    for name in _periodic:
+        enqueue(name)
+
+
+def worker_id():
+    """
+    Возвращает идентификатор текущего воркера.
+    """
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+def requeue_stale(timeout=None):
+    """
+    Возвращает в очередь задачи, зависшие в статусе "выполняется"
+    (например, если воркер был остановлен во время работы).
+    UPDATE выполняется, только если такие задачи нашлись.
+    """
+    from .models import Task
+
+    timeout = timeout or getattr(settings, 'TASK_LOCK_TIMEOUT', 600)
+    stale = Task.objects.filter(
+        status=Task.STATUS_RUNNING,
+        locked_at__lt=timezone.now() - timedelta(seconds=timeout),
+    )
+    if not stale.exists():
+        return 0
+    return stale.update(status=Task.STATUS_PENDING, locked_by='', locked_at=None)
+
+
+def claim_tasks(limit, owner):
+    """
+    Забирает до limit готовых к выполнению задач и возвращает их id.
+    Кандидаты выбираются обычным чтением, поэтому пустая очередь не открывает
+    транзакцию записи. Обновление идет с условием по статусу, поэтому задачу,
+    которую между чтением и обновлением забрал другой воркер, второй раз не заберут.
+    """
+    from .models import Task
+
+    if limit <= 0:
+        return []
+    now = timezone.now()
+    candidates = list(
+        Task.objects.filter(status=Task.STATUS_PENDING, run_after__lte=now)
+        .order_by('run_after', 'pk')
+        .values_list('pk', flat=True)[:limit]
+    )
+    if not candidates:
+        return []
+    Task.objects.filter(pk__in=candidates, status=Task.STATUS_PENDING).update(
+        status=Task.STATUS_RUNNING, locked_by=owner, locked_at=now,
+    )
+    return list(
+        Task.objects.filter(pk__in=candidates, status=Task.STATUS_RUNNING, locked_by=owner)
+        .values_list('pk', flat=True)
+    )
+
+
+def run_task(task_id):
+    """
+    Выполняет задачу и записывает результат. Вызывается в процессе пула воркера.
+    """
+    from .models import Task
+
+    task_obj = Task.objects.get(pk=task_id)
+    task_obj.attempts += 1
+    try:
+        func = _registry[task_obj.name]
+        func(*task_obj.args)
+    except Exception:
+        task_obj.last_error = traceback.format_exc()
+        if task_obj.attempts < task_obj.max_attempts:
+            # повтор с экспоненциальной задержкой: 30 с, 60 с, 120 с...
+            backoff = getattr(settings, 'TASK_RETRY_DELAY', 30) * 2 ** (task_obj.attempts - 1)
+            task_obj.status = Task.STATUS_PENDING
+            task_obj.run_after = timezone.now() + timedelta(seconds=backoff)
+        else:
+            task_obj.status = Task.STATUS_FAILED
+        logger.warning('Фоновая задача %s завершилась ошибкой (попытка %s)', task_obj, task_obj.attempts)
+    else:
+        task_obj.status = Task.STATUS_DONE
+        task_obj.last_error = ''
+    task_obj.locked_by = ''
+    task_obj.locked_at = None
+    task_obj.save()
+    if task_obj.name in _periodic and task_obj.status != Task.STATUS_PENDING:
+        # следующий запуск периодической задачи
+        enqueue(task_obj.name, *task_obj.args, delay=_periodic[task_obj.name])
+    return task_obj.status
+
+
+def init_worker_process():
+    """
+    Инициализация процесса пула: процессы запускаются через spawn и настраивают Django заново,
+    поэтому не разделяют с воркером соединения с БД.
+    """
+    import django
+    django.setup()
+
+
+# --- Задачи приложения ---
+
+@task('core.generate_preview')
+def generate_preview_task(publication_pk):
+    """
+    Создает миниатюру превью публикации.
+    """
+    from .models import Publication
+    from .previews import generate_preview
+
+    publication = Publication.objects.filter(pk=publication_pk).first()
+    if publication is not None:
+        generate_preview(publication)
+
+
+@task('core.purge_deleted_lessons', every=getattr(settings, 'SCHEDULE_SYNC_PURGE_INTERVAL', 60 * 60 * 24))
+def purge_deleted_lessons_task():
+    """
+    Удаляет отметки об удалении занятий старше окна синхронизации SCHEDULE_SYNC_WINDOW_DAYS:
+    клиенты с более старым since получают полную выгрузку расписания.
+    Последняя отметка сохраняется, чтобы время последнего изменения расписания
+    (версия в ключах кэша, см. core/schedule.py) не уменьшалось.
+    """
+    from .models import DeletedLesson
+
+    border = timezone.now() - timedelta(days=getattr(settings, 'SCHEDULE_SYNC_WINDOW_DAYS', 90))
+    latest = DeletedLesson.objects.order_by('-deleted_at').values_list('pk', flat=True).first()
+    DeletedLesson.objects.filter(deleted_at__lt=border).exclude(pk=latest).delete()
+
+
+@task('core.purge_download_marks', every=getattr(settings, 'DOWNLOAD_DEDUP_PURGE_INTERVAL', 60 * 60 * 24))
+def purge_download_marks_task():
+    """
+    Удаляет отметки о скачивании старше DOWNLOAD_DEDUP_TTL (см. core/counters.py).
+    """
+    from .counters import dedup_border
+    from .models import DownloadMark
+
+    _, border = dedup_border()
+    DownloadMark.objects.filter(downloaded_at__lt=border).delete()
+
+
+@task('core.clear_expired_sessions', every=getattr(settings, 'SESSION_PURGE_INTERVAL', 60 * 60 * 24))
+def clear_expired_sessions_task():
+    """
+    Удаляет истекшие сессии (аналог команды clearsessions) для текущего SESSION_ENGINE.
+    """
+    from importlib import import_module
+
+    engine = import_module(settings.SESSION_ENGINE)
+    try:
+        engine.SessionStore.clear_expired()
+    except NotImplementedError:
+        logger.info('Хранилище сессий %s не поддерживает очистку', settings.SESSION_ENGINE)
+
+
+@task('core.purge_finished_tasks', every=getattr(settings, 'TASK_PURGE_INTERVAL', 60 * 60 * 24))
+def purge_finished_tasks_task():
+    """
+    Удаляет выполненные задачи старше TASK_DONE_RETENTION_DAYS. Каждый запуск
+    периодической задачи создает новую запись, поэтому без очистки таблица растет.
+    Задачи с ошибкой сохраняются для разбора.
+    """
+    from .models import Task
+
+    border = timezone.now() - timedelta(days=getattr(settings, 'TASK_DONE_RETENTION_DAYS', 7))
+    Task.objects.filter(status=Task.STATUS_DONE, updated_at__lt=border).delete()
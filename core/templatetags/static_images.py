@@ -0,0 +1,54 @@
+import os
+import re
+from functools import lru_cache
+
+from django import template
+from django.conf import settings
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.templatetags.static import static
+from django.utils.html import format_html, format_html_join
+
+register = template.Library()
+
+IMAGE_TYPES = (('avif', 'image/avif'), ('webp', 'image/webp'))
+
+
+@lru_cache(maxsize=None)
+def image_variants(name):
+    """
+    Возвращает уменьшенные копии изображения из манифеста статики:
+    список (mime-тип, [(ширина, имя файла), ...]). Манифест не меняется до перезапуска процесса.
+    """
+    base = os.path.splitext(name)[0]
+    names = getattr(staticfiles_storage, 'hashed_files', {})
+    variants = []
+    for fmt, mime_type in IMAGE_TYPES:
+        pattern = re.compile(rf'{re.escape(base)}\.w(\d+)\.{fmt}')
+        found = sorted(
+            (int(match.group(1)), variant)
+            for variant in names
+            if (match := pattern.fullmatch(variant))
+        )
+        if found:
+            variants.append((mime_type, found))
+    return variants
+
+
+@register.simple_tag
+def responsive_image(name, alt='', sizes='100vw', css_class=''):
+    """
+    Выводит изображение статики в <picture> с уменьшенными копиями AVIF/WebP,
+    созданными при collectstatic. Без копий (например, в режиме DEBUG) выводит обычный <img>.
+    """
+    img = format_html('<img src="{}" class="{}" alt="{}">', static(name), css_class, alt)
+    variants = [] if settings.DEBUG else image_variants(name)
+    if not variants:
+        return img
+    sources = format_html_join(
+        '', '<source type="{}" srcset="{}" sizes="{}">',
+        (
+            (mime_type, ', '.join(f'{static(variant)} {width}w' for width, variant in found), sizes)
+            for mime_type, found in variants
+        ),
+    )
+    return format_html('<picture>{}{}</picture>', sources, img)
@@ -0,0 +1,40 @@
+"""
+Вспомогательные средства для тестов.
+"""
+from django.test.utils import override_settings
+
+
+class QueryBudgetTestMixin:
+    """
+    Примесь к TestCase: включает проверку бюджетов запросов представлений
+    (тестовый клиент получает исключение QueryBudgetExceeded при превышении)
+    и добавляет проверки статистики запроса, собранной RequestInstrumentationMiddleware.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.enterContext(override_settings(QUERY_BUDGET_RAISE=True))
+
+    def get_request_stats(self, response):
+        stats = getattr(response, 'request_stats', None)
+        if stats is None:
+            self.fail('Ответ без статистики запроса: RequestInstrumentationMiddleware не подключен')
+        return stats
+
+    def assertQueryCountAtMost(self, response, count):
+        """
+        Проверяет, что запрос выполнил не больше count запросов к БД.
+        """
+        stats = self.get_request_stats(response)
+        if stats.query_count > count:
+            self.fail(f'{stats.view_name}: {stats.query_count} запросов к БД, ожидалось не больше {count}')
+
+    def assertNoDuplicateQueries(self, response):
+        """
+        Проверяет, что ни один запрос к БД не выполнялся повторно с теми же параметрами.
+        """
+        duplicates = self.get_request_stats(response).duplicates()
+        if duplicates:
+            self.fail('Повторяющиеся запросы к БД:\n' + '\n'.join(
+                f'  {count} x {sql}' for sql, count in duplicates
+            ))
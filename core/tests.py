@@ -1,3 +1,1426 @@
-from django.test import TestCase
+import base64
+import hashlib
+import json
+import os
+import re
+import shutil
+import tempfile
+import threading
+import warnings
+from datetime import date, time, timedelta
+from io import StringIO
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.apps import apps as django_apps
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.core.management import call_command
+from django.db import connections, transaction
+from django.db.backends.sqlite3.base import DatabaseWrapper
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.urls import path
+from django.utils import timezone
+
+from krylovagn import urls as site_urls
+from krylovagn.storage import ContentAddressedStorage
+
+from . import async_views, db, signals, views
+from . import cache as core_cache
+from . import excerpts, metrics, sanitizer, search
+from .benchmark import ENDPOINTS, find_regressions, percentile
+from .counters import download_counter, is_first_download
+from .downloads import serve_file
+from .instrumentation import get_query_budget
+from .middleware import StaticFilesMiddleware
+from .models import DeletedLesson, DownloadMark, Lesson, LessonException, PageContent, Publication, Task
+from .pagination import InvalidCursor, decode_cursor, paginate_by_cursor
+from .schedule import IntervalIndex, get_month_schedule, recurrences_overlap
+from .tasks import (
+    claim_tasks,
+    purge_deleted_lessons_task,
+    purge_download_marks_task,
+    purge_finished_tasks_task,
+    requeue_stale,
+)
+from .testing import QueryBudgetTestMixin
+
+# Тесты используют кэш в памяти, чтобы не затрагивать файловый кэш разработки
+TEST_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+# и хранилище статики без манифеста: collectstatic перед тестами не запускается
+TEST_STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+}
+
+
+@override_settings(CACHES=TEST_CACHES, STORAGES=TEST_STORAGES, METRICS_DIR='')
+class CachedTestCase(TestCase):
+    """
+    Базовый класс тестов: пустой кэш перед каждым тестом.
+    """
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        core_cache._local_page_content.clear()
+        # накопленные скачивания записываются до отката транзакции теста
+        self.addCleanup(download_counter.flush)
+
+
+class MediaTestCase(CachedTestCase):
+    """
+    Тесты с загруженными файлами: MEDIA_ROOT во временном каталоге.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.media_root = tempfile.mkdtemp()
+        cls.enterClassContext(override_settings(MEDIA_ROOT=cls.media_root))
+        cls.addClassCleanup(shutil.rmtree, cls.media_root, ignore_errors=True)
+        super().setUpClass()
+
+    def make_publication(self, title='Публикация', content='<p>Текст публикации</p>', is_published=True, file=True,
+                         category=6):
+        publication = Publication(title=title, content=content, category=category, is_published=is_published)
+        if file:
+            publication.presentation_file.save('file.pdf', ContentFile(b'%PDF-1.4 test'), save=False)
+        publication.save()
+        return publication
+
+
+def lesson_rule(start_date=None, end_date=None, repeat_weeks=1, weekday=1):
+    return {'weekday': weekday, 'start_date': start_date, 'end_date': end_date, 'repeat_weeks': repeat_weeks}
+
+
+class RecurrencesOverlapTests(CachedTestCase):
+    """
+    Пересечение правил повторения занятий одного дня недели.
+    """
+
+    def test_weekly_lessons_overlap(self):
+        self.assertTrue(recurrences_overlap(lesson_rule(), lesson_rule()))
+
+    def test_biweekly_lessons_in_different_weeks_never_meet(self):
+        a = lesson_rule(date(2026, 10, 6), repeat_weeks=2)
+        b = lesson_rule(date(2026, 10, 13), repeat_weeks=2)
+        self.assertFalse(recurrences_overlap(a, b))
+        self.assertFalse(recurrences_overlap(b, a))
+
+    def test_biweekly_lessons_in_same_week_overlap(self):
+        a = lesson_rule(date(2026, 10, 6), repeat_weeks=2)
+        b = lesson_rule(date(2026, 10, 20), repeat_weeks=2)
+        self.assertTrue(recurrences_overlap(a, b))
+
+    def test_weekly_lesson_meets_biweekly(self):
+        a = lesson_rule(date(2026, 10, 6), repeat_weeks=2)
+        b = lesson_rule(date(2026, 10, 13))
+        self.assertTrue(recurrences_overlap(a, b))
+
+    def test_coprime_periods_meet_once_phases_align(self):
+        # каждые 2 и каждые 3 недели: первая общая дата 2026-11-03
+        a = lesson_rule(date(2026, 10, 6), repeat_weeks=2)
+        self.assertTrue(recurrences_overlap(a, lesson_rule(date(2026, 10, 13), repeat_weeks=3)))
+        self.assertFalse(recurrences_overlap(a, lesson_rule(date(2026, 10, 13), date(2026, 11, 2), repeat_weeks=3)))
+
+    def test_common_week_after_end_date_does_not_count(self):
+        a = lesson_rule(date(2026, 10, 6), date(2026, 10, 31), repeat_weeks=4)
+        b = lesson_rule(date(2026, 10, 13), repeat_weeks=2)
+        # общие недели у a и b - никогда: 6 и 13 октября в разных фазах по модулю 2
+        self.assertFalse(recurrences_overlap(a, b))
+        c = lesson_rule(date(2026, 10, 20), repeat_weeks=2)
+        # общая неделя с c - 3 ноября, после окончания a
+        self.assertFalse(recurrences_overlap(a, c))
+
+    def test_lessons_without_start_date_use_epoch_phase(self):
+        a = lesson_rule(repeat_weeks=2)
+        self.assertFalse(recurrences_overlap(a, lesson_rule(date(2026, 10, 13), repeat_weeks=2)))
+        self.assertTrue(recurrences_overlap(a, lesson_rule(date(2026, 10, 6), repeat_weeks=2)))
+
+    def test_disjoint_periods(self):
+        a = lesson_rule(end_date=date(2026, 9, 30))
+        b = lesson_rule(date(2026, 10, 1))
+        self.assertFalse(recurrences_overlap(a, b))
+
+
+class IntervalIndexTests(TestCase):
+    """
+    Поиск пересечений в индексе интервалов одного дня недели.
+    """
+
+    def setUp(self):
+        self.index = IntervalIndex([
+            (600, 660, {'id': 1, 'week': 'odd'}),
+            (600, 660, {'id': 2, 'week': 'even'}),
+            (700, 760, {'id': 3, 'week': 'odd'}),
+        ])
+
+    def test_find_overlap(self):
+        self.assertEqual(self.index.find_overlap(650, 710)['id'], 3)
+        self.assertIsNone(self.index.find_overlap(660, 700))
+        self.assertIsNone(self.index.find_overlap(500, 600))
+
+    def test_overlapping_and_adjacent_intervals(self):
+        index = IntervalIndex([
+            (540, 600, {'id': 1}),
+            (600, 660, {'id': 2}),
+            (720, 780, {'id': 3}),
+        ])
+        # частичное пересечение, вложенный и накрывающий интервалы
+        self.assertEqual(index.find_overlap(650, 700)['id'], 2)
+        self.assertEqual(index.find_overlap(610, 620)['id'], 2)
+        self.assertEqual(index.find_overlap(500, 800)['id'], 3)
+        # соседние интервалы не пересекаются
+        self.assertIsNone(index.find_overlap(660, 720))
+        self.assertIsNone(index.find_overlap(480, 540))
+        self.assertIsNone(index.find_overlap(780, 840))
+        self.assertIsNone(IntervalIndex().find_overlap(600, 660))
+
+    def test_long_interval_is_found_past_short_ones(self):
+        short = [(minute, minute + 5, {'id': minute}) for minute in range(10, 1000, 10)]
+        index = IntervalIndex([(0, 1000, {'id': 'day'})] + short)
+        self.assertEqual(index.find_overlap(996, 999)['id'], 'day')
+        self.assertEqual(index.find_overlap(996, 999, exclude={990})['id'], 'day')
+        self.assertIsNone(index.find_overlap(1000, 1010))
+
+    def test_skipped_intervals_are_walked_past(self):
+        self.assertEqual(self.index.find_overlap(610, 620, exclude={2})['id'], 1)
+        self.assertEqual(self.index.find_overlap(610, 620, accept=lambda item: item['week'] == 'even')['id'], 2)
+        self.assertIsNone(self.index.find_overlap(610, 620, exclude={1, 2}))
+
+
+class LessonConflictTests(CachedTestCase):
+    """
+    Проверка пересечений занятий при сохранении (Lesson.clean).
+    """
+
+    def make_lesson(self, name, lesson_time=time(10), **kwargs):
+        lesson = Lesson(students_name=name, weekday=1, lesson_time=lesson_time, **kwargs)
+        lesson.full_clean()
+        lesson.save()
+        return lesson
+
+    def test_biweekly_lessons_alternating_weeks_are_allowed(self):
+        self.make_lesson('A', start_date=date(2026, 10, 6), repeat_weeks=2)
+        self.make_lesson('B', start_date=date(2026, 10, 13), repeat_weeks=2)
+        self.assertEqual(Lesson.objects.count(), 2)
+
+    def test_biweekly_lessons_same_weeks_are_rejected(self):
+        self.make_lesson('A', start_date=date(2026, 10, 6), repeat_weeks=2)
+        with self.assertRaisesMessage(ValidationError, 'Время пересекается с занятием A'):
+            self.make_lesson('B', start_date=date(2026, 10, 20), repeat_weeks=2)
+
+    def test_weekly_lesson_conflicts_with_biweekly(self):
+        self.make_lesson('A', start_date=date(2026, 10, 6), repeat_weeks=2)
+        with self.assertRaises(ValidationError):
+            self.make_lesson('B', start_date=date(2026, 10, 13), lesson_time=time(10, 30))
+
+
+class ScheduleAnnouncementTests(CachedTestCase):
+    """
+    Объявления на странице расписания (PageContent lessons_schedule.html).
+    """
+
+    def test_week_and_month_pages_show_announcement(self):
+        PageContent.objects.create(page_for='lessons_schedule.html', page_name='Расписание', content='<p>Каникулы</p>')
+        for url in ('/schedule/', '/schedule/2026/10/'):
+            with self.subTest(url=url):
+                self.assertContains(self.client.get(url), 'Каникулы')
+
+    def test_no_empty_card_without_announcement(self):
+        for url in ('/schedule/', '/schedule/2026/10/'):
+            with self.subTest(url=url):
+                self.assertNotContains(self.client.get(url), 'page-content-block')
+
+
+class MonthScheduleCacheTests(CachedTestCase):
+    """
+    Кэш календарей месяцев по версиям расписания и месяца.
+    """
+
+    def lessons_on(self, day):
+        for week in get_month_schedule(day.year, day.month):
+            for cell in week:
+                if cell['date'] == day:
+                    return [lesson['students_name'] for lesson in cell['lessons']]
+        return None
+
+    def test_month_is_rebuilt_after_lesson_changes(self):
+        day = date(2026, 10, 13)
+        self.assertEqual(self.lessons_on(day), [])
+        with self.captureOnCommitCallbacks(execute=True):
+            lesson = Lesson.objects.create(students_name='A', weekday=1, lesson_time=time(10))
+        self.assertEqual(self.lessons_on(day), ['A'])
+        with self.captureOnCommitCallbacks(execute=True):
+            LessonException.objects.create(lesson=lesson, date=day)
+        self.assertEqual(self.lessons_on(day), [])
+        with self.captureOnCommitCallbacks(execute=True):
+            lesson.delete()
+        self.assertEqual(self.lessons_on(date(2026, 10, 20)), [])
+
+    def test_change_within_dates_keeps_other_months(self):
+        lesson = Lesson.objects.create(students_name='A', weekday=1, lesson_time=time(10))
+        self.lessons_on(date(2026, 3, 10))
+        self.lessons_on(date(2026, 10, 13))
+        with self.assertNumQueries(2):
+            with self.captureOnCommitCallbacks(execute=True):
+                LessonException.objects.create(lesson=lesson, date=date(2026, 10, 13))
+        with self.assertNumQueries(0):
+            self.assertEqual(self.lessons_on(date(2026, 3, 10)), ['A'])
+        self.assertEqual(self.lessons_on(date(2026, 10, 13)), [])
+
+    def test_moved_lesson_invalidates_old_and_new_months(self):
+        lesson = Lesson.objects.create(
+            students_name='A', weekday=1, lesson_time=time(10),
+            start_date=date(2026, 3, 1), end_date=date(2026, 3, 31),
+        )
+        self.assertEqual(self.lessons_on(date(2026, 3, 10)), ['A'])
+        self.assertEqual(self.lessons_on(date(2026, 10, 13)), [])
+        lesson.start_date, lesson.end_date = date(2026, 10, 1), date(2026, 10, 31)
+        with self.captureOnCommitCallbacks(execute=True):
+            lesson.save()
+        self.assertEqual(self.lessons_on(date(2026, 3, 10)), [])
+        self.assertEqual(self.lessons_on(date(2026, 10, 13)), ['A'])
+
+    def test_versions_change_after_commit(self):
+        day = date(2026, 10, 13)
+        self.lessons_on(day)
+        with self.captureOnCommitCallbacks() as callbacks:
+            Lesson.objects.create(students_name='A', weekday=1, lesson_time=time(10))
+            # до фиксации транзакции читается прежний месяц
+            self.assertEqual(self.lessons_on(day), [])
+        for callback in callbacks:
+            callback()
+        self.assertEqual(self.lessons_on(day), ['A'])
+
+    def test_lost_cache_entries_do_not_serve_stale_months(self):
+        day = date(2026, 10, 13)
+        self.lessons_on(day)
+        # вытеснение записей кэша (cull) не должно оставлять устаревший месяц
+        cache.clear()
+        Lesson.objects.create(students_name='A', weekday=1, lesson_time=time(10))
+        self.assertEqual(self.lessons_on(day), ['A'])
+
+
+class ScheduleSyncTests(CachedTestCase):
+    """
+    Инкрементальная выгрузка расписания и удаление старых отметок об удалении.
+    """
+
+    def make_deleted(self, lesson_id, days_ago):
+        deleted = DeletedLesson.objects.create(lesson_id=lesson_id)
+        DeletedLesson.objects.filter(pk=deleted.pk).update(deleted_at=timezone.now() - timedelta(days=days_ago))
+
+    @override_settings(SCHEDULE_SYNC_WINDOW_DAYS=30)
+    def test_purge_keeps_recent_and_latest_tombstones(self):
+        self.make_deleted(1, 100)
+        self.make_deleted(2, 60)
+        self.make_deleted(3, 5)
+        purge_deleted_lessons_task()
+        self.assertEqual(list(DeletedLesson.objects.values_list('lesson_id', flat=True)), [3])
+        DeletedLesson.objects.filter(lesson_id=3).delete()
+        self.make_deleted(4, 60)
+        purge_deleted_lessons_task()
+        # последняя отметка остается, даже если она старше окна
+        self.assertEqual(list(DeletedLesson.objects.values_list('lesson_id', flat=True)), [4])
+
+    @override_settings(SCHEDULE_SYNC_WINDOW_DAYS=30)
+    def test_since_older_than_window_returns_full_feed(self):
+        Lesson.objects.create(students_name='A', weekday=1, lesson_time=time(10))
+        recent = (timezone.now() - timedelta(days=1)).isoformat()
+        stale = (timezone.now() - timedelta(days=31)).isoformat()
+        self.assertFalse(self.client.get('/schedule/feed.json', {'since': recent}).json()['full'])
+        self.assertTrue(self.client.get('/schedule/feed.json', {'since': stale}).json()['full'])
+
+
+class DownloadDedupTests(MediaTestCase):
+    """
+    Учет повторных скачиваний по отметкам DownloadMark.
+    """
+
+    def setUp(self):
+        super().setUp()
+        download_counter.flush()
+
+    def test_repeat_download_is_not_counted(self):
+        self.assertTrue(is_first_download('v1', 1))
+        self.assertFalse(is_first_download('v1', 1))
+        self.assertTrue(is_first_download('v2', 1))
+        self.assertTrue(is_first_download('v1', 2))
+        download_counter.flush()
+        self.assertFalse(is_first_download('v1', 1))
+
+    def test_marks_are_written_with_counter_flush(self):
+        with self.assertNumQueries(1):
+            self.assertTrue(is_first_download('v1', 1))
+        with self.assertNumQueries(0):
+            self.assertFalse(is_first_download('v1', 1))
+        self.assertFalse(DownloadMark.objects.exists())
+        download_counter.flush()
+        self.assertEqual(list(DownloadMark.objects.values_list('publication_id', 'visitor_id')), [(1, 'v1')])
+
+    @override_settings(DOWNLOAD_DEDUP_TTL=60)
+    def test_download_after_ttl_is_counted_again(self):
+        self.assertTrue(is_first_download('v1', 1))
+        download_counter.flush()
+        DownloadMark.objects.update(downloaded_at=timezone.now() - timedelta(seconds=61))
+        self.assertTrue(is_first_download('v1', 1))
+        self.assertFalse(is_first_download('v1', 1))
+        download_counter.flush()
+        self.assertEqual(DownloadMark.objects.count(), 1)
+        self.assertGreater(DownloadMark.objects.get().downloaded_at, timezone.now() - timedelta(seconds=60))
+
+    @override_settings(DOWNLOAD_DEDUP_TTL=60)
+    def test_purge_removes_expired_marks(self):
+        is_first_download('old', 1)
+        download_counter.flush()
+        DownloadMark.objects.update(downloaded_at=timezone.now() - timedelta(seconds=61))
+        is_first_download('new', 1)
+        download_counter.flush()
+        purge_download_marks_task()
+        self.assertEqual(list(DownloadMark.objects.values_list('visitor_id', flat=True)), ['new'])
+
+    def test_head_request_is_not_counted(self):
+        publication = self.make_publication()
+        before = metrics.process_metrics.snapshot()
+        response = self.client.head(f'/publications/{publication.pk}/download/')
+        self.assertEqual(response.status_code, 200)
+        download_counter.flush()
+        publication.refresh_from_db()
+        self.assertEqual(publication.downloads_count, 0)
+        downloads = [series for series in metrics.process_metrics.snapshot() if series[0].startswith('download')]
+        self.assertEqual(downloads, [series for series in before if series[0].startswith('download')])
+
+    def test_download_view_counts_visitor_once(self):
+        publication = self.make_publication()
+        url = f'/publications/{publication.pk}/download/'
+        for _ in range(3):
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            b''.join(response.streaming_content)
+        download_counter.flush()
+        publication.refresh_from_db()
+        self.assertEqual(publication.downloads_count, 1)
+
+
+class ServeFileTests(MediaTestCase):
+    """
+    Отдача файла с диапазонами байт, условиями и через веб-сервер (core/downloads.py).
+    """
+
+    body = b'%PDF-1.4 test'
+
+    def setUp(self):
+        super().setUp()
+        self.publication = self.make_publication()
+        self.url = f'/publications/{self.publication.pk}/download/'
+
+    def get(self, **headers):
+        response = self.client.get(self.url, headers=headers)
+        content = b''.join(response.streaming_content) if response.streaming else response.content
+        return response, content
+
+    def assertRange(self, header, content, content_range):
+        response, body = self.get(Range=header)
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(body, content)
+        self.assertEqual(response['Content-Range'], content_range)
+        self.assertEqual(int(response['Content-Length']), len(content))
+
+    def test_single_range(self):
+        self.assertRange('bytes=0-3', b'%PDF', 'bytes 0-3/13')
+
+    def test_suffix_range(self):
+        self.assertRange('bytes=-4', b'test', 'bytes 9-12/13')
+        self.assertRange('bytes=-100', self.body, 'bytes 0-12/13')
+
+    def test_open_ended_range(self):
+        self.assertRange('bytes=9-', b'test', 'bytes 9-12/13')
+        self.assertRange('bytes=5-100', b'1.4 test', 'bytes 5-12/13')
+
+    def test_multiple_ranges(self):
+        response, body = self.get(Range='bytes=0-3,9-')
+        self.assertEqual(response.status_code, 206)
+        self.assertTrue(response['Content-Type'].startswith('multipart/byteranges; boundary='))
+        boundary = response['Content-Type'].split('boundary=')[1]
+        self.assertEqual(int(response['Content-Length']), len(body))
+        self.assertEqual(body, (
+            f'\r\n--{boundary}\r\nContent-Type: application/pdf\r\nContent-Range: bytes 0-3/13\r\n\r\n%PDF'
+            f'\r\n--{boundary}\r\nContent-Type: application/pdf\r\nContent-Range: bytes 9-12/13\r\n\r\ntest'
+            f'\r\n--{boundary}--\r\n'
+        ).encode())
+
+    def test_unsatisfiable_range(self):
+        response, body = self.get(Range='bytes=100-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], 'bytes */13')
+        self.assertEqual(body, b'')
+
+    def test_invalid_range_is_ignored(self):
+        response, body = self.get(Range='bytes=5-1')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(body, self.body)
+
+    def test_if_range(self):
+        etag = self.get()[0]['ETag']
+        response, body = self.get(Range='bytes=0-3', If_Range=etag)
+        self.assertEqual((response.status_code, body), (206, b'%PDF'))
+        # файл изменился: вместо диапазона отдается весь файл
+        response, body = self.get(Range='bytes=0-3', If_Range='"stale"')
+        self.assertEqual((response.status_code, body), (200, self.body))
+
+    def test_not_modified(self):
+        etag = self.get()[0]['ETag']
+        response, body = self.get(If_None_Match=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+
+    @override_settings(DOWNLOAD_SENDFILE_BACKEND='nginx', DOWNLOAD_ACCEL_REDIRECT_PREFIX='/protected-media/')
+    def test_accel_redirect(self):
+        response, body = self.get(Range='bytes=0-3')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['X-Accel-Redirect'], f'/protected-media/{self.publication.presentation_file.name}')
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertIn('attachment', response['Content-Disposition'])
+        self.assertEqual(body, b'')
+
+    @override_settings(DOWNLOAD_SENDFILE_BACKEND='sendfile')
+    def test_x_sendfile(self):
+        response, body = self.get()
+        self.assertEqual(response['X-Sendfile'], self.publication.presentation_file.path)
+        self.assertEqual(body, b'')
+
+    def test_file_is_opened_lazily_and_closed_with_response(self):
+        field_file = self.publication.presentation_file
+        opened = []
+
+        def spy_open(name, mode='rb'):
+            opened.append(open(field_file.path, mode))
+            return opened[-1]
+
+        with mock.patch.object(field_file.storage, 'open', side_effect=spy_open):
+            serve_file(RequestFactory().head(self.url), field_file).close()
+            self.assertEqual(opened, [])
+            response = serve_file(RequestFactory().get(self.url), field_file)
+            self.assertEqual(next(iter(response.streaming_content)), self.body)
+            self.assertFalse(opened[0].closed)
+            response.close()
+        self.assertTrue(opened[0].closed)
+
+
+class ContentAddressedStorageTests(MediaTestCase):
+    """
+    Хранилище с адресацией по содержимому и удаление неиспользуемых файлов командой gc_media.
+    """
+
+    def setUp(self):
+        super().setUp()
+        shutil.rmtree(os.path.join(self.media_root, ContentAddressedStorage.directory), ignore_errors=True)
+        self.storage = ContentAddressedStorage()
+
+    def save(self, data, name='image.JPG', age_hours=0):
+        name = self.storage.save(name, ContentFile(data))
+        if age_hours:
+            mtime = timezone.now().timestamp() - age_hours * 3600
+            os.utime(self.storage.path(name), (mtime, mtime))
+        return name
+
+    def gc_media(self, *args):
+        out = StringIO()
+        call_command('gc_media', *args, stdout=out)
+        return out.getvalue()
+
+    def test_identical_uploads_are_stored_once(self):
+        first = self.save(b'image data', 'first.JPG')
+        second = self.save(b'image data', 'second.jpg')
+        digest = hashlib.sha256(b'image data').hexdigest()
+        self.assertEqual(first, f'{digest[:2]}/{digest[2:4]}/{digest}.jpg')
+        self.assertEqual(second, first)
+        self.assertEqual(list(self.storage.iter_names()), [first])
+        self.assertEqual(os.listdir(self.storage.path('tmp')), [])
+
+    def test_gc_removes_only_old_unreferenced_files(self):
+        referenced = self.save(b'referenced', age_hours=48)
+        recent = self.save(b'recent', age_hours=1)
+        unreferenced = self.save(b'unreferenced', age_hours=48)
+        self.make_publication(content=f'<p><img src="{self.storage.url(referenced)}"></p>', file=False)
+
+        self.gc_media('--min-age', '24')
+        self.assertTrue(self.storage.exists(referenced))
+        self.assertTrue(self.storage.exists(recent))
+        self.assertFalse(self.storage.exists(unreferenced))
+
+    def test_dry_run_deletes_nothing(self):
+        unreferenced = self.save(b'unreferenced', age_hours=48)
+        output = self.gc_media('--dry-run')
+        self.assertIn(unreferenced, output)
+        self.assertTrue(self.storage.exists(unreferenced))
+
+
+class SanitizerTests(TestCase):
+    """
+    Очистка HTML: очиститель на поток и LRU-кэш результатов (core/sanitizer.py).
+    """
+
+    def setUp(self):
+        super().setUp()
+        sanitizer._cache.clear()
+        self.addCleanup(sanitizer._cache.clear)
+
+    def test_cleaner_per_thread(self):
+        cleaners = []
+        thread = threading.Thread(target=lambda: cleaners.append(sanitizer.get_cleaner()))
+        thread.start()
+        thread.join()
+        self.assertIs(sanitizer.get_cleaner(), sanitizer.get_cleaner())
+        self.assertIsNot(cleaners[0], sanitizer.get_cleaner())
+
+    def test_cached_output_is_the_same(self):
+        html = '<p onclick="x()">Текст <script>alert(1)</script><s>старое</s></p>'
+        cleaned = sanitizer.sanitize_html(html)
+        self.assertEqual(cleaned, '<p>Текст alert(1)<s>старое</s></p>')
+        with mock.patch.object(sanitizer, 'get_cleaner') as get_cleaner:
+            self.assertEqual(sanitizer.sanitize_html(html), cleaned)
+            # уже очищенный HTML тоже берется из кэша
+            self.assertEqual(sanitizer.sanitize_html(cleaned), cleaned)
+        get_cleaner.assert_not_called()
+
+    @override_settings(SANITIZER_CACHE_SIZE=4)
+    def test_cache_is_bounded(self):
+        for number in range(10):
+            sanitizer.sanitize_html(f'<p>{number}<script></script></p>')
+        self.assertEqual(len(sanitizer._cache), 4)
+        self.assertEqual(sanitizer.sanitize_html('<p>9<script></script></p>'), '<p>9</p>')
+
+    def test_only_todo_checkboxes_are_kept(self):
+        todo = (
+            '<ul class="todo-list"><li><label class="todo-list__label">'
+            '<input type="checkbox" checked="checked"><span>Задача</span></label></li></ul>'
+        )
+        self.assertEqual(sanitizer.sanitize_html(todo), (
+            '<ul class="todo-list"><li><label class="todo-list__label">'
+            '<input type="checkbox" checked disabled><span>Задача</span></label></li></ul>'
+        ))
+        self.assertEqual(sanitizer.sanitize_html('<p><input type="text" value="x"><input>Текст</p>'), '<p>Текст</p>')
+
+
+@override_settings(DEBUG=False, STATIC_URL='/static/', STATIC_MAX_AGE=3600)
+class StaticFilesMiddlewareTests(TestCase):
+    """
+    Отдача собранной статики со сжатыми вариантами и заголовками кэширования.
+    """
+
+    def setUp(self):
+        super().setUp()
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root, ignore_errors=True)
+        files = {
+            'css/site.0123456789ab.css': b'body{}',
+            'css/site.0123456789ab.css.gz': b'gzip',
+            'css/site.0123456789ab.css.br': b'brotli',
+            'js/app.js': b'app',
+            'js/app.js.gz': b'gzip',
+            'robots.txt': b'User-agent: *',
+        }
+        for name, content in files.items():
+            os.makedirs(os.path.dirname(os.path.join(root, name)), exist_ok=True)
+            with open(os.path.join(root, name), 'wb') as f:
+                f.write(content)
+        self.enterContext(override_settings(STATIC_ROOT=root))
+        storage = SimpleNamespace(hashed_files={'css/site.css': 'css/site.0123456789ab.css'})
+        self.enterContext(mock.patch('core.middleware.staticfiles_storage', storage))
+        self.middleware = StaticFilesMiddleware(lambda request: None)
+
+    def get(self, path, **headers):
+        response = self.middleware.process_request(RequestFactory().get(path, headers=headers))
+        content = b''.join(response.streaming_content) if response.streaming else response.content
+        response.close()
+        return response, content
+
+    def test_encoding_is_chosen_from_accept_encoding(self):
+        url = '/static/css/site.0123456789ab.css'
+        cases = (
+            ('gzip, deflate, br', 'br', b'brotli'),
+            ('gzip', 'gzip', b'gzip'),
+            ('br;q=0, gzip', 'gzip', b'gzip'),
+            ('', None, b'body{}'),
+        )
+        etags = set()
+        for accept_encoding, encoding, content in cases:
+            with self.subTest(accept_encoding=accept_encoding):
+                response, body = self.get(url, accept_encoding=accept_encoding)
+                self.assertEqual(body, content)
+                self.assertEqual(response.get('Content-Encoding'), encoding)
+                self.assertEqual(response['Content-Type'], 'text/css')
+                self.assertIn('Accept-Encoding', response['Vary'])
+                etags.add(response['ETag'])
+        # у каждого варианта свой ETag
+        self.assertEqual(len(etags), 3)
+        response, _ = self.get('/static/js/app.js', accept_encoding='br, gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+
+    def test_vary_only_for_files_with_variants(self):
+        response, _ = self.get('/static/robots.txt', accept_encoding='gzip')
+        self.assertFalse(response.has_header('Vary'))
+        self.assertFalse(response.has_header('Content-Encoding'))
+
+    def test_cache_headers(self):
+        hashed, _ = self.get('/static/css/site.0123456789ab.css')
+        self.assertEqual(
+            set(hashed['Cache-Control'].split(', ')), {'public', 'max-age=31536000', 'immutable'},
+        )
+        plain, _ = self.get('/static/js/app.js')
+        self.assertEqual(set(plain['Cache-Control'].split(', ')), {'public', 'max-age=3600'})
+
+    def test_not_modified_and_unknown_files(self):
+        response, _ = self.get('/static/js/app.js', accept_encoding='gzip')
+        not_modified, body = self.get('/static/js/app.js', accept_encoding='gzip', if_none_match=response['ETag'])
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(body, b'')
+        self.assertIn('Accept-Encoding', not_modified['Vary'])
+        request = RequestFactory().get('/static/missing.js')
+        self.assertIsNone(self.middleware.process_request(request))
+        self.assertIsNone(self.middleware.process_request(RequestFactory().post('/static/js/app.js')))
+
+
+class StemmerTests(TestCase):
+    """
+    Стемминг и разбиение текста на слова для поискового индекса.
+    """
+
+    def test_word_forms_share_stem(self):
+        for forms in (('урок', 'уроки', 'уроков', 'урокам'), ('книга', 'книги', 'книгой'),
+                      ('читать', 'читаем', 'читали')):
+            with self.subTest(forms=forms):
+                self.assertEqual(len({search.stem(word) for word in forms}), 1)
+
+    def test_yo_and_case_are_normalized(self):
+        self.assertEqual(search.stem('Ёлка'), search.stem('елка'))
+
+    def test_words_without_vowels_and_latin_are_kept(self):
+        self.assertEqual(search.stem('бзз'), 'бзз')
+        self.assertEqual(search.stem('Python'), 'python')
+
+    def test_tokenize_strips_html_and_punctuation(self):
+        text = search.to_plain_text('<p>Уроки&nbsp;<b>музыки</b>, ноты!</p>')
+        self.assertEqual(search.tokenize(text), [search.stem('уроки'), search.stem('музыки'), search.stem('ноты')])
+
+
+class SearchTests(MediaTestCase):
+    """
+    Полнотекстовый поиск по публикациям (FTS5 на SQLite).
+    """
+
+    def test_word_forms_are_found_by_relevance(self):
+        in_text = self.make_publication('Заметка', '<p>Расписание уроков на осень</p>', file=False)
+        in_title = self.make_publication('Уроки музыки', '<p>Ноты</p>', file=False)
+        self.make_publication('Другое', '<p>Ничего общего</p>', file=False)
+        # совпадение в заголовке весит больше, чем в тексте
+        self.assertEqual(search.search('урок'), [in_title.pk, in_text.pk])
+
+    def test_index_follows_updates_and_deletes(self):
+        publication = self.make_publication('Старый заголовок', '<p>Текст</p>', file=False)
+        publication.title = 'Новый заголовок'
+        publication.save()
+        self.assertEqual(search.search('старый'), [])
+        self.assertEqual(search.search('новые'), [publication.pk])
+        publication.delete()
+        self.assertEqual(search.search('новый'), [])
+
+    def test_rebuild_index(self):
+        publication = self.make_publication('Урок', file=False)
+        self.assertEqual(search.rebuild_index(batch_size=1), 1)
+        self.assertEqual(search.search('уроки'), [publication.pk])
+
+    def test_drafts_are_hidden_unless_requested(self):
+        draft = self.make_publication('Урок черновик', is_published=False, file=False)
+        self.assertEqual(search.search('урок'), [])
+        self.assertEqual(search.search('урок', published_only=False), [draft.pk])
+
+    @override_settings(SEARCH_RESULTS_LIMIT=5)
+    def test_category_is_filtered_before_limit(self):
+        for number in range(6):
+            self.make_publication(f'Урок {number}', '<p>Урок урок урок</p>', category=1, file=False)
+        other = self.make_publication('Заметка', '<p>Про урок</p>', category=2, file=False)
+        self.assertEqual(search.search('урок', category=2), [other.pk])
+        response = self.client.get('/blog/', {'q': 'урок', 'category': 2})
+        self.assertContains(response, 'Заметка')
+
+    def test_invalid_category_is_ignored(self):
+        self.make_publication('Урок', category=1, file=False)
+        for params in ({'category': 'abc'}, {'q': 'урок', 'category': 'abc'}, {'category': ''}):
+            with self.subTest(params=params):
+                self.assertContains(self.client.get('/blog/', params), 'Урок')
+
+    def test_index_is_filled_after_search_migration(self):
+        publication = self.make_publication('Урок', file=False)
+        with connections['default'].cursor() as cursor:
+            cursor.execute(f'DELETE FROM {search.FTS_TABLE}')
+        core_config = django_apps.get_app_config('core')
+        other = SimpleNamespace(app_label='core', name='0023_download_mark')
+        signals.fill_search_index_after_migrate(core_config, plan=[(other, False)])
+        self.assertEqual(search.search('урок'), [])
+        migration = SimpleNamespace(app_label='core', name='0013_publication_search_index')
+        signals.fill_search_index_after_migrate(core_config, plan=[(migration, False)])
+        self.assertEqual(search.search('урок'), [publication.pk])
+
+
+class ExcerptTests(MediaTestCase):
+    """
+    Отрывок и количество слов публикации для ленты.
+    """
+
+    @override_settings(EXCERPT_WORDS=3)
+    def test_build_excerpt(self):
+        excerpt, words = excerpts.build_excerpt('<p>Первый <b>урок</b>&nbsp;музыки</p>\n<p>начнется в сентябре</p>')
+        self.assertEqual(excerpt, 'Первый урок музыки…')
+        self.assertEqual(words, 6)
+        self.assertEqual(excerpts.build_excerpt('<p>Два слова</p>'), ('Два слова', 2))
+        self.assertEqual(excerpts.build_excerpt(''), ('', 0))
+
+    @override_settings(EXCERPT_WORDS=2)
+    def test_excerpt_follows_content(self):
+        publication = self.make_publication('Урок', '<p>Ноты</p>', file=False)
+        self.assertEqual((publication.excerpt, publication.word_count), ('Ноты', 1))
+        publication.content = '<p>Гаммы и <i>этюды</i></p>'
+        publication.save(update_fields=['content'])
+        publication.refresh_from_db()
+        self.assertEqual((publication.excerpt, publication.word_count), ('Гаммы и…', 3))
+        # сохранение без content не пересчитывает отрывок
+        Publication.objects.filter(pk=publication.pk).update(excerpt='')
+        publication.refresh_from_db()
+        publication.save(update_fields=['title'])
+        publication.refresh_from_db()
+        self.assertEqual(publication.excerpt, '')
+
+
+class DownloadCountsTests(MediaTestCase):
+    """
+    Актуальные счетчики скачиваний для закэшированной ленты публикаций.
+    """
+
+    def setUp(self):
+        super().setUp()
+        download_counter.flush()
+
+    def download(self, publication):
+        response = self.client.get(f'/publications/{publication.pk}/download/')
+        b''.join(response.streaming_content)
+
+    def test_counts_include_pending_and_flushed_downloads(self):
+        publication = self.make_publication()
+        draft = self.make_publication(is_published=False)
+        self.assertContains(self.client.get('/blog/'), 'data-publication-id="%s"' % publication.pk)
+        self.download(publication)
+        url = '/publications/downloads.json'
+        ids = f'{publication.pk},{draft.pk}'
+        self.assertEqual(self.client.get(url, {'ids': ids}).json(), {'counts': {str(publication.pk): 1}})
+        download_counter.flush()
+        self.assertEqual(self.client.get(url, {'ids': ids}).json(), {'counts': {str(publication.pk): 1}})
+
+    def test_invalid_ids(self):
+        self.assertEqual(self.client.get('/publications/downloads.json', {'ids': '1,x'}).status_code, 400)
+        self.assertEqual(self.client.get('/publications/downloads.json', {'ids': ''}).json(), {'counts': {}})
+
+
+class TaskPurgeTests(TestCase):
+    """
+    Удаление выполненных фоновых задач.
+    """
+
+    @override_settings(TASK_DONE_RETENTION_DAYS=7)
+    def test_old_done_tasks_are_removed(self):
+        now = timezone.now()
+        for name, status, days_ago in (('old', Task.STATUS_DONE, 8), ('new', Task.STATUS_DONE, 1),
+                                       ('failed', Task.STATUS_FAILED, 30), ('pending', Task.STATUS_PENDING, 30)):
+            task_obj = Task.objects.create(name=name, status=status, run_after=now)
+            Task.objects.filter(pk=task_obj.pk).update(updated_at=now - timedelta(days=days_ago))
+        purge_finished_tasks_task()
+        self.assertEqual(set(Task.objects.values_list('name', flat=True)), {'new', 'failed', 'pending'})
+
+
+class TaskQueueTests(TestCase):
+    """
+    Выборка задач воркером: пустая очередь проверяется без запросов записи.
+    """
+
+    def test_idle_poll_only_reads(self):
+        with self.assertNumQueries(1) as context:
+            self.assertEqual(claim_tasks(2, 'worker'), [])
+        with self.assertNumQueries(1):
+            self.assertEqual(requeue_stale(), 0)
+        self.assertTrue(context.captured_queries[0]['sql'].startswith('SELECT'))
+
+    def test_claim_and_requeue(self):
+        now = timezone.now()
+        ready = Task.objects.create(name='ready', run_after=now)
+        Task.objects.create(name='later', run_after=now + timedelta(hours=1))
+        self.assertEqual(claim_tasks(2, 'worker'), [ready.pk])
+        self.assertEqual(claim_tasks(2, 'other'), [])
+        ready.refresh_from_db()
+        self.assertEqual((ready.status, ready.locked_by), (Task.STATUS_RUNNING, 'worker'))
+
+        Task.objects.filter(pk=ready.pk).update(locked_at=now - timedelta(seconds=601))
+        self.assertEqual(requeue_stale(timeout=600), 1)
+        self.assertEqual(claim_tasks(2, 'other'), [ready.pk])
+
+
+class AsyncURLConf:
+    """
+    Маршруты сайта с асинхронными представлениями, как под ASGI (ASYNC_VIEWS=True).
+    """
+    urlpatterns = [
+        path('', async_views.AsyncLandingView.as_view(), name='landing'),
+        path('blog/', async_views.AsyncPublicationListView.as_view(), name='publication_list'),
+        path('blog/feed/', async_views.AsyncPublicationFeedView.as_view(), name='publication_feed'),
+        path('publications/<int:pk>/download/', async_views.download_file, name='download_file'),
+        path('contacts/', async_views.AsyncContactPageView.as_view(), name='contacts'),
+        path('schedule/', async_views.AsyncLessonScheduleView.as_view(), name='lessons_schedule'),
+        path('schedule/<int:year>/<int:month>/', async_views.AsyncLessonScheduleView.as_view(),
+             name='lessons_schedule_month'),
+    ] + site_urls.urlpatterns
+
+
+@override_settings(ROOT_URLCONF=AsyncURLConf)
+class AsyncViewTests(MediaTestCase):
+    """
+    Асинхронные представления (core/async_views.py) через AsyncClient.
+    """
+
+    def setUp(self):
+        super().setUp()
+        download_counter.flush()
+        self.publication = self.make_publication('Асинхронная публикация')
+        Lesson.objects.create(students_name='Ученик', weekday=1, lesson_time=time(10))
+        PageContent.objects.create(page_for='contacts.html', page_name='Контакты', content='<p>Телефон</p>')
+
+    async def test_pages(self):
+        for url, text, view_class in (
+            ('/', None, async_views.AsyncLandingView),
+            ('/blog/', 'Асинхронная публикация', async_views.AsyncPublicationListView),
+            ('/blog/?q=асинхронная', 'Асинхронная публикация', async_views.AsyncPublicationListView),
+            ('/contacts/', 'Телефон', async_views.AsyncContactPageView),
+            ('/schedule/', 'Ученик', async_views.AsyncLessonScheduleView),
+            ('/schedule/2026/10/', 'Ученик', async_views.AsyncLessonScheduleView),
+        ):
+            with self.subTest(url=url):
+                response = await self.async_client.get(url)
+                self.assertEqual(response.status_code, 200)
+                self.assertIs(response.resolver_match.func.view_class, view_class)
+                if text is not None:
+                    self.assertContains(response, text)
+
+    async def test_feed(self):
+        response = await self.async_client.get('/blog/feed/', headers={'x-requested-with': 'XMLHttpRequest'})
+        self.assertEqual(response.status_code, 200)
+        self.assertIs(response.resolver_match.func.view_class, async_views.AsyncPublicationFeedView)
+        self.assertIn('Асинхронная публикация', response.json()['html'])
+
+    async def test_download_is_counted_once(self):
+        url = f'/publications/{self.publication.pk}/download/'
+        response = await self.async_client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join([chunk async for chunk in response.streaming_content]), b'%PDF-1.4 test')
+        cookie = response.cookies['visitor_id'].value
+        self.async_client.cookies['visitor_id'] = cookie
+        response = await self.async_client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(download_counter.pending(self.publication.pk), 1)
+
+    async def test_download_does_not_block_event_loop(self):
+        loop_thread = threading.current_thread()
+        threads = []
+
+        def track(method):
+            def wrapper(storage, *args):
+                threads.append(threading.current_thread())
+                return method(storage, *args)
+            return wrapper
+
+        with mock.patch.object(FileSystemStorage, 'size', track(FileSystemStorage.size)), \
+                mock.patch.object(FileSystemStorage, 'open', track(FileSystemStorage.open)), \
+                mock.patch.object(FileSystemStorage, 'get_modified_time', track(FileSystemStorage.get_modified_time)):
+            response = await self.async_client.get(f'/publications/{self.publication.pk}/download/')
+            content = b''.join([chunk async for chunk in response.streaming_content])
+        self.assertTrue(response.is_async)
+        self.assertEqual(content, b'%PDF-1.4 test')
+        # размер, время изменения и открытие файла запрашиваются в пуле потоков
+        self.assertEqual(len(threads), 3)
+        self.assertNotIn(loop_thread, threads)
+
+
+class PageContentCacheTests(CachedTestCase):
+    """
+    Общий кэш контента страниц для синхронного и асинхронного чтения.
+    """
+
+    async def test_sync_and_async_share_cache(self):
+        await PageContent.objects.acreate(page_for='contacts.html', page_name='Контакты', content='<p>Старый</p>')
+        content = await sync_to_async(core_cache.get_page_content)('contacts.html')
+        # update() не вызывает сигналы: значение должно прийти из кэша процесса
+        await PageContent.objects.filter(page_for='contacts.html').aupdate(content='<p>Новый</p>')
+        cached = await core_cache.aget_page_content('contacts.html')
+        self.assertEqual(cached.content, '<p>Старый</p>')
+        self.assertEqual(cached.content, content.content)
+
+    def test_local_copy_is_dropped_after_version_change(self):
+        PageContent.objects.create(page_for='contacts.html', page_name='Контакты', content='<p>Старый</p>')
+        self.assertEqual(core_cache.get_page_content('contacts.html').content, '<p>Старый</p>')
+        # контент изменили в другом процессе: его сигнал сбросил общий кэш и сменил
+        # версию контента, но не копию в памяти этого процесса
+        PageContent.objects.filter(page_for='contacts.html').update(content='<p>Новый</p>')
+        cache.delete(core_cache._page_content_key('contacts.html'))
+        core_cache.bump_content_version()
+        self.assertEqual(core_cache.get_page_content('contacts.html').content, '<p>Новый</p>')
+
+    def test_request_memo(self):
+        request = RequestFactory().get('/')
+        self.assertIsNone(core_cache.get_page_content('landing.html', request=request))
+        core_cache._local_page_content.clear()
+        cache.clear()
+        PageContent.objects.create(page_for='landing.html', page_name='Главная', content='<p>Текст</p>')
+        with self.assertNumQueries(0):
+            self.assertIsNone(core_cache.get_page_content('landing.html', request=request))
+
+
+class SQLiteConnectionTests(TransactionTestCase):
+    """
+    Настройка соединений с SQLite и ReadWriteRouter (core/db.py).
+    """
+    databases = {'default', 'read'}
+
+    def pragma(self, name, alias='default'):
+        with connections[alias].cursor() as cursor:
+            cursor.execute(f'PRAGMA {name}')
+            return cursor.fetchone()[0]
+
+    def file_connection(self, name, alias):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        path = os.path.join(directory, name)
+        connection = DatabaseWrapper({**connections['default'].settings_dict, 'NAME': path}, alias)
+        self.addCleanup(connection.close)
+        return connection, path
+
+    def test_pragmas(self):
+        for alias in ('default', 'read'):
+            with self.subTest(alias=alias):
+                self.assertEqual(self.pragma('synchronous', alias), 1)
+                self.assertEqual(self.pragma('busy_timeout', alias), settings.SQLITE_BUSY_TIMEOUT)
+                self.assertEqual(self.pragma('cache_size', alias), settings.SQLITE_PRAGMAS['cache_size'])
+                self.assertEqual(self.pragma('temp_store', alias), 2)
+                self.assertEqual(self.pragma('foreign_keys', alias), 1)
+        self.assertEqual(self.pragma('query_only'), 0)
+        self.assertEqual(self.pragma('query_only', 'read'), 1)
+
+    def test_file_database_uses_wal(self):
+        connection, _ = self.file_connection('db.sqlite3', 'default')
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA journal_mode')
+            self.assertEqual(cursor.fetchone()[0], 'wal')
+
+    def test_router(self):
+        router = db.ReadWriteRouter()
+        self.assertEqual(router.db_for_read(Publication), 'read')
+        self.assertEqual(router.db_for_write(Publication), 'default')
+        self.assertEqual(Publication.objects.all().db, 'read')
+        with transaction.atomic():
+            # в транзакции чтение видит незафиксированные изменения основного соединения
+            self.assertEqual(router.db_for_read(Publication), 'default')
+            Publication.objects.create(title='Черновик', content='<p>Текст</p>', category=1)
+            self.assertTrue(Publication.objects.filter(title='Черновик').exists())
+        self.assertEqual(router.db_for_read(Publication), 'read')
+
+    def test_missing_read_database_falls_back_to_default(self):
+        connection, path = self.file_connection('missing.sqlite3', 'read')
+        connection.settings_dict['NAME'] = f'file:{path}?mode=ro'
+        original = connections['read']
+        connections['read'] = connection
+        self.addCleanup(connections.__setitem__, 'read', original)
+        self.enterContext(mock.patch.object(db, '_read_unavailable_until', 0.0))
+
+        with self.assertLogs('core.db', 'WARNING'):
+            self.assertEqual(db.ReadWriteRouter().db_for_read(Publication), 'default')
+        self.assertIsNone(connection.connection)
+        # повторная попытка - только через DATABASE_READ_RETRY_INTERVAL
+        with mock.patch.object(connection, 'ensure_connection') as ensure_connection:
+            self.assertEqual(db.ReadWriteRouter().db_for_read(Publication), 'default')
+        ensure_connection.assert_not_called()
+
+
+@override_settings(METRICS_DIR='')
+class MetricsTests(TestCase):
+    """
+    Сложение метрик потоков и процессов и вывод в формате Prometheus (core/metrics.py).
+    """
+
+    def setUp(self):
+        super().setUp()
+        # отдельные метрики для теста, без фонового потока записи
+        self.metrics = metrics.ProcessMetrics()
+        self.enterContext(mock.patch.object(metrics, 'process_metrics', self.metrics))
+        self.enterContext(mock.patch.object(metrics.ProcessMetrics, '_start_writer'))
+
+    def run_in_thread(self, func):
+        thread = threading.Thread(target=func)
+        thread.start()
+        thread.join()
+
+    def test_threads_are_merged_and_dead_shards_folded(self):
+        metrics.count_download(1, 100)
+        for _ in range(3):
+            self.run_in_thread(lambda: metrics.count_download(1, 10))
+        self.run_in_thread(lambda: metrics.observe_request('home', 200, 0.02))
+        metrics.observe_request('home', 200, 3)
+
+        expected = {
+            ('downloads_total', (('publication', '1'),)): 4,
+            ('download_bytes_total', (('publication', '1'),)): 130,
+            ('http_requests_total', (('view', 'home'), ('status', '200'))): 2,
+            ('http_request_duration_seconds', (('view', 'home'),)): [0, 0, 1, 0, 0, 0, 0, 0, 0, 1, 0, 0, 3.02],
+        }
+        self.assertEqual(metrics.collect(), expected)
+        # словари завершившихся потоков перенесены в итог процесса
+        self.assertEqual([thread for thread, _ in self.metrics._shards], [threading.current_thread()])
+        self.assertEqual(metrics.collect(), expected)
+
+    def test_render(self):
+        metrics.count_cache('page', True)
+        metrics.count_cache('page', True)
+        metrics.count_cache('page', False)
+        metrics.observe_request('home', 200, 0.02)
+        text = metrics.render(metrics.collect())
+        self.assertIn('# TYPE http_request_duration_seconds histogram\n', text)
+        self.assertIn('http_request_duration_seconds_bucket{view="home",le="0.01"} 0\n', text)
+        self.assertIn('http_request_duration_seconds_bucket{view="home",le="0.025"} 1\n', text)
+        self.assertIn('http_request_duration_seconds_bucket{view="home",le="+Inf"} 1\n', text)
+        self.assertIn('http_request_duration_seconds_count{view="home"} 1\n', text)
+        self.assertIn('http_requests_total{view="home",status="200"} 1\n', text)
+        self.assertIn('cache_hits_total{cache="page"} 2\n', text)
+        self.assertIn('cache_hit_ratio{cache="page"} 0.6666666666666666\n', text)
+
+    def test_process_files_are_summed(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        # файл другого (в том числе завершившегося) процесса
+        with open(os.path.join(directory, '1-1.json'), 'w') as f:
+            json.dump([['downloads_total', [['publication', '1']], 5]], f)
+        with open(os.path.join(directory, 'broken.json'), 'w') as f:
+            f.write('[')
+        metrics.count_download(1, 10)
+        with override_settings(METRICS_DIR=directory):
+            merged = metrics.collect()
+        self.assertEqual(merged[('downloads_total', (('publication', '1'),))], 6)
+        files = sorted(os.listdir(directory))
+        self.assertEqual(len(files), 3)
+        self.assertNotIn('.tmp', ''.join(files))
+        with open(os.path.join(directory, self.metrics._path)) as f:
+            self.assertIn(['downloads_total', [['publication', '1']], 1], json.load(f))
+
+
+class BenchmarkTests(TestCase):
+    """
+    Расчет перцентилей и поиск ухудшений нагрузочного теста (core/benchmark.py).
+    """
+
+    def result(self, p50=10.0, p95=20.0, p99=30.0, queries=2.0):
+        return {'p50': p50, 'p95': p95, 'p99': p99, 'queries': queries}
+
+    def test_percentile_nearest_rank(self):
+        values = [5, 1, 4, 2, 3]
+        self.assertEqual(percentile(values, 50), 3)
+        self.assertEqual(percentile(values, 95), 5)
+        self.assertEqual(percentile(values, 0), 1)
+        self.assertEqual(percentile(list(range(1, 101)), 99), 99)
+        self.assertEqual(percentile([7], 99), 7)
+
+    def test_no_regressions_within_threshold_and_noise(self):
+        baseline = {'page': self.result()}
+        # +15% укладывается в порог 20%, +4 мс у p50 - в шум измерений
+        self.assertEqual(find_regressions({'page': self.result(p50=14.0, p95=23.0, p99=34.5)}, baseline, 20), [])
+
+    def test_latency_and_query_regressions(self):
+        baseline = {'page': self.result(), 'other': self.result()}
+        regressions = find_regressions(
+            {'page': self.result(p95=40.0, queries=3.0), 'new': self.result(p99=1000.0)}, baseline, 20,
+        )
+        self.assertEqual(len(regressions), 2)
+        self.assertTrue(regressions[0].startswith('page: p95'))
+        self.assertTrue(regressions[1].startswith('page: 3.00 запросов'))
+
+    def test_small_latency_growth_is_noise(self):
+        baseline = {'page': self.result(p50=1.0)}
+        self.assertEqual(find_regressions({'page': self.result(p50=4.0)}, baseline, 20), [])
+
+
+@override_settings(CACHES=TEST_CACHES, STORAGES=TEST_STORAGES, METRICS_DIR='')
+class BenchmarkCommandTests(TransactionTestCase):
+    """
+    Запуск команды benchmark на тестовой БД: запросы из нескольких потоков
+    видят данные только после фиксации транзакции, поэтому TransactionTestCase.
+    """
+    # вне транзакции чтение идет через псевдоним read (core/db.py)
+    databases = {'default', 'read'}
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        self.enterContext(override_settings(MEDIA_ROOT=media_root))
+        cache.clear()
+        publication = Publication(title='Урок', content='<p>Текст урока</p>', category=3, is_published=True)
+        publication.presentation_file.save('benchmark.pdf', ContentFile(b'%PDF-1.4 test'), save=False)
+        publication.save()
+        Lesson.objects.create(students_name='Ученик', weekday=1, lesson_time=time(10))
+
+    def run_benchmark(self, endpoints, *args):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        baseline = os.path.join(directory, 'baseline.json')
+        call_command(
+            'benchmark', '--requests', '2', '--warmup', '1', '--endpoints', ','.join(endpoints),
+            '--save-baseline', baseline, *args, stdout=StringIO(), stderr=StringIO(),
+        )
+        download_counter.flush()
+        with open(baseline, encoding='utf-8') as f:
+            results = json.load(f)['endpoints']
+        self.assertEqual(set(results), set(endpoints))
+        for name, result in results.items():
+            with self.subTest(args=args, endpoint=name):
+                self.assertEqual(result['requests'], 2)
+                self.assertEqual(result['errors'], 0, result['statuses'])
+
+    def test_smoke(self):
+        self.run_benchmark(ENDPOINTS, '--server', 'wsgi', '--concurrency', '2')
+        # под ASGI, как в krylovagn/asgi.py, работают асинхронные представления,
+        # и файлы отдаются без синхронных итераторов
+        with override_settings(ROOT_URLCONF=AsyncURLConf), warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter('always')
+            self.run_benchmark(ENDPOINTS, '--server', 'asgi', '--concurrency', '2')
+        self.assertEqual([str(w.message) for w in caught if 'synchronous iterators' in str(w.message)], [])
+
+
+class CursorPaginationTests(MediaTestCase):
+    """
+    Курсорная пагинация ленты (core/pagination.py).
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.publications = [self.make_publication(f'Урок {number}', file=False) for number in range(7)]
+        # у нескольких публикаций одинаковое время создания: порядок между ними задает pk
+        same_time = timezone.now() - timedelta(days=1)
+        Publication.objects.filter(pk__in=[p.pk for p in self.publications[1:6]]).update(created_at=same_time)
+        self.expected = list(Publication.objects.order_by('-created_at', '-pk').values_list('pk', flat=True))
+
+    def test_cursors_walk_the_whole_feed(self):
+        pks, cursor = [], None
+        for _ in range(len(self.expected)):
+            items, cursor = paginate_by_cursor(Publication.objects.all(), cursor, 2)
+            pks += [item.pk for item in items]
+            if cursor is None:
+                break
+        self.assertEqual(pks, self.expected)
+
+    def test_cursor_inside_equal_timestamps(self):
+        items, cursor = paginate_by_cursor(Publication.objects.all(), None, 3)
+        created_at, pk = decode_cursor(cursor)
+        self.assertEqual(pk, self.expected[2])
+        self.assertEqual(Publication.objects.filter(created_at=created_at).count(), 5)
+        items, _ = paginate_by_cursor(Publication.objects.all(), cursor, 3)
+        self.assertEqual([item.pk for item in items], self.expected[3:6])
+
+    def test_feed_view_follows_next_url(self):
+        self.enterContext(mock.patch.object(views.PublicationListView, 'paginate_by', 2))
+        url, pks = '/blog/feed/', []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            pks += [int(pk) for pk in re.findall(r'data-publication-id="(\d+)"', response.json()['html'])]
+            url = response.json()['next_url']
+            self.assertTrue(url is None or 'cursor=' in url)
+        self.assertEqual(pks, self.expected)
+
+    def test_invalid_or_tampered_cursor_is_404(self):
+        tampered = base64.urlsafe_b64encode(b'2026-10-18T00:00:00+00:00|x').decode()
+        for cursor in ('not-a-cursor', '%%%', tampered, base64.urlsafe_b64encode(b'\xff\xfe').decode()):
+            with self.subTest(cursor=cursor):
+                with self.assertRaises(InvalidCursor):
+                    decode_cursor(cursor)
+                self.assertEqual(self.client.get('/blog/', {'cursor': cursor}).status_code, 404)
+                self.assertEqual(self.client.get('/blog/feed/', {'cursor': cursor}).status_code, 404)
+
+
+class AnonymousPageCacheTests(MediaTestCase):
+    """
+    Кэш страниц для анонимных посетителей и условные запросы (AnonymousPageCacheMiddleware).
+    """
+
+    url = '/contacts/'
+
+    def cached_pages(self):
+        return [key for key in cache._cache if 'anonymous_page:' in key]
+
+    def test_page_is_cached_with_etag(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('no-cache', response['Cache-Control'])
+        self.assertIn('Cookie', response['Vary'])
+        self.assertEqual(len(self.cached_pages()), 1)
+        with self.assertNumQueries(0):
+            cached = self.client.get(self.url)
+        self.assertEqual(cached.content, response.content)
+        self.assertEqual(cached['ETag'], response['ETag'])
+
+    def test_conditional_get_returns_304_with_headers(self):
+        response = self.client.get(self.url)
+        with self.assertNumQueries(0):
+            not_modified = self.client.get(self.url, headers={'if-none-match': response['ETag']})
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(not_modified.content, b'')
+        for header in ('ETag', 'Last-Modified', 'Cache-Control', 'Vary'):
+            with self.subTest(header=header):
+                self.assertEqual(not_modified[header], response[header])
+        since = self.client.get(self.url, headers={'if-modified-since': response['Last-Modified']})
+        self.assertEqual(since.status_code, 304)
+
+    def test_content_change_invalidates_etag(self):
+        response = self.client.get(self.url)
+        PageContent.objects.create(page_for='contacts.html', page_name='Контакты', content='<p>Телефон</p>')
+        changed = self.client.get(self.url, headers={'if-none-match': response['ETag']})
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed['ETag'], response['ETag'])
+        self.assertContains(changed, 'Телефон')
+
+    def test_authenticated_users_are_not_cached(self):
+        anonymous = self.client.get(self.url)
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'password'))
+        response = self.client.get(self.url, headers={'if-none-match': anonymous['ETag']})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.content, anonymous.content)
+        self.assertFalse(response.has_header('ETag'))
+        self.assertEqual(len(self.cached_pages()), 1)
+
+    def test_non_get_requests_are_not_cached(self):
+        etag = self.client.get(self.url)['ETag']
+        cache.clear()
+        response = self.client.post(self.url, {'content': '<p>Текст</p>'}, headers={'if-none-match': etag})
+        self.assertNotEqual(response.status_code, 304)
+        self.assertFalse(response.has_header('ETag'))
+        self.assertEqual(self.cached_pages(), [])
+        self.client.head(self.url)
+        self.assertEqual(self.cached_pages(), [])
+
+
+class PublicationDetailTests(MediaTestCase):
+    """
+    Условные запросы к странице публикации.
+    """
+
+    def test_not_modified_has_cache_headers(self):
+        publication = self.make_publication('Страница публикации', file=False)
+        url = f'/publications/{publication.pk}/'
+        response = self.client.get(url)
+        self.assertContains(response, 'Страница публикации')
+        not_modified = self.client.get(url, headers={'if-none-match': response['ETag']})
+        self.assertEqual(not_modified.status_code, 304)
+        for header in ('ETag', 'Last-Modified', 'Cache-Control', 'Vary'):
+            with self.subTest(header=header):
+                self.assertEqual(not_modified[header], response[header])
+
+    def test_edit_changes_etag(self):
+        publication = self.make_publication('Страница публикации', file=False)
+        url = f'/publications/{publication.pk}/'
+        etag = self.client.get(url)['ETag']
+        publication.title = 'Новый заголовок'
+        publication.save()
+        response = self.client.get(url, headers={'if-none-match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Новый заголовок')
+        self.assertNotEqual(response['ETag'], etag)
+
+
+class ViewQueryBudgetTests(QueryBudgetTestMixin, MediaTestCase):
+    """
+    Количество запросов к БД каждого представления core/views.py для анонимного
+    посетителя и администратора: не больше объявленного бюджета и без повторов.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        for page_for in ('landing.html', 'contacts.html', 'lessons_schedule.html'):
+            PageContent.objects.create(page_for=page_for, page_name=page_for, content=f'<p>{page_for}</p>')
+        for weekday in range(3):
+            lesson = Lesson.objects.create(students_name=f'Ученик {weekday}', weekday=weekday, lesson_time=time(10))
+            LessonException.objects.create(lesson=lesson, date=date(2026, 10, 12) + timedelta(days=weekday))
+
+    def setUp(self):
+        super().setUp()
+        self.publications = [self.make_publication(f'Урок {number}', category=number % 2 + 1) for number in range(12)]
+        self.publications.append(self.make_publication('Черновик урока', is_published=False))
+        download_counter.flush()
+
+    def urls(self):
+        pk = self.publications[0].pk
+        ids = ','.join(str(publication.pk) for publication in self.publications)
+        return [
+            '/',
+            '/blog/',
+            '/blog/?category=1',
+            '/blog/?q=урок',
+            '/blog/?q=урок&category=2&page=1',
+            '/blog/?preview=1',
+            '/blog/feed/',
+            f'/publications/{pk}/',
+            f'/publications/{pk}/content/',
+            f'/publications/{pk}/download/',
+            f'/publications/downloads.json?ids={ids}',
+            '/contacts/',
+            '/schedule/',
+            '/schedule/2026/10/',
+            '/schedule/free-slots/',
+            '/schedule/feed.ics',
+            '/schedule/feed.json',
+            '/schedule/feed.json?since=2026-10-01T00:00:00Z',
+            '/metrics/',
+        ]
+
+    def assertWithinBudget(self, url):
+        response = self.client.get(url)
+        if response.streaming:
+            b''.join(response.streaming_content)
+        self.assertIn(response.status_code, (200, 403), url)
+        budget = get_query_budget(response.resolver_match.func)
+        self.assertIsNotNone(budget, f'{url}: у представления не объявлен бюджет запросов')
+        self.assertQueryCountAtMost(response, budget)
+        self.assertNoDuplicateQueries(response)
+        return response
+
+    def test_anonymous(self):
+        for url in self.urls():
+            with self.subTest(url=url):
+                self.assertWithinBudget(url)
+
+    def test_superuser(self):
+        self.client.force_login(self.admin)
+        for url in self.urls():
+            with self.subTest(url=url):
+                self.assertEqual(self.assertWithinBudget(url).status_code, 200)
+
+    def test_page_content_post(self):
+        self.client.force_login(self.admin)
+        for url in ('/', '/contacts/', '/schedule/'):
+            with self.subTest(url=url):
+                response = self.client.post(
+                    url, {'page_name': 'Страница', 'content': '<p>Новый текст</p>'},
+                    headers={'x-requested-with': 'XMLHttpRequest'},
+                )
+                self.assertEqual(response.status_code, 200)
+                self.assertTrue(response.json()['success'])
+                self.assertQueryCountAtMost(response, get_query_budget(response.resolver_match.func))
+                self.assertNoDuplicateQueries(response)
@@ -1,13 +1,32 @@
-from django.shortcuts import render, redirect, get_object_or_404
-from django.http import HttpResponseForbidden, FileResponse, JsonResponse
+from datetime import date, timedelta
+
 from django.conf import settings
+from django.shortcuts import render, redirect, get_object_or_404
+from django.http import HttpResponse, HttpResponseForbidden, JsonResponse, Http404
+from django.template.loader import render_to_string
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.crypto import constant_time_compare
+from django.utils.dateparse import parse_datetime
+from django.utils.http import http_date, quote_etag
 from django.contrib import messages
 from django.views.generic import TemplateView, ListView
-from django.db.models import F
-import bleach
-from bleach.css_sanitizer import CSSSanitizer
-from .models import Publication, Lesson, PageContent
+from django.db.models import Q, Case, When, Value, IntegerField
+from .models import Publication, PageContent
 from .forms import PageContentForm
+from . import feeds, metrics, search
+from .cache import get_page_content, get_publication_html, get_publication_version
+from .counters import download_counter, get_visitor_id, is_first_download, set_visitor_cookie
+from .downloads import response_size, serve_file
+from .instrumentation import query_budget
+from .middleware import AnonymousPageCacheMiddleware
+from .pagination import InvalidCursor, paginate_by_cursor
+from .sanitizer import sanitize_html
+from .schedule import find_free_slots, get_last_modified, get_month_schedule, get_weekly_schedule
+
+# Максимальное количество публикаций в одном запросе счетчиков скачиваний
+MAX_DOWNLOAD_COUNTS = 100
 
 
 def handle_page_content_post(request, template_name, page_name, redirect_url):
@@ -23,13 +42,7 @@ def handle_page_content_post(request, template_name, page_name, redirect_url):
     if form.is_valid():
         #если форма валидна, сохраняем в модель, предварительно очистив от нежелательного HTML
         try:
-            bleached_content = bleach.clean(
-                form.cleaned_data['content'],
-                tags=settings.ALLOWED_TAGS,
-                attributes=settings.ALLOWED_ATTRIBUTES,
-                strip=True,
-                css_sanitizer=CSSSanitizer(),
-            )
+            bleached_content = sanitize_html(form.cleaned_data['content'])
             form.instance.content = bleached_content
             form.instance.page_for = template_name
             form.instance.page_name = page_name
@@ -48,41 +61,206 @@ def handle_page_content_post(request, template_name, page_name, redirect_url):
         return JsonResponse({'success': False, 'errors': form.errors})
     return None, form
 
+# запас бюджета - на запись буфера счетчиков, когда он заполняется в этом запросе
+@query_budget(6)
 def download_file(request, pk):
     """
     Отдает файл для скачивания и увеличивает счетчик загрузок,
-    предотвращая повторный подсчет для одного пользователя в рамках сессии.
-    """
-    pub = get_object_or_404(Publication, pk=pk)
-
-    # Получаем список уже скачанных файлов из сессии.
-    # Если списка нет, создаем пустой.
-    downloaded_files = request.session.get('downloaded_files', [])
-
-    # Проверяем, был ли этот файл уже скачан в текущей сессии
-    if pub.pk not in downloaded_files:
-        # Используем F() для атомарного увеличения счетчика на уровне БД,
-        # чтобы избежать состояния гонки.
-        pub.downloads_count = F('downloads_count') + 1
-        pub.save(update_fields=['downloads_count'])
-        
-        # Добавляем ID файла в список скачанных в сессии
-        downloaded_files.append(pub.pk)
-        request.session['downloaded_files'] = downloaded_files
-        
-        # Явно помечаем сессию как измененную, чтобы Django ее сохранил.
-        # В некоторых случаях, когда изменяются вложенные структуры данных,
-        # это необходимо сделать вручную.
-        request.session.modified = True
-
-    # Отдаем файл пользователю
-    return FileResponse(pub.presentation_file.open(), as_attachment=True, filename=pub.presentation_file.name)
+    предотвращая повторный подсчет для одного посетителя.
+    """
+    pub = get_object_or_404(Publication.objects.only('presentation_file'), pk=pk)
+    if not pub.presentation_file:
+        raise Http404('Файл не прикреплен')
+
+    # Отдаем файл пользователю (с поддержкой Range, ETag и X-Accel-Redirect)
+    response = serve_file(request, pub.presentation_file)
+    # Ответы 304/412/416 и запросы HEAD не передают файл и не считаются скачиванием
+    if request.method == 'HEAD' or response.status_code not in (200, 206):
+        return response
+    metrics.count_download(pub.pk, response_size(response, pub.presentation_file))
+
+    # Повторные скачивания отслеживаются по отметкам DownloadMark, без записи в сессию;
+    # отметки записываются в БД пакетом вместе со счетчиком
+    visitor_id, is_new_visitor = get_visitor_id(request)
+    if is_first_download(visitor_id, pub.pk):
+        # Счетчик накапливается в памяти и записывается в БД пакетом,
+        # см. core/counters.py
+        download_counter.increment(pub.pk)
+    if is_new_visitor:
+        set_visitor_cookie(response, visitor_id)
+
+    return response
+
+@query_budget(4)
+def schedule_free_slots(request):
+    """
+    Возвращает в JSON свободные промежутки расписания, в которые помещается занятие
+    длительностью duration минут (по умолчанию 60). Параметр weekday ограничивает
+    ответ одним днем недели.
+    """
+    try:
+        duration = int(request.GET.get('duration', 60))
+        weekday = request.GET.get('weekday')
+        weekdays = [int(weekday)] if weekday not in (None, '') else range(7)
+    except ValueError:
+        return JsonResponse({'error': 'Параметры duration и weekday должны быть числами'}, status=400)
+    if duration <= 0 or any(day not in range(7) for day in weekdays):
+        return JsonResponse({'error': 'Недопустимые значения duration или weekday'}, status=400)
+
+    slots = {
+        day: [
+            {'start': start.strftime('%H:%M'), 'end': end.strftime('%H:%M')}
+            for start, end in find_free_slots(day, duration)
+        ]
+        for day in weekdays
+    }
+    return JsonResponse({'duration': duration, 'slots': slots})
+
+@query_budget(6)
+def schedule_feed(request, fmt):
+    """
+    Выгрузка расписания в формате iCalendar (fmt='ics') или JSON (fmt='json')
+    с поддержкой условных запросов. Для JSON параметр since (ISO 8601)
+    возвращает только изменения после указанного момента.
+    """
+    since = request.GET.get('since')
+    if since:
+        try:
+            since = parse_datetime(since)
+        except ValueError:
+            since = None
+        if since is None or fmt != 'json':
+            return JsonResponse({'error': 'Параметр since должен быть датой и временем в формате ISO 8601 '
+                                          '(поддерживается только для JSON)'}, status=400)
+        if timezone.is_naive(since):
+            since = timezone.make_aware(since)
+        # отметки об удалении старше окна синхронизации удаляются (core.purge_deleted_lessons),
+        # поэтому клиент, который давно не синхронизировался, получает полную выгрузку
+        if since < timezone.now() - timedelta(days=getattr(settings, 'SCHEDULE_SYNC_WINDOW_DAYS', 90)):
+            since = None
+
+    last_modified = get_last_modified()
+    version = int(last_modified.timestamp() * 1_000_000) if last_modified else 0
+    etag = quote_etag(f'{fmt}-{version:x}' + (f'-{since.timestamp():.6f}' if since else ''))
+    last_modified_ts = int(last_modified.timestamp()) if last_modified else None
+
+    # условный GET: если расписание не менялось, отвечаем 304 без построения выгрузки
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified_ts)
+    if response is None:
+        if since is not None:
+            content = feeds.build_json(last_modified, since=since)
+        else:
+            content = feeds.get_feed(fmt, last_modified)
+        content_type = 'text/calendar; charset=utf-8' if fmt == 'ics' else 'application/json'
+        response = HttpResponse(content, content_type=content_type)
+    response.headers['ETag'] = etag
+    if last_modified_ts is not None:
+        response.headers['Last-Modified'] = http_date(last_modified_ts)
+    # клиент может хранить выгрузку, но обязан проверять ее актуальность
+    patch_cache_control(response, no_cache=True)
+    return response
+
+@query_budget(3)
+def publication_content(request, pk):
+    """
+    Полный HTML публикации для раскрытия отрывка в ленте.
+    Черновики доступны только администратору.
+    """
+    queryset = Publication.objects.only('content', 'is_published')
+    if not request.user.is_superuser:
+        queryset = queryset.filter(is_published=True)
+    publication = get_object_or_404(queryset, pk=pk)
+    # content очищен при сохранении (см. core/signals.py)
+    return HttpResponse(publication.content)
+
+@query_budget(2)
+def publication_downloads(request):
+    """
+    Счетчики скачиваний публикаций ids (через запятую) в JSON.
+    Лента публикаций хранится в кэше страниц, поэтому актуальные значения
+    счетчиков подгружаются отдельным запросом, а не из закэшированного HTML.
+    """
+    try:
+        ids = {int(pk) for pk in request.GET.get('ids', '').split(',') if pk}
+    except ValueError:
+        return JsonResponse({'error': 'Параметр ids должен быть списком чисел через запятую'}, status=400)
+    if len(ids) > MAX_DOWNLOAD_COUNTS:
+        return JsonResponse({'error': f'Не более {MAX_DOWNLOAD_COUNTS} публикаций за запрос'}, status=400)
+    queryset = Publication.objects.filter(pk__in=ids)
+    if not request.user.is_superuser:
+        queryset = queryset.filter(is_published=True)
+    # к записанным в БД значениям добавляем еще не сброшенные приращения этого процесса
+    counts = {
+        str(pk): count + download_counter.pending(pk)
+        for pk, count in queryset.values_list('pk', 'downloads_count')
+    }
+    response = JsonResponse({'counts': counts})
+    patch_cache_control(response, no_cache=True)
+    return response
+
+@query_budget(4)
+def publication_detail(request, pk):
+    """
+    Страница публикации. Текст статьи рендерится один раз для каждой версии
+    публикации и берется из кэша (см. core/cache.py). Анонимные посетители
+    получают ETag и Last-Modified по времени изменения публикации, поэтому
+    повторный условный запрос получает 304 без рендеринга шаблона.
+    """
+    queryset = Publication.objects.only('title', 'updated_at', 'is_published')
+    if not request.user.is_superuser:
+        queryset = queryset.filter(is_published=True)
+    publication = get_object_or_404(queryset, pk=pk)
+    version = get_publication_version(publication.updated_at)
+
+    # меню администратора и одноразовые сообщения в ETag не учитываются
+    conditional = (
+        not request.user.is_authenticated
+        and getattr(settings, 'MESSAGE_COOKIE_NAME', 'messages') not in request.COOKIES
+    )
+    etag = quote_etag(f'publication-{pk}-{version:x}')
+    last_modified = int(publication.updated_at.timestamp())
+    if conditional:
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is not None:
+            # 304 несет те же заголовки, что и полный ответ (RFC 9110, 15.4.5)
+            AnonymousPageCacheMiddleware.set_cache_headers(response, etag, last_modified)
+            return response
+
+    response = render(request, 'publication_detail.html', {
+        'publication': publication,
+        'article': get_publication_html(pk, version),
+    })
+    if conditional:
+        AnonymousPageCacheMiddleware.set_cache_headers(response, etag, last_modified)
+    return response
+
+@query_budget(3)
+def metrics_view(request):
+    """
+    Метрики сайта в текстовом формате Prometheus (см. core/metrics.py).
+    Доступны администратору или по токену METRICS_TOKEN в заголовке
+    Authorization: Bearer <токен>.
+    """
+    token = getattr(settings, 'METRICS_TOKEN', '')
+    authorized = bool(token) and constant_time_compare(
+        request.headers.get('Authorization', ''), f'Bearer {token}'
+    )
+    if not authorized and not request.user.is_superuser:
+        return HttpResponseForbidden('Доступ к метрикам запрещен')
+    response = HttpResponse(
+        metrics.render(metrics.collect()),
+        content_type='text/plain; version=0.0.4; charset=utf-8',
+    )
+    patch_cache_control(response, no_store=True)
+    return response
 
 class LandingView(TemplateView):
     """
     Главная страница сайта.
     """
     template_name = 'landing.html'
+    # допустимое количество запросов к БД (см. core/instrumentation.py)
+    query_budget = 5
 
     def get_context_data(self, form=None, **kwargs):
         """
@@ -93,7 +271,7 @@ class LandingView(TemplateView):
             if form is not None:
                 context['form'] = form
             else:
-                page_content = PageContent.objects.filter(page_for=self.template_name).first()
+                page_content = get_page_content(self.template_name, request=self.request)
                 initial = {'content': page_content.content} if page_content else {}
                 context['form'] = PageContentForm(initial=initial)
         return context
@@ -124,29 +302,129 @@ class PublicationListView(ListView):
     template_name = 'publication_list.html'
     context_object_name = 'publications'
     paginate_by = 10
+    query_budget = 5
+    # колонки, которые выводит карточка публикации: полный content в ленте не загружается
+    list_fields = (
+        'title', 'excerpt', 'word_count', 'category', 'created_at', 'presentation_file', 'preview_file',
+        'preview_thumbnail', 'preview_page_count', 'is_published', 'downloads_count',
+    )
+
+    def is_preview(self):
+        """
+        Режим предпросмотра: администратор видит в ленте и неопубликованные черновики.
+        """
+        return self.request.user.is_superuser and self.request.GET.get('preview') == '1'
+
+    def get_category(self):
+        """
+        Категория из параметра category или None, если параметр пустой или не число.
+        """
+        try:
+            return int(self.request.GET.get('category', ''))
+        except ValueError:
+            return None
 
     def get_queryset(self):
         """
         Возвращает queryset с учетом поискового запроса.
         """
         search_query = self.request.GET.get('q', '')
-        category = self.request.GET.get('category', None)
-        queryset = Publication.objects.all().order_by('-created_at')
+        category = self.get_category()
+        queryset = Publication.objects.only(*self.list_fields).order_by('-created_at')
+        # фильтруем черновики на уровне БД, чтобы они не попадали в пагинацию
+        if not self.is_preview():
+            queryset = queryset.filter(is_published=True)
+
+        if category is not None:
+            queryset = queryset.filter(category=category)
 
         if search_query:
-            queryset = queryset.filter(
-                title__icontains=search_query
-            ) | queryset.filter(
-                content__icontains=search_query
+            found_ids = search.search(search_query, category=category, published_only=not self.is_preview())
+            if found_ids is None:
+                # полнотекстовый индекс недоступен - ищем простым вхождением
+                queryset = queryset.filter(
+                    Q(title__icontains=search_query) | Q(content__icontains=search_query)
+                )
+            elif not found_ids:
+                queryset = queryset.none()
+            else:
+                # сохраняем порядок по релевантности, который вернул индекс
+                ranking = Case(
+                    *[When(pk=pk, then=Value(position)) for position, pk in enumerate(found_ids)],
+                    output_field=IntegerField(),
+                )
+                queryset = queryset.filter(pk__in=found_ids).order_by(ranking, '-created_at')
+
+        return queryset
+
+    def is_cursor_mode(self):
+        """
+        Курсорная пагинация используется для хронологической ленты. Результаты поиска
+        отсортированы по релевантности и ограничены SEARCH_RESULTS_LIMIT,
+        поэтому для них остается обычная постраничная разбивка.
+        """
+        return not self.request.GET.get('q') and 'page' not in self.request.GET
+
+    def paginate_queryset(self, queryset, page_size):
+        """
+        Разбивает ленту на страницы по курсору (created_at, pk) без запроса COUNT(*).
+        """
+        if getattr(self, 'paginated', None) is not None:
+            # страница уже получена асинхронным представлением (см. core/async_views.py)
+            return self.paginated
+        if not self.is_cursor_mode():
+            return super().paginate_queryset(queryset, page_size)
+        try:
+            items, self.next_cursor = paginate_by_cursor(
+                queryset, self.request.GET.get('cursor'), page_size
             )
-            queryset = queryset.distinct().order_by('-created_at')
+        except InvalidCursor:
+            raise Http404('Неверный курсор страницы')
+        return None, None, items, self.next_cursor is not None
 
-        if category:
-            queryset = queryset.filter(category=category)
+    def get_next_query(self, context):
+        """
+        Возвращает строку GET-параметров следующей страницы или None, если это последняя страница.
+        """
+        params = self.request.GET.copy()
+        if self.is_cursor_mode():
+            if not getattr(self, 'next_cursor', None):
+                return None
+            params['cursor'] = self.next_cursor
+        else:
+            page_obj = context.get('page_obj')
+            if page_obj is None or not page_obj.has_next():
+                return None
+            params['page'] = page_obj.next_page_number()
+        return params.urlencode()
 
-        return queryset
+    def get_context_data(self, **kwargs):
+        """
+        Добавляет в контекст признак режима предпросмотра и ссылку на следующую страницу.
+        """
+        context = super().get_context_data(**kwargs)
+        # добавляем скачивания, которые еще не записаны в БД
+        for publication in context['object_list']:
+            publication.downloads_count += download_counter.pending(publication.pk)
+        context['preview'] = self.is_preview()
+        context['next_query'] = self.get_next_query(context)
+        return context
 
 
+class PublicationFeedView(PublicationListView):
+    """
+    Следующая страница ленты публикаций в виде HTML-фрагмента для подгрузки при прокрутке.
+    """
+
+    def render_to_response(self, context, **response_kwargs):
+        """
+        Возвращает JSON с разметкой карточек и адресом следующего фрагмента.
+        """
+        # рендерим только карточки, без base.html и контекстных процессоров
+        html = render_to_string('publication_cards.html', context)
+        next_query = context['next_query']
+        next_url = f"{reverse('publication_feed')}?{next_query}" if next_query else None
+        return JsonResponse({'html': html, 'next_url': next_url})
 
 
 class ContactPageView(TemplateView):
@@ -154,6 +432,7 @@ class ContactPageView(TemplateView):
     Страница контактов.
     """
     template_name = 'contacts.html'
+    query_budget = 5
 
     def get_context_data(self, **kwargs):
         """
@@ -161,7 +440,7 @@ class ContactPageView(TemplateView):
         """
         context = super().get_context_data(**kwargs)
         if self.request.user.is_superuser:
-            page_content = PageContent.objects.filter(page_for=self.template_name).first()
+            page_content = get_page_content(self.template_name, request=self.request)
             initial = {'content': page_content.content} if page_content else {}
             context['form'] = PageContentForm(initial=initial)
         return context
@@ -182,42 +461,57 @@ class ContactPageView(TemplateView):
         context = self.get_context_data(form=form)
         return self.render_to_response(context)
 
-class LessonScheduleView(ListView):
+class LessonScheduleView(TemplateView):
     """
     Расписание уроков.
     """
-    model = Lesson
     template_name = 'lessons_schedule.html'
-    context_object_name = 'lessons'
+    # недельная сетка и календарь месяца показывают одни объявления (см. core/context_processors.py)
+    page_for = 'lessons_schedule.html'
+    query_budget = 5
+    # расписание, заранее полученное асинхронным представлением (см. core/async_views.py)
+    schedule = None
 
-    def get_queryset(self):
+    def get_month(self):
         """
-        Метод возвращает отсортированный по дню недели и времени уроков queryset.
+        Возвращает (год, месяц) из адреса страницы или None для недельной сетки.
         """
-        return Lesson.objects.all().order_by('weekday', 'lesson_time')
-    
+        year, month = self.kwargs.get('year'), self.kwargs.get('month')
+        if year is None:
+            return None
+        if not 1 <= month <= 12 or not 1 <= year <= 9999:
+            raise Http404('Неверный месяц')
+        return year, month
+
+    def get_schedule(self):
+        """
+        Возвращает календарь месяца или недельную сетку из кэша.
+        Сетка строится один раз и сбрасывается при изменении уроков, см. core/schedule.py
+        """
+        month = self.get_month()
+        return get_weekly_schedule() if month is None else get_month_schedule(*month)
+
     def get_context_data(self, **kwargs):
         """
-        Метод обработки контекста с группировкой уроков по дням недели
+        Метод обработки контекста с недельной сеткой уроков из кэша
         и добавления формы редактирования контента страницы в контекст
         """
         context = super().get_context_data(**kwargs)
-        lessons = self.get_queryset()
-        lessons_by_weekday ={}
-        # Инициализируем словарь для хранения уроков по дням недели
-        for weekday_num, weekday_name in Lesson.weekday.field.choices:
-            lessons_by_weekday[weekday_num] = []
-        # Группируем уроки по дням недели
-        for lesson in lessons:
-            lessons_by_weekday[lesson.weekday].append(lesson)
-        # Формируем список для шаблона
-        schedule = []
-        for weekday_num, weekday_name in Lesson.weekday.field.choices:
-            schedule.append((weekday_num, weekday_name, lessons_by_weekday[weekday_num]))
-        context['schedule'] = schedule
+        schedule = self.schedule if self.schedule is not None else self.get_schedule()
+        month = self.get_month()
+        if month is not None:
+            # Календарь месяца с развернутыми повторяющимися занятиями
+            year, month = month
+            context['month'] = date(year, month, 1)
+            context['weeks'] = schedule
+            context['prev_month'] = (year - 1, 12) if month == 1 else (year, month - 1)
+            context['next_month'] = (year + 1, 1) if month == 12 else (year, month + 1)
+        else:
+            context['schedule'] = schedule
+            context['today'] = timezone.localdate()
         # Добавляем контент страницы
         if self.request.user.is_superuser:
-            page_content = PageContent.objects.filter(page_for=self.template_name).first()
+            page_content = get_page_content(self.template_name, request=self.request)
             initial = {'content': page_content.content} if page_content else {}
             context['form'] = PageContentForm(initial=initial)
         return context
@@ -12,5 +12,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'krylovagn.settings')
+# под ASGI используются асинхронные представления (core/async_views.py)
+os.environ.setdefault('ASYNC_VIEWS', 'True')
 
 application = get_asgi_application()
@@ -0,0 +1,48 @@
+"""
+Запуск сайта под ASGI-сервером uvicorn:
+
+    python -m krylovagn.serve
+
+Параметры задаются переменными окружения (значения по умолчанию рассчитаны
+на работу за nginx на небольшом VPS):
+    ASGI_HOST, ASGI_PORT        - адрес и порт (127.0.0.1:8000);
+    ASGI_WORKERS                - количество процессов (1);
+    ASGI_LIMIT_CONCURRENCY      - предел одновременных соединений на процесс,
+                                  сверх него сервер отвечает 503 (1000);
+    ASGI_BACKLOG                - очередь соединений, ожидающих accept (2048);
+    ASGI_KEEPALIVE_TIMEOUT      - время жизни простаивающего keep-alive соединения, секунд (5);
+    ASGI_FORWARDED_ALLOW_IPS    - адреса прокси, которым доверяются X-Forwarded-* (127.0.0.1).
+
+Скачивания отдаются асинхронным итератором (core/async_views.py), поэтому медленные
+клиенты не занимают потоки и один процесс держит много одновременных скачиваний.
+"""
+import os
+
+
+def get_config():
+    """
+    Возвращает параметры uvicorn.run из переменных окружения.
+    """
+    return {
+        'host': os.getenv('ASGI_HOST', '127.0.0.1'),
+        'port': int(os.getenv('ASGI_PORT', 8000)),
+        'workers': int(os.getenv('ASGI_WORKERS', 1)),
+        'limit_concurrency': int(os.getenv('ASGI_LIMIT_CONCURRENCY', 1000)),
+        'backlog': int(os.getenv('ASGI_BACKLOG', 2048)),
+        'timeout_keep_alive': int(os.getenv('ASGI_KEEPALIVE_TIMEOUT', 5)),
+        'proxy_headers': True,
+        'forwarded_allow_ips': os.getenv('ASGI_FORWARDED_ALLOW_IPS', '127.0.0.1'),
+        # Django не поддерживает события lifespan
+        'lifespan': 'off',
+        'server_header': False,
+    }
+
+
+def main():
+    import uvicorn
+
+    uvicorn.run('krylovagn.asgi:application', **get_config())
+
+
+if __name__ == '__main__':
+    main()
@@ -64,11 +64,14 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'core.middleware.StaticFilesMiddleware',
+    'core.middleware.RequestInstrumentationMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
+    'core.middleware.AnonymousPageCacheMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
@@ -92,16 +95,136 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'krylovagn.wsgi.application'
+ASGI_APPLICATION = 'krylovagn.asgi.application'
+# Асинхронные представления страниц и скачиваний (core/async_views.py),
+# включаются при запуске через krylovagn/asgi.py
+ASYNC_VIEWS = os.getenv('ASYNC_VIEWS') == 'True'
 
 
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
+# Соединения с SQLite настраиваются в core/db.py: PRAGMA из SQLITE_PRAGMAS
+# и отдельное соединение только для чтения ('read'), куда ReadWriteRouter направляет чтение.
+# CONN_MAX_AGE - время жизни постоянного соединения, секунд (0 - новое соединение на каждый запрос).
+# SQLITE_BUSY_TIMEOUT - сколько миллисекунд соединение ждет блокировку БД (busy_timeout),
+# передается драйверу sqlite3 параметром timeout.
+DATABASE_PATH = BASE_DIR / 'db.sqlite3'
+DATABASE_CONN_MAX_AGE = int(os.getenv('DATABASE_CONN_MAX_AGE', 600))
+SQLITE_BUSY_TIMEOUT = int(os.getenv('SQLITE_BUSY_TIMEOUT', 5000))
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'NAME': DATABASE_PATH,
+        'CONN_MAX_AGE': DATABASE_CONN_MAX_AGE,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            # блокировка на запись берется в начале транзакции: без этого при повышении
+            # блокировки SQLite сразу возвращает "database is locked", не дожидаясь busy_timeout
+            'transaction_mode': 'IMMEDIATE',
+            'timeout': SQLITE_BUSY_TIMEOUT / 1000,
+        },
+    },
+}
+# Соединение только для чтения не может создать файл БД и файл -shm журнала WAL:
+# пока их нет (до первого migrate) или каталог БД недоступен для записи, чтение
+# идет через основное соединение, а 'read' проверяется повторно через
+# DATABASE_READ_RETRY_INTERVAL секунд (см. core/db.py).
+if os.getenv('DATABASE_READ_CONNECTION', 'True') == 'True':
+    DATABASES['read'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': f'{DATABASE_PATH.as_uri()}?mode=ro',
+        'CONN_MAX_AGE': DATABASE_CONN_MAX_AGE,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {'timeout': SQLITE_BUSY_TIMEOUT / 1000},
+        'TEST': {'MIRROR': 'default'},
     }
+DATABASE_ROUTERS = ['core.db.ReadWriteRouter']
+DATABASE_READ_RETRY_INTERVAL = 60
+
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'mmap_size': int(os.getenv('SQLITE_MMAP_SIZE', 128 * 1024 * 1024)),
+    # отрицательное значение - размер кэша страниц в КиБ
+    'cache_size': int(os.getenv('SQLITE_CACHE_SIZE', -32000)),
+    'temp_store': 'MEMORY',
+    'foreign_keys': 'ON',
+}
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# По умолчанию используется файловый кэш: он общий для всех воркеров gunicorn,
+# поэтому сброс кэша сигналом в одном процессе виден остальным.
+# Когда записей становится больше MAX_ENTRIES, файловый кэш удаляет случайную
+# 1/CULL_FREQUENCY часть записей, в том числе записанных без срока жизни (timeout None).
+# Поэтому код сайта не рассчитывает на сохранность ключей: версия контента, контент
+# страниц и расписание при отсутствии ключа вычисляются заново.
+# Каждая запись в файловый кэш просматривает каталог кэша, так что MAX_ENTRIES
+# не стоит делать слишком большим; для большой нагрузки укажите CACHE_BACKEND Redis или Memcached.
+
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv('CACHE_BACKEND', 'django.core.cache.backends.filebased.FileBasedCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', str(BASE_DIR / 'cache')),
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.getenv('CACHE_MAX_ENTRIES', 5000)),
+            'CULL_FREQUENCY': int(os.getenv('CACHE_CULL_FREQUENCY', 3)),
+        },
+    }
+}
+
+# Время жизни контента страниц (PageContent) в общем кэше, None - до изменения записи
+PAGE_CONTENT_CACHE_TIMEOUT = None
+# Время жизни копии контента страниц в памяти процесса, секунд
+PAGE_CONTENT_LOCAL_TTL = int(os.getenv('PAGE_CONTENT_LOCAL_TTL', 5))
+
+# Кэш страниц для анонимных посетителей (core.middleware.AnonymousPageCacheMiddleware)
+ANONYMOUS_CACHE_URL_NAMES = [
+    'landing',
+    'publication_list',
+    'publication_feed',
+    'publication_content',
+    'contacts',
+    'lessons_schedule',
+    'lessons_schedule_month',
+]
+# Время хранения страницы в кэше, секунд
+ANONYMOUS_CACHE_TIMEOUT = int(os.getenv('ANONYMOUS_CACHE_TIMEOUT', 600))
+
+# Учет SQL-запросов и времени обработки запросов (core/instrumentation.py)
+# Заголовок Server-Timing с количеством и временем запросов к БД и временем рендеринга
+SERVER_TIMING_HEADER = os.getenv('SERVER_TIMING_HEADER', str(DEBUG)) == 'True'
+# Исключение при превышении бюджета запросов представления (включается в тестах)
+QUERY_BUDGET_RAISE = os.getenv('QUERY_BUDGET_RAISE') == 'True'
+
+# Метрики в формате Prometheus (core/metrics.py), адрес /metrics/
+# Токен для сборщика метрик (заголовок Authorization: Bearer <токен>), без токена метрики видит только администратор
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+# Каталог, в который каждый процесс записывает снимок своих метрик для суммирования по всем
+# воркерам gunicorn. Каталог очищается при перезапуске сервиса (см. .github/workflows/deploy.yml).
+# Пустое значение - метрики только процесса, обработавшего запрос
+METRICS_DIR = os.getenv('METRICS_DIR', str(BASE_DIR / 'metrics'))
+# Интервал записи снимка метрик процесса, секунд
+METRICS_FLUSH_INTERVAL = int(os.getenv('METRICS_FLUSH_INTERVAL', 10))
+
+# Статистика каждого запроса пишется в журнал core.instrumentation одной строкой JSON
+# с уровнем INFO, превышение бюджета запросов - с уровнем WARNING
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'core.instrumentation': {
+            'handlers': ['console'],
+            'level': os.getenv('REQUEST_LOG_LEVEL', 'WARNING'),
+            'propagate': False,
+        },
+    },
 }
 
 
@@ -146,9 +269,87 @@ STATIC_URL = 'static/'
 STATIC_ROOT = BASE_DIR / 'staticfiles'
 STATICFILES_DIRS = [BASE_DIR / "static"]
 
+# collectstatic добавляет хэш содержимого в имена файлов, создает сжатые .gz/.br
+# (.br - если установлен пакет brotli) и уменьшенные копии изображений в WebP/AVIF.
+# В продакшене статику отдает core.middleware.StaticFilesMiddleware.
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'krylovagn.storage.CompressedManifestStaticFilesStorage',
+    },
+}
+# Ширины уменьшенных копий изображений статики (тег {% responsive_image %}) и качество сжатия
+STATIC_IMAGE_WIDTHS = (480, 960, 1600)
+STATIC_IMAGE_QUALITY = 75
+# Время хранения в браузере статики без хэша в имени, секунд
+STATIC_MAX_AGE = 60 * 60
+
 MEDIA_URL = 'media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Рабочий день для поиска свободного времени в расписании (core/schedule.py)
+SCHEDULE_DAY_START = '08:00'
+SCHEDULE_DAY_END = '21:00'
+# Время хранения полной выгрузки расписания (core/feeds.py), секунд.
+# Ключ кэша меняется при изменении расписания, так что это лишь срок жизни старых выгрузок.
+SCHEDULE_FEED_CACHE_TIMEOUT = 60 * 60 * 24
+# Окно инкрементальной синхронизации выгрузки (?since=), дней: отметки об удалении занятий
+# старше окна удаляются фоновой задачей core.purge_deleted_lessons раз в SCHEDULE_SYNC_PURGE_INTERVAL
+# секунд, а запрос с более старым since получает полную выгрузку
+SCHEDULE_SYNC_WINDOW_DAYS = int(os.getenv('SCHEDULE_SYNC_WINDOW_DAYS', 90))
+SCHEDULE_SYNC_PURGE_INTERVAL = 60 * 60 * 24
+# Время хранения календаря месяца (core/schedule.py), секунд. Ключ тоже содержит версию расписания.
+SCHEDULE_MONTH_CACHE_TIMEOUT = 60 * 60 * 24
+
+# Миниатюры превью публикаций (core/previews.py): ширина в пикселях и качество WebP.
+# Для миниатюр PDF нужен установленный пакет pymupdf.
+PREVIEW_THUMBNAIL_WIDTH = 800
+PREVIEW_THUMBNAIL_QUALITY = 80
+
+# Очередь фоновых задач (core/tasks.py, команда run_worker)
+# True - задачи выполняются сразу при постановке в очередь, без воркера (удобно для разработки)
+TASK_QUEUE_EAGER = os.getenv('TASK_QUEUE_EAGER') == 'True'
+# Количество одновременно выполняемых задач и пауза между проверками очереди, секунд
+TASK_WORKER_CONCURRENCY = int(os.getenv('TASK_WORKER_CONCURRENCY', 2))
+TASK_POLL_INTERVAL = 2
+# Количество попыток, базовая задержка перед повтором (удваивается с каждой попыткой),
+# время, после которого зависшая задача возвращается в очередь, и интервал проверки
+# зависших задач, секунд
+TASK_MAX_ATTEMPTS = 3
+TASK_RETRY_DELAY = 30
+TASK_LOCK_TIMEOUT = 600
+TASK_REQUEUE_INTERVAL = 60
+# Выполненные задачи хранятся TASK_DONE_RETENTION_DAYS дней и затем удаляются
+# фоновой задачей core.purge_finished_tasks раз в TASK_PURGE_INTERVAL секунд
+TASK_DONE_RETENTION_DAYS = int(os.getenv('TASK_DONE_RETENTION_DAYS', 7))
+TASK_PURGE_INTERVAL = 60 * 60 * 24
+
+# Сессии нужны только администратору: скачивания учитываются без сессий (core/counters.py).
+# По умолчанию сессия читается из кэша, а БД используется только при записи и промахе кэша.
+# Без записи в БД совсем: SESSION_ENGINE=django.contrib.sessions.backends.signed_cookies
+SESSION_ENGINE = os.getenv('SESSION_ENGINE', 'django.contrib.sessions.backends.cached_db')
+# Период удаления истекших сессий фоновой задачей core.clear_expired_sessions, секунд
+SESSION_PURGE_INTERVAL = 60 * 60 * 24
+
+# Отдача файлов публикаций (core/downloads.py)
+# None - файл отдает Django, 'nginx' - через X-Accel-Redirect, 'sendfile' - через X-Sendfile.
+# Для nginx нужен внутренний location, например:
+#   location /protected-media/ { internal; alias /home/v/major/media/; }
+DOWNLOAD_SENDFILE_BACKEND = os.getenv('DOWNLOAD_SENDFILE_BACKEND') or None
+DOWNLOAD_ACCEL_REDIRECT_PREFIX = os.getenv('DOWNLOAD_ACCEL_REDIRECT_PREFIX', '/protected-media/')
+# Максимальное количество диапазонов в одном Range-запросе
+DOWNLOAD_MAX_RANGES = 16
+# Отложенная запись счетчика скачиваний (core/counters.py):
+# интервал записи в БД, секунд, и количество скачиваний, после которого запись происходит сразу
+DOWNLOAD_COUNTER_FLUSH_INTERVAL = int(os.getenv('DOWNLOAD_COUNTER_FLUSH_INTERVAL', 10))
+DOWNLOAD_COUNTER_FLUSH_SIZE = int(os.getenv('DOWNLOAD_COUNTER_FLUSH_SIZE', 100))
+# Срок, в течение которого повторное скачивание файла тем же посетителем не учитывается, секунд
+DOWNLOAD_DEDUP_TTL = 60 * 60 * 24 * 14
+# Период удаления устаревших отметок о скачивании фоновой задачей core.purge_download_marks, секунд
+DOWNLOAD_DEDUP_PURGE_INTERVAL = 60 * 60 * 24
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
@@ -166,6 +367,9 @@ customColorPalette = [
 ]
 
 CKEDITOR_5_CUSTOM_CSS = 'django_ckeditor_5/admin_dark_mode_fix.css'
+# Загрузки редактора хранятся по хэшу содержимого без дублей (media/cas/),
+# неиспользуемые файлы удаляет команда gc_media
+CKEDITOR_5_FILE_STORAGE = 'krylovagn.storage.ContentAddressedStorage'
 
 
 CKEDITOR_5_CONFIGS = {
@@ -227,21 +431,30 @@ CKEDITOR_5_CONFIGS = {
     },
 }
 
-# Настройки Bleach для очистки HTML
+# Настройки Bleach для очистки HTML (core/sanitizer.py)
+# Список покрывает разметку, которую создают кнопки панели CKEditor 5;
+# label и input нужны списку задач (todoList), из полей ввода остаются только флажки
 ALLOWED_TAGS = [
-    'p', 'br', 'strong', 'b', 'em', 'i', 'u', 'a',
-    'ul', 'ol', 'li', 'blockquote',
+    'p', 'br', 'strong', 'b', 'em', 'i', 'u', 's', 'a',
+    'sub', 'sup', 'mark', 'code', 'pre', 'hr',
+    'ul', 'ol', 'li', 'blockquote', 'label', 'input',
     'h1', 'h2', 'h3', 'h4', 'h5', 'h6',
-    'img', 'span', 'div',
-    'table', 'thead', 'tbody', 'tr', 'th', 'td'
+    'img', 'span', 'div', 'figure', 'figcaption', 'oembed',
+    'table', 'caption', 'colgroup', 'col', 'thead', 'tbody', 'tfoot', 'tr', 'th', 'td'
 ]
 ALLOWED_ATTRIBUTES = {
     '*': ['style', 'class'],
     'a': ['href', 'title', 'target', 'rel'],
-    'img': ['src', 'alt', 'title', 'width', 'height', 'style'],
+    'img': ['src', 'srcset', 'sizes', 'alt', 'title', 'width', 'height', 'style'],
+    'ol': ['start', 'reversed', 'style', 'class'],
+    'input': ['type', 'checked', 'disabled', 'class'],
+    'oembed': ['url'],
+    'col': ['span', 'style'],
     'th': ['colspan', 'rowspan', 'style', 'class'],
     'td': ['colspan', 'rowspan', 'style', 'class'],
 }
+# Количество результатов очистки HTML, запоминаемых в памяти процесса
+SANITIZER_CACHE_SIZE = 256
 
 # Настройки темы Jazzmin для админки
 JAZZMIN_SETTINGS = {
@@ -274,4 +487,13 @@ JAZZMIN_SETTINGS = {
 JAZZMIN_UI_TWEAKS = {
     "theme": "litera",
     "dark_mode_theme": "slate",
-}
\ No newline at end of file
+}
+# Количество слов в отрывке публикации в ленте блога (core/excerpts.py)
+EXCERPT_WORDS = int(os.getenv('EXCERPT_WORDS', 50))
+# Время хранения отрендеренного текста публикации для ее страницы (core/cache.py), секунд.
+# Ключ кэша меняется при изменении публикации, так что это лишь срок жизни старых версий.
+PUBLICATION_CACHE_TIMEOUT = int(os.getenv('PUBLICATION_CACHE_TIMEOUT', 60 * 60 * 24))
+
+# Полнотекстовый поиск по публикациям
+# Максимальное количество результатов, возвращаемых поисковым индексом
+SEARCH_RESULTS_LIMIT = int(os.getenv('SEARCH_RESULTS_LIMIT', 200))
@@ -1,13 +1,181 @@
+import gzip
+import hashlib
+import io
 import os
-from datetime import datetime
+import re
+import tempfile
 from urllib.parse import urljoin
 
 from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.files.base import ContentFile
 from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+from PIL import Image, features
 
+try:
+    import brotli
+except ImportError:  # пакет brotli не установлен - создаются только .gz
+    brotli = None
 
-class CustomStorage(FileSystemStorage):
-    """Пользовательское хранилище для изображений."""
-    date = datetime.now().strftime('%Y/%m/%d')
-    location = os.path.join(settings.MEDIA_ROOT, f"post/{date}/")
-    base_url = urljoin(settings.MEDIA_URL, f"post/{date}/")
\ No newline at end of file
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    Хранилище файлов с адресацией по содержимому (изображения CKEditor).
+
+    Имя файла - SHA-256 содержимого, разложенный по подкаталогам (ab/cd/abcd....jpg),
+    поэтому одинаковые файлы хранятся один раз, а все ссылки указывают на один файл.
+    Хэш считается при потоковой записи во временный файл, без чтения файла в память.
+    Файлы не удаляются при удалении ссылок на них: неиспользуемые файлы удаляет
+    команда gc_media.
+    """
+    directory = 'cas'
+    name_pattern = re.compile(r'[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}(?:\.[a-z0-9]{1,10})?')
+
+    def __init__(self, location=None, base_url=None, **kwargs):
+        # пути вычисляются при создании хранилища, а не при импорте модуля
+        super().__init__(
+            location=location or os.path.join(settings.MEDIA_ROOT, self.directory),
+            base_url=base_url or urljoin(settings.MEDIA_URL, f'{self.directory}/'),
+            **kwargs,
+        )
+
+    def get_available_name(self, name, max_length=None):
+        # имя определяется содержимым, одинаковые файлы должны получать одно имя
+        return name
+
+    def _save(self, name, content):
+        extension = os.path.splitext(name)[1].lower()
+        if not re.fullmatch(r'\.[a-z0-9]{1,10}', extension):
+            extension = ''
+        tmp_dir = os.path.join(self.location, 'tmp')
+        os.makedirs(tmp_dir, exist_ok=True)
+
+        digest = hashlib.sha256()
+        if hasattr(content, 'seek'):
+            content.seek(0)
+        with tempfile.NamedTemporaryFile(dir=tmp_dir, delete=False) as tmp:
+            try:
+                for chunk in content.chunks():
+                    if isinstance(chunk, str):
+                        chunk = chunk.encode()
+                    digest.update(chunk)
+                    tmp.write(chunk)
+            except BaseException:
+                tmp.close()
+                os.unlink(tmp.name)
+                raise
+
+        hexdigest = digest.hexdigest()
+        name = f'{hexdigest[:2]}/{hexdigest[2:4]}/{hexdigest}{extension}'
+        path = self.path(name)
+        if os.path.exists(path):
+            # такой файл уже сохранен - новая ссылка указывает на него; время изменения
+            # обновляем, чтобы gc_media не удалил файл до сохранения ссылки на него
+            os.unlink(tmp.name)
+            os.utime(path)
+            return name
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if self.file_permissions_mode is not None:
+            os.chmod(tmp.name, self.file_permissions_mode)
+        # переименование атомарно: одновременная загрузка того же файла не испортит его
+        os.replace(tmp.name, path)
+        return name
+
+    def names_in_html(self, html):
+        """
+        Возвращает имена файлов хранилища, на которые ссылается HTML.
+        """
+        prefix = re.escape(self.base_url)
+        return set(re.findall(f'{prefix}({self.name_pattern.pattern})', html or ''))
+
+    def iter_names(self):
+        """
+        Генератор имен всех файлов хранилища (без временных файлов).
+        """
+        for root, dirs, files in os.walk(self.location):
+            relative = os.path.relpath(root, self.location).replace(os.sep, '/')
+            for filename in files:
+                name = f'{relative}/{filename}'
+                if self.name_pattern.fullmatch(name):
+                    yield name
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """
+    Хранилище статики для collectstatic: имена файлов с хэшем содержимого
+    (как ManifestStaticFilesStorage), уменьшенные копии изображений в WebP/AVIF
+    и сжатые варианты .gz/.br текстовых файлов рядом с оригиналами.
+    Отдаются они middleware core.middleware.StaticFilesMiddleware.
+    """
+    compress_extensions = ('.css', '.js', '.svg', '.json', '.txt', '.html', '.xml', '.map', '.ttf', '.otf', '.eot')
+    image_extensions = ('.jpg', '.jpeg', '.png')
+
+    @staticmethod
+    def image_formats():
+        """
+        Возвращает форматы уменьшенных копий изображений, которые поддерживает Pillow.
+        """
+        return [fmt for fmt in ('avif', 'webp') if features.check(fmt)]
+
+    @classmethod
+    def variant_name(cls, name, width, fmt):
+        """
+        Имя уменьшенной копии изображения: img/photo.jpg -> img/photo.w960.webp.
+        """
+        return f'{os.path.splitext(name)[0]}.w{width}.{fmt}'
+
+    def create_image_variants(self, paths):
+        """
+        Создает уменьшенные копии изображений и добавляет их в список файлов,
+        чтобы они получили хэш в имени наравне с остальной статикой.
+        """
+        widths = getattr(settings, 'STATIC_IMAGE_WIDTHS', (480, 960, 1600))
+        quality = getattr(settings, 'STATIC_IMAGE_QUALITY', 75)
+        for name in list(paths):
+            if not name.lower().endswith(self.image_extensions):
+                continue
+            with self.open(name) as source:
+                image = Image.open(source)
+                image.load()
+            image = image.convert('RGBA' if image.mode in ('RGBA', 'LA', 'P') else 'RGB')
+            # копии не шире оригинала; если оригинал уже всех размеров, берется его ширина
+            sizes = sorted({min(width, image.width) for width in widths})
+            for width in sizes:
+                resized = image if width == image.width else image.resize(
+                    (width, round(image.height * width / image.width)), Image.LANCZOS,
+                )
+                for fmt in self.image_formats():
+                    output = io.BytesIO()
+                    resized.save(output, format=fmt.upper(), quality=quality)
+                    variant = self.variant_name(name, width, fmt)
+                    if self.exists(variant):
+                        self.delete(variant)
+                    self._save(variant, ContentFile(output.getvalue()))
+                    paths[variant] = (self, variant)
+
+    def compress(self, name):
+        """
+        Создает сжатые варианты файла, если они заметно меньше оригинала.
+        """
+        path = self.path(name)
+        with open(path, 'rb') as source:
+            data = source.read()
+        variants = [('.gz', gzip.compress(data, compresslevel=9, mtime=0))]
+        if brotli is not None:
+            variants.append(('.br', brotli.compress(data)))
+        for suffix, compressed in variants:
+            if len(compressed) < len(data) * 0.95:
+                with open(path + suffix, 'wb') as output:
+                    output.write(compressed)
+
+    def post_process(self, paths, dry_run=False, **options):
+        if not dry_run:
+            self.create_image_variants(paths)
+        yield from super().post_process(paths, dry_run, **options)
+        if dry_run:
+            return
+        for name in set(self.hashed_files.values()) | set(paths):
+            if name.lower().endswith(self.compress_extensions):
+                self.compress(name)
@@ -19,19 +19,47 @@ from django.urls import path, include
 from core.views import (
     LandingView,
     PublicationListView,
+    PublicationFeedView,
     ContactPageView,
     LessonScheduleView,
     download_file,
+    metrics_view,
+    publication_content,
+    publication_detail,
+    publication_downloads,
+    schedule_feed,
+    schedule_free_slots,
     )
 from django.conf import settings
 from django.conf.urls.static import static
 
+if settings.ASYNC_VIEWS:
+    # под ASGI страницы и скачивания обслуживаются асинхронными представлениями
+    from core.async_views import (  # noqa: F811
+        AsyncLandingView as LandingView,
+        AsyncPublicationListView as PublicationListView,
+        AsyncPublicationFeedView as PublicationFeedView,
+        AsyncContactPageView as ContactPageView,
+        AsyncLessonScheduleView as LessonScheduleView,
+        download_file,
+    )
+
 urlpatterns = [
     path('admin/', admin.site.urls,),
     path('', LandingView.as_view(), name='landing'),
     path('blog/', PublicationListView.as_view(), name='publication_list'),
+    path('blog/feed/', PublicationFeedView.as_view(), name='publication_feed'),
+    path('publications/downloads.json', publication_downloads, name='publication_downloads'),
+    path('publications/<int:pk>/', publication_detail, name='publication_detail'),
     path('publications/<int:pk>/download/', download_file, name='download_file'),
+    path('publications/<int:pk>/content/', publication_content, name='publication_content'),
     path('contacts/', ContactPageView.as_view(), name='contacts'),
     path('schedule/', LessonScheduleView.as_view(), name='lessons_schedule'),
+    path('schedule/<int:year>/<int:month>/', LessonScheduleView.as_view(), name='lessons_schedule_month'),
+    path('schedule/free-slots/', schedule_free_slots, name='schedule_free_slots'),
+    path('schedule/feed.ics', schedule_feed, {'fmt': 'ics'}, name='schedule_feed_ics'),
+    path('schedule/feed.json', schedule_feed, {'fmt': 'json'}, name='schedule_feed_json'),
+    path('metrics/', metrics_view, name='metrics'),
     path("ckeditor5/", include('django_ckeditor_5.urls'), name="ck_editor_5_upload_file"),
-] + static(settings.STATIC_URL, document_root=settings.STATIC_ROOT) + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+# статику в режиме DEBUG отдает runserver, в продакшене - core.middleware.StaticFilesMiddleware
@@ -51,4 +51,94 @@ document.addEventListener('DOMContentLoaded', function() {
             });
         });
     });
+
+    // Счетчики скачиваний: страница ленты берется из кэша, поэтому актуальные
+    // значения запрашиваются отдельно для карточек, еще не обновленных скриптом
+    const publicationList = document.getElementById('publication-list');
+    const refreshDownloadCounts = function() {
+        const counters = publicationList.querySelectorAll('.downloads-count:not([data-refreshed])');
+        if (!counters.length) return;
+        const ids = Array.from(counters, counter => counter.dataset.publicationId);
+        fetch(publicationList.dataset.downloadsUrl + '?ids=' + ids.join(','))
+            .then(response => response.ok ? response.json() : Promise.reject(response))
+            .then(data => {
+                counters.forEach(function(counter) {
+                    const count = data.counts[counter.dataset.publicationId];
+                    if (count !== undefined) counter.textContent = count;
+                    counter.dataset.refreshed = '1';
+                });
+            });
+    };
+    if (publicationList && publicationList.dataset.downloadsUrl) {
+        refreshDownloadCounts();
+    }
+
+    // Подгрузка следующей страницы ленты публикаций
+    const loadMore = document.getElementById('load-more');
+    if (loadMore && publicationList) {
+        let loading = false;
+        let observer = null;
+        const loadNextPage = function() {
+            const feedUrl = loadMore.dataset.feedUrl;
+            if (loading || !feedUrl) return;
+            loading = true;
+            fetch(feedUrl, {
+                headers: {
+                    'X-Requested-With': 'XMLHttpRequest',
+                }
+            })
+            .then(response => response.json())
+            .then(data => {
+                publicationList.insertAdjacentHTML('beforeend', data.html);
+                refreshDownloadCounts();
+                if (data.next_url) {
+                    loadMore.dataset.feedUrl = data.next_url;
+                    loadMore.href = '?' + data.next_url.split('?')[1];
+                } else {
+                    if (observer) observer.disconnect();
+                    loadMore.remove();
+                }
+            })
+            .finally(() => {
+                loading = false;
+            });
+        };
+        loadMore.addEventListener('click', function(e) {
+            e.preventDefault();
+            loadNextPage();
+        });
+        // Бесконечная прокрутка: грузим следующую страницу, когда кнопка появляется на экране
+        if ('IntersectionObserver' in window) {
+            observer = new IntersectionObserver(function(entries) {
+                if (entries.some(entry => entry.isIntersecting)) loadNextPage();
+            }, { rootMargin: '300px' });
+            observer.observe(loadMore);
+        }
+    }
+
+    // Полный текст публикации загружается вместо отрывка по клику на «Читать полностью».
+    // Обработчик на document, чтобы работал и для карточек, подгруженных при прокрутке.
+    document.addEventListener('click', function(e) {
+        const toggle = e.target.closest('.content-toggle');
+        if (!toggle) return;
+        e.preventDefault();
+        fetch(toggle.dataset.contentUrl)
+            .then(response => response.ok ? response.text() : Promise.reject(response))
+            .then(html => {
+                toggle.closest('.publication-text').innerHTML = html;
+            });
+    });
+
+    // Превью публикаций: полный документ загружается только по клику на миниатюру.
+    // Обработчик на document, чтобы работал и для карточек, подгруженных при прокрутке.
+    document.addEventListener('click', function(e) {
+        const toggle = e.target.closest('.preview-toggle');
+        if (!toggle) return;
+        e.preventDefault();
+        const iframe = document.createElement('iframe');
+        iframe.src = toggle.dataset.src;
+        iframe.width = '100%';
+        iframe.height = '500px';
+        toggle.replaceWith(iframe);
+    });
 });
\ No newline at end of file